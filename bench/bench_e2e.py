@@ -0,0 +1,130 @@
+"""
+Сквозной офлайн-бенчмарк: диспетчер из main.py на FakeSession и листах Sheets в памяти.
+N новичков параллельно проходят весь путь: /start → ФИО → предмет → роль → код →
+каталог → «Я прошёл тест» по каждому гайду → финальный тест.
+
+Печатает пропускную способность, p50/p99 по шагам, байты на диске
+и число «запросов» к Telegram и Google Sheets.
+
+    python bench/bench_e2e.py --trainees 2000 --concurrency 200
+    python bench/bench_e2e.py --trainees 1000 --tg-latency 0.05 --sheets-latency 0.3
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from collections import defaultdict
+
+from fakes import load_main, install_fake_sheets, message_update, callback_update
+
+
+def flow(main, uid: int):
+    """Шаги пути новичка: [(название шага, сырой апдейт)]."""
+    steps = [
+        ("/start", message_update(uid, "/start")),
+        ("fio", message_update(uid, f"Иванов Иван {uid}")),
+        ("subject:set", callback_update(uid, "subject:set:математика")),
+        ("role", callback_update(uid, "role:newbie")),
+        ("code", message_update(uid, main.NEWBIE_CODE)),
+        ("guides:menu", callback_update(uid, "guides:menu")),
+    ]
+    steps += [("testdone", callback_update(uid, f"testdone:{g['id']}")) for g in main.GUIDES["newbie"]]
+    steps.append(("newbie:final", callback_update(uid, "newbie:final")))
+    return steps
+
+
+def pct(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, n)) for n in files)
+    return total
+
+
+async def run(args, data_dir: str) -> int:
+    ws_summary, ws_log = install_fake_sheets(args.sheets_latency)
+    main = load_main(data_dir, latency=args.tg_latency)
+    main.STORE.window = args.flush_window
+    main.SUMMARY_SYNC.interval = args.summary_interval
+    if main.LEADER is not None:
+        await main.LEADER.tick()  # единственный экземпляр — лидер: сводку пишет только он
+    main.STORE.start()
+    main.LOG_SINK.start()
+    main.SUMMARY_SYNC.start()
+
+    latencies = defaultdict(list)
+    sem = asyncio.Semaphore(args.concurrency)
+    uids = [700000 + i for i in range(args.trainees)]
+
+    async def trainee(uid):
+        async with sem:
+            for name, update in flow(main, uid):
+                t0 = time.perf_counter()
+                await main.dp.feed_raw_update(main.bot, update)
+                latencies[name].append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(trainee(uid) for uid in uids))
+    elapsed = time.perf_counter() - t0
+
+    t1 = time.perf_counter()
+    await main.STORE.close()
+    await main.LOG_SINK.close()
+    await main.SUMMARY_SYNC.close()
+    if main.LEADER is not None:
+        await main.LEADER.close()
+    drain = time.perf_counter() - t1
+
+    # всё ли дошло до конца
+    errors = []
+    n_guides = len(main.GUIDES["newbie"])
+    for uid in uids:
+        u = main.USERS.get(str(uid))
+        if not u or u.get("role") != "newbie" or u.get("guide_index") != n_guides:
+            errors.append(uid)
+    summary_ids = {r[0] for r in ws_summary.rows[1:]}
+    missing_rows = sum(1 for uid in uids if str(uid) not in summary_ids)
+
+    updates = sum(len(v) for v in latencies.values())
+    session = main.bot.session
+    print(f"новичков: {args.trainees}, параллельно: {args.concurrency}, апдейтов: {updates}")
+    print(f"время: {elapsed:.2f}с ({updates / elapsed:,.0f} апдейтов/с, {args.trainees / elapsed:,.1f} новичков/с), "
+          f"дописывание при остановке {drain * 1000:.0f} мс")
+    print(f"{'шаг':>14} | {'p50, мс':>8} | {'p99, мс':>8} | {'max, мс':>8}")
+    for name, values in latencies.items():
+        print(f"{name:>14} | {pct(values, 0.5) * 1000:8.2f} | {pct(values, 0.99) * 1000:8.2f} | {max(values) * 1000:8.2f}")
+    all_values = [v for values in latencies.values() for v in values]
+    print(f"{'все':>14} | {pct(all_values, 0.5) * 1000:8.2f} | {pct(all_values, 0.99) * 1000:8.2f} | {max(all_values) * 1000:8.2f}")
+    print(f"диск: записано {main.STORE.bytes_written / 1e6:.2f} МБ за {main.STORE.flushes} сбросов, "
+          f"в каталоге данных {dir_size(data_dir) / 1e6:.2f} МБ")
+    print(f"Telegram API: {sum(session.calls.values())} вызовов {dict(session.calls)}")
+    print(f"Sheets API: сводка {dict(ws_summary.calls)}, лог {dict(ws_log.calls)}; "
+          f"строк в логе {len(ws_log.rows) - 1}, в сводке {len(ws_summary.rows) - 1}")
+    if errors or missing_rows:
+        print(f"❌ не дошли до конца: {len(errors)}, нет строки в сводке: {missing_rows}")
+        return 1
+    print("✅ все новички прошли путь, сводка полная")
+    return 0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--trainees", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=200, help="новичков, проходящих путь одновременно")
+    ap.add_argument("--tg-latency", type=float, default=0.0, help="задержка Bot API, 0..N сек")
+    ap.add_argument("--sheets-latency", type=float, default=0.0, help="задержка запроса к Sheets, сек")
+    ap.add_argument("--flush-window", type=float, default=0.5)
+    ap.add_argument("--summary-interval", type=float, default=1.0)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as d:
+        sys.exit(asyncio.run(run(args, d)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Бенчмарк холодного старта JournalBackend: время load() в зависимости от длины
+истории изменений (число записей в журнал) при фиксированном числе пользователей.
+Для сравнения — тот же журнал без сворачивания (вся история в одном файле).
+
+    python bench/bench_startup.py --users 3000 --events 10000 100000 300000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import JournalBackend
+from bench_store import make_users
+
+BATCH = 50  # изменений в одном сбросе write-behind
+
+
+def build_history(data_dir: str, users: int, events: int, compact_bytes: int):
+    backend = JournalBackend(data_dir, compact_bytes=compact_bytes, fsync=False)
+    data = backend.load()
+    data.update(make_users(users))
+    backend.write(backend.snapshot(data, set(data)))
+    uids = list(data)
+    rnd = random.Random(1)
+    for start in range(0, events, BATCH):
+        dirty = set()
+        for _ in range(min(BATCH, events - start)):
+            uid = rnd.choice(uids)
+            data[uid]["guide_index"] += 1
+            dirty.add(uid)
+        backend.write(backend.snapshot(data, dirty))
+    backend.close()
+    return data
+
+
+def time_load(data_dir: str, compact_bytes: int):
+    t0 = time.perf_counter()
+    backend = JournalBackend(data_dir, compact_bytes=compact_bytes, fsync=False)
+    data = backend.load()
+    elapsed = time.perf_counter() - t0
+    backend.close()
+    return elapsed, data
+
+
+def dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, n)) for n in os.listdir(path))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=3000)
+    ap.add_argument("--events", type=int, nargs="+", default=[10_000, 100_000, 300_000])
+    ap.add_argument("--compact-bytes", type=int, default=4 * 1024 * 1024)
+    args = ap.parse_args()
+
+    print(f"{'изменений':>10} | {'снапшот+журнал':>16} | {'только журнал':>16}")
+    for events in args.events:
+        row = []
+        for compact_bytes in (args.compact_bytes, 1 << 62):
+            with tempfile.TemporaryDirectory() as d:
+                expected = build_history(d, args.users, events, compact_bytes)
+                elapsed, data = time_load(d, 1 << 62)
+                assert data == expected
+                row.append(f"{elapsed * 1000:8.1f} мс {dir_size(d) / 1e6:5.1f}МБ")
+        print(f"{events:>10} | {row[0]:>16} | {row[1]:>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Бенчмарк записи пользователей: клики/сек при полной перезаписи users.json
+на каждое событие (старый save_users) и при отложенной записи WriteBehindStore.
+
+    python bench/bench_store.py --users 3000 --clicks 2000
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import WriteBehindStore, JsonBackend
+
+
+def make_users(n: int) -> dict:
+    users = {}
+    for i in range(n):
+        users[str(100000 + i)] = {
+            "fio": f"Иванов Иван {i}",
+            "role": "newbie" if i % 3 else "letnik",
+            "subject": "математика",
+            "guide_index": i % 4,
+            "last_guide_sent_at": None,
+            "progress": {
+                "guide1": {"read": True, "task_done": True, "test_done": True},
+                "guide2": {"read": True, "task_done": False, "test_done": False},
+            },
+            "created_at": "2025-08-20T10:00:00+03:00",
+            "finished_at": "",
+            "status": "Новичок (код подтвержден)",
+            "awaiting_fio": False,
+            "awaiting_subject": False,
+            "awaiting_code": False,
+        }
+    return users
+
+
+def bench_full_rewrite(path: str, users: dict, clicks: int) -> float:
+    """Старое поведение: json.dump(indent=2) всего словаря на каждый клик."""
+    uids = list(users)
+    t0 = time.perf_counter()
+    for i in range(clicks):
+        users[uids[i % len(uids)]]["guide_index"] += 1
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(users, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+    return time.perf_counter() - t0
+
+
+async def bench_write_behind(path: str, users: dict, clicks: int, window: float):
+    store = WriteBehindStore(JsonBackend(path), users, window=window)
+    store.start()
+    uids = list(users)
+    t0 = time.perf_counter()
+    for i in range(clicks):
+        uid = uids[i % len(uids)]
+        users[uid]["guide_index"] += 1
+        store.mark_dirty(uid)
+        if i % 50 == 0:
+            await asyncio.sleep(0)  # отдаём управление, как между апдейтами
+    elapsed = time.perf_counter() - t0
+    await store.close()
+    return elapsed, store
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=3000)
+    ap.add_argument("--clicks", type=int, default=2000)
+    ap.add_argument("--window", type=float, default=0.05)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "users.json")
+
+        old = bench_full_rewrite(path, make_users(args.users), args.clicks)
+        print(f"save_users (полная перезапись): {args.clicks / old:10.0f} кликов/сек, "
+              f"{old * 1000 / args.clicks:.2f} мс/клик")
+
+        new, store = asyncio.run(bench_write_behind(path, make_users(args.users), args.clicks, args.window))
+        print(f"WriteBehindStore (окно {args.window}s): {args.clicks / new:10.0f} кликов/сек, "
+              f"{new * 1000 / args.clicks:.4f} мс/клик, записей на диск: {store.flushes}, "
+              f"байт: {store.bytes_written}")
+
+        with open(path, encoding="utf-8") as f:
+            assert len(json.load(f)) == args.users
+
+
+if __name__ == "__main__":
+    main()
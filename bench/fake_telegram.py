@@ -0,0 +1,330 @@
+"""
+Локальная замена Telegram Bot API для нагрузочных прогонов настоящего транспорта
+(dp.start_polling или вебхук на aiohttp-сервере бота) без сети.
+
+Новички проходят путь /start → ФИО → предмет → роль → код → каталог → тесты → финал.
+Следующий шаг новичок делает только после ответа бота на предыдущий (замкнутый цикл),
+темп выдачи апдейтов ограничен --rate. Если бот вызвал setWebhook, апдейты
+уходят POST-ом на его адрес, иначе раздаются через getUpdates.
+
+Ответы на sendMessage / answerCallbackQuery можно портить: --p429 доля ответов
+429 с retry_after, --blocked доля новичков, которые после финала блокируют бота (403).
+Каждый вызов бота записывается (метод, статус, задержка от апдейта до ответа);
+сводка — в конце прогона и по GET /stats, полный журнал — в --log (JSONL).
+
+    python bench/fake_telegram.py --users 2000 --rate 200 --port 8081
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_TOKEN=123:TEST python main.py
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter, deque
+
+from aiohttp import web, ClientSession, ClientTimeout
+
+BOT_USER = {"id": 100, "is_bot": True, "first_name": "kurator-bot (fake)", "username": "fake_kurator_bot"}
+
+
+def pct(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+class Trainee:
+    __slots__ = ("uid", "step", "sent_at", "pending", "blocked", "update_id")
+
+    def __init__(self, uid: int):
+        self.uid = uid
+        self.step = 0
+        self.sent_at = None     # когда отдан последний апдейт (ждём ответа)
+        self.pending = None     # id callback_query последнего апдейта
+        self.blocked = False
+        self.update_id = None   # последний выданный апдейт
+
+
+class FakeTelegram:
+    def __init__(self, args):
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.steps = (["/start", "fio", "subject:set:математика", "role:newbie", args.code, "guides:menu"]
+                      + [f"testdone:{g}" for g in args.guides] + ["newbie:final"])
+        self.trainees = {}
+        self.ready = deque()
+        for i in range(args.users):
+            t = Trainee(args.first_uid + i)
+            self.trainees[t.uid] = t
+            self.ready.append(t)
+        self.by_callback = {}
+        self.update_id = 0
+        self.message_id = 0
+        self.queue = []                      # апдейты для getUpdates
+        self.queued = asyncio.Event()
+        self.webhook = None                  # (url, secret) после setWebhook
+        self.finished = 0
+        self.started = None
+        self.done = asyncio.Event()
+        self.connected = asyncio.Event()     # бот пришёл за апдейтами (getUpdates или setWebhook)
+        # статистика
+        self.calls = Counter()               # (метод, статус) -> число
+        self.reply_latency = []              # сек от выдачи апдейта до первого ответа бота
+        self.sends_per_second = Counter()    # секунда прогона -> sendMessage
+        self.updates_served = 0
+        self.no_reply = 0                    # апдейтов, на которые бот не ответил за --reply-timeout
+        self.webhook_errors = 0
+        self.log = open(args.log, "w", encoding="utf-8") if args.log else None
+
+    # ---- синтетические апдейты ----
+    def _build(self, t: Trainee) -> dict:
+        self.update_id += 1
+        step = self.steps[t.step]
+        user = {"id": t.uid, "is_bot": False, "first_name": "Нагрузка", "language_code": "ru"}
+        chat = {"id": t.uid, "type": "private"}
+        now = int(time.time())
+        if step.startswith("/") or ":" not in step:
+            text = f"Нагрузка Тест {t.uid}" if step == "fio" else step
+            msg = {"message_id": self.update_id, "date": now, "chat": chat, "from": user, "text": text}
+            if text.startswith("/"):
+                msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+            t.pending = None
+            return {"update_id": self.update_id, "message": msg}
+        cq_id = str(self.update_id)
+        t.pending = cq_id
+        self.by_callback[cq_id] = t
+        return {"update_id": self.update_id, "callback_query": {
+            "id": cq_id, "from": user, "chat_instance": "fake", "data": step,
+            "message": {"message_id": self.update_id, "date": now, "chat": chat, "from": BOT_USER, "text": "…"},
+        }}
+
+    async def produce(self):
+        """Выдаёт апдейты готовых новичков не чаще rate в секунду."""
+        await self.connected.wait()
+        self.started = time.monotonic()
+        interval = 1.0 / self.args.rate
+        next_at = time.monotonic()
+        while True:
+            if not self.ready:
+                await asyncio.sleep(0.005)
+                continue
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            next_at = max(next_at + interval, time.monotonic() - 1.0)  # без «залпа» после простоя
+            t = self.ready.popleft()
+            update = self._build(t)
+            t.sent_at = time.monotonic()
+            t.update_id = update["update_id"]
+            asyncio.get_running_loop().call_later(self.args.reply_timeout, self._timed_out, t, t.update_id)
+            self.updates_served += 1
+            if self.webhook:
+                asyncio.create_task(self._push(update))
+            else:
+                self.queue.append(update)
+                self.queued.set()
+
+    async def _push(self, update):
+        url, secret = self.webhook
+        headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+        async with self.push_slots:
+            try:
+                async with self.http.post(url, json=update, headers=headers) as resp:
+                    if resp.status != 200:
+                        self.webhook_errors += 1
+            except Exception:
+                self.webhook_errors += 1
+
+    def _replied(self, t: Trainee, ok: bool, record: bool = True):
+        """Первый ответ бота на апдейт новичка: считаем задержку и пускаем его на следующий шаг."""
+        if t is None or t.sent_at is None:
+            return
+        if record:
+            self.reply_latency.append(time.monotonic() - t.sent_at)
+        t.sent_at = None
+        if t.pending:
+            self.by_callback.pop(t.pending, None)
+            t.pending = None
+        if ok:
+            t.step += 1
+        if t.step >= len(self.steps):
+            self.finished += 1
+            t.blocked = self.rnd.random() < self.args.blocked
+            if self.finished == len(self.trainees):
+                self.done.set()
+            return
+        self.ready.append(t)  # при ошибке (429) новичок жмёт ту же кнопку ещё раз
+
+    def _timed_out(self, t: Trainee, update_id: int):
+        """Бот промолчал (например, повторный ввод ФИО после 429) — новичок идёт дальше."""
+        if t.sent_at is None or t.update_id != update_id:
+            return
+        self.no_reply += 1
+        self._replied(t, True, record=False)
+
+    # ---- Bot API ----
+    def _error(self, code: int, description: str, retry_after: int = None):
+        body = {"ok": False, "error_code": code, "description": description}
+        if retry_after is not None:
+            body["parameters"] = {"retry_after": retry_after}
+        return code, body
+
+    def _fault(self, t):
+        if t is not None and t.blocked:
+            return self._error(403, "Forbidden: bot was blocked by the user")
+        if self.rnd.random() < self.args.p429:
+            return self._error(429, f"Too Many Requests: retry after {self.args.retry_after}",
+                               retry_after=self.args.retry_after)
+        return None
+
+    async def call(self, method: str, params: dict):
+        if method == "getme":
+            return 200, {"ok": True, "result": BOT_USER}
+        if method == "getupdates":
+            self.connected.set()
+            return 200, {"ok": True, "result": await self._get_updates(params)}
+        if method == "setwebhook":
+            self.webhook = (params.get("url"), params.get("secret_token"))
+            self.connected.set()
+            for update in self.queue:
+                asyncio.create_task(self._push(update))
+            self.queue.clear()
+            return 200, {"ok": True, "result": True}
+        if method == "deletewebhook":
+            self.webhook = None
+            return 200, {"ok": True, "result": True}
+        if method == "getwebhookinfo":
+            url = self.webhook[0] if self.webhook else ""
+            return 200, {"ok": True, "result": {"url": url, "has_custom_certificate": False,
+                                                "pending_update_count": len(self.queue)}}
+        if method == "sendmessage":
+            chat_id = int(params.get("chat_id", 0))
+            t = self.trainees.get(chat_id)
+            self.sends_per_second[int(time.monotonic() - (self.started or time.monotonic()))] += 1
+            fault = self._fault(t)
+            self._replied(t, fault is None or fault[0] == 403)
+            if fault:
+                return fault
+            self.message_id += 1
+            return 200, {"ok": True, "result": {
+                "message_id": self.message_id, "date": int(time.time()), "from": BOT_USER,
+                "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", ""),
+            }}
+        if method == "answercallbackquery":
+            t = self.by_callback.get(params.get("callback_query_id"))
+            fault = self._fault(t)
+            self._replied(t, fault is None)
+            return fault or (200, {"ok": True, "result": True})
+        # прочие методы (editMessage*, sendChatAction…) просто принимаем
+        return 200, {"ok": True, "result": True}
+
+    async def _get_updates(self, params: dict):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        if offset:
+            self.queue = [u for u in self.queue if u["update_id"] >= offset]
+        if not self.queue and timeout:
+            self.queued.clear()
+            try:
+                await asyncio.wait_for(self.queued.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.queue[:limit]
+
+    async def handle(self, request):
+        method = request.match_info["method"].lower()
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        params.update(request.query)
+        t0 = time.monotonic()
+        if self.args.latency:
+            await asyncio.sleep(self.rnd.uniform(0, self.args.latency))
+        status, body = await self.call(method, params)
+        self.calls[(method, status)] += 1
+        if self.log and method != "getupdates":
+            self.log.write(json.dumps({"t": round(t0 - (self.started or t0), 4), "method": method,
+                                       "status": status, "chat_id": params.get("chat_id"),
+                                       "ms": round((time.monotonic() - t0) * 1000, 2)}) + "\n")
+        return web.json_response(body, status=status)
+
+    # ---- отчёт ----
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        sends = list(self.sends_per_second.values())
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "trainees": len(self.trainees),
+            "finished": self.finished,
+            "updates_served": self.updates_served,
+            "updates_per_s": round(self.updates_served / elapsed, 1) if elapsed else 0.0,
+            "mode": "webhook" if self.webhook else "polling",
+            "webhook_errors": self.webhook_errors,
+            "no_reply": self.no_reply,
+            "reply_ms": {
+                "p50": round(pct(self.reply_latency, 0.5) * 1000, 1),
+                "p99": round(pct(self.reply_latency, 0.99) * 1000, 1),
+                "max": round(max(self.reply_latency, default=0) * 1000, 1),
+            },
+            "send_message_per_s": {"max": max(sends, default=0),
+                                   "avg": round(sum(sends) / len(sends), 1) if sends else 0.0},
+            "calls": {f"{m}:{s}": n for (m, s), n in sorted(self.calls.items())},
+        }
+
+    async def handle_stats(self, request):
+        return web.json_response(self.stats())
+
+    def app(self):
+        app = web.Application()
+        app.add_routes([
+            web.get("/stats", self.handle_stats),
+            web.route("*", "/bot{token}/{method}", self.handle),
+        ])
+        return app
+
+    async def run(self):
+        self.http = ClientSession(timeout=ClientTimeout(total=30))
+        self.push_slots = asyncio.Semaphore(40)  # как max_connections у Telegram
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        await web.TCPSite(runner, self.args.host, self.args.port).start()
+        print(f"🧪 Fake Bot API на http://{self.args.host}:{self.args.port}, новичков: {len(self.trainees)}")
+        producer = asyncio.create_task(self.produce())
+        try:
+            await asyncio.wait_for(self.done.wait(), self.args.duration or None)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            producer.cancel()
+            print(json.dumps(self.stats(), ensure_ascii=False, indent=2))
+            if self.log:
+                self.log.close()
+            await self.http.close()
+            await runner.cleanup()
+        return 0 if self.finished == len(self.trainees) else 1
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--first-uid", type=int, default=900000)
+    ap.add_argument("--rate", type=float, default=200, help="апдейтов в секунду, не больше")
+    ap.add_argument("--code", default="newbie2025", help="NEWBIE_CODE бота")
+    ap.add_argument("--guides", nargs="+", default=["guide1", "guide2", "guide3", "guide4"])
+    ap.add_argument("--latency", type=float, default=0.0, help="задержка ответа API, 0..N сек")
+    ap.add_argument("--p429", type=float, default=0.0, help="доля ответов 429")
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--blocked", type=float, default=0.0, help="доля новичков, блокирующих бота после финала")
+    ap.add_argument("--reply-timeout", type=float, default=10.0, help="сек ожидания ответа бота на апдейт")
+    ap.add_argument("--duration", type=float, default=0, help="сек до остановки (0 — пока все не пройдут путь)")
+    ap.add_argument("--log", default="", help="JSONL-журнал всех вызовов")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+    raise SystemExit(asyncio.run(FakeTelegram(args).run()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Заглушки для офлайн-прогонов main.py: сессия бота без сети, листы Google Sheets
+в памяти и сырые апдейты Telegram.
+"""
+import os
+import re
+import sys
+import time
+import random
+import asyncio
+import itertools
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Message, Chat
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeSession(BaseSession):
+    """
+    Сессия бота, которая никуда не ходит: считает вызовы методов API,
+    запоминает отправленные тексты по чатам и отвечает успешно.
+    latency — случайная задержка каждого вызова (0..latency сек).
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = Counter()
+        self.sent = defaultdict(list)  # chat_id -> тексты в порядке доставки
+        self._ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(random.uniform(0, self.latency))
+        if method.__returning__ is Message:
+            chat_id = getattr(method, "chat_id", 0)
+            text = getattr(method, "text", None)
+            self.sent[chat_id].append(text)
+            return Message(
+                message_id=next(self._ids),
+                date=datetime.now(),
+                chat=Chat(id=chat_id, type="private"),
+                text=text,
+            )
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        if False:
+            yield b""
+
+    async def close(self):
+        pass
+
+
+class FakeWorksheet:
+    """
+    Лист Google Sheets в памяти: те методы gspread, которые вызывает бот.
+    calls — число «запросов к API» по методу, latency — задержка каждого запроса (сек, в потоке).
+    """
+
+    def __init__(self, title: str = "Лист1", header=None, latency: float = 0.0):
+        self.title = title
+        self.latency = latency
+        self.rows = [list(header)] if header else []
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def _call(self, method: str):
+        self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _append(self, rows):
+        with self._lock:
+            first = len(self.rows) + 1
+            self.rows.extend(list(r) for r in rows)
+            last = len(self.rows)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{first}:Z{last}"}}
+
+    def append_row(self, values, **kwargs):
+        self._call("append_row")
+        return self._append([values])
+
+    def append_rows(self, values, **kwargs):
+        self._call("append_rows")
+        return self._append(values)
+
+    def batch_update(self, data, **kwargs):
+        self._call("batch_update")
+        with self._lock:
+            for item in data:
+                row = int(re.search(r"\d+", item["range"]).group())
+                self.rows[row - 1] = list(item["values"][0])
+
+    def col_values(self, col: int):
+        self._call("col_values")
+        with self._lock:
+            return [r[col - 1] if len(r) >= col else "" for r in self.rows]
+
+
+def install_fake_sheets(latency: float = 0.0):
+    """Подменяет WS_SUMMARY и WS_LOG листами в памяти (до load_main или после — без разницы)."""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import gsheets
+    gsheets.SHEETS.use(
+        FakeWorksheet("Лист1", header=["TG_ID"], latency=latency),
+        FakeWorksheet("Лог", header=["ts", "tg_id", "fio", "role", "subject", "event", "details"], latency=latency),
+    )
+    gsheets.LOG_SINK.archiver = None  # у листов в памяти нет книги — ротировать «Лог» некуда
+    return gsheets.WS_SUMMARY, gsheets.WS_LOG
+
+
+def load_main(data_dir: str, latency: float = 0.0, **env):
+    """Импортирует main.py с данными в data_dir и ботом на FakeSession."""
+    os.environ.setdefault("BOT_TOKEN", "123456:FAKE-TOKEN-FOR-BENCH")
+    os.environ["DATA_DIR"] = data_dir
+    for k, v in env.items():
+        os.environ[k] = str(v)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import main
+    session = FakeSession(latency)
+    session.middleware = main.bot.session.middleware  # таймеры запросов к Bot API
+    main.bot.session = session
+    return main
+
+
+_update_ids = itertools.count(1)
+
+
+def _user(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": "Тест", "language_code": "ru"}
+
+
+def message_update(uid: int, text: str) -> dict:
+    n = next(_update_ids)
+    return {
+        "update_id": n,
+        "message": {
+            "message_id": n,
+            "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"},
+            "from": _user(uid),
+            "text": text,
+        },
+    }
+
+
+def callback_update(uid: int, data: str) -> dict:
+    n = next(_update_ids)
+    return {
+        "update_id": n,
+        "callback_query": {
+            "id": str(n),
+            "from": _user(uid),
+            "chat_instance": "bench",
+            "data": data,
+            "message": {
+                "message_id": n,
+                "date": int(time.time()),
+                "chat": {"id": uid, "type": "private"},
+                "text": "…",
+            },
+        },
+    }
@@ -0,0 +1,115 @@
+"""
+Симуляция окон доставки: ожидаемая кривая отправок рассылки (сообщений в минуту)
+по плану DeliveryPlanner — без Telegram и без ожидания. Сравнивает с тем, как было
+(все в одну минуту), и учитывает общий лимит BROADCAST_RATE.
+
+    python bench/sim_delivery.py --users 5000 --window 30
+    python bench/sim_delivery.py --users 5000 --window 30 --tz "0:60,2:20,4:15,7:5" --max-ahead 7
+    python bench/sim_delivery.py --users 5000 --late 12            # рестарт через 12 мин после GUIDE_HOUR
+    python bench/sim_delivery.py --cohorts '{"математика": {"shift": 30}}' --subjects математика,физика
+    python bench/sim_delivery.py --data data --job guide           # по настоящим пользователям из DATA_DIR
+"""
+import os
+import sys
+import json
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from delivery import DeliveryPlanner, DELIVERY_MAX_TZ_AHEAD, nominal, rate_curve  # noqa: E402
+from broadcast import BROADCAST_RATE  # noqa: E402
+
+MSK = timezone(timedelta(hours=3))
+
+
+def synthetic_users(n: int, tz_spec: str, subjects):
+    """tz_spec "0:60,2:20,4:20" — доля пользователей (в процентах) по смещению от МСК."""
+    weights = [(int(k), float(v)) for k, v in (part.split(":") for part in tz_spec.split(","))]
+    offsets, probs = zip(*weights)
+    rnd = random.Random(1)
+    return {
+        str(700000 + i): {"role": "newbie", "subject": rnd.choice(subjects),
+                          "tz_offset": rnd.choices(offsets, probs)[0]}
+        for i in range(n)
+    }
+
+
+def load_users(data_dir: str):
+    os.environ["DATA_DIR"] = data_dir
+    from storage import make_backend
+    backend = make_backend(data_dir)
+    try:
+        return {uid: u for uid, u in backend.load().items() if u.get("role") == "newbie"}
+    finally:
+        backend.close()
+
+
+def with_rate_limit(curve, rate: float):
+    """Тот же план, но не больше rate×60 отправок в минуту: излишек переходит в следующие минуты."""
+    out, backlog = [], 0
+    i = 0
+    while i < len(curve) or backlog:
+        start = curve[i][0] if i < len(curve) else out[-1][0] + timedelta(minutes=1)
+        backlog += curve[i][1] if i < len(curve) else 0
+        sent = min(backlog, int(rate * 60))
+        backlog -= sent
+        out.append((start, sent))
+        i += 1
+    return out
+
+
+def print_curve(curve, width: int = 60):
+    peak = max((n for _, n in curve), default=0) or 1
+    for start, n in curve:
+        bar = "█" * round(n / peak * width)
+        print(f"{start:%H:%M} | {n:6d} | {bar}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=5000)
+    ap.add_argument("--data", help="каталог данных бота вместо синтетических пользователей")
+    ap.add_argument("--job", default="guide", help="имя рассылки (от него зависят смещения)")
+    ap.add_argument("--hour", type=int, default=8, help="плановый час рассылки по МСК")
+    ap.add_argument("--window", type=float, default=30, help="DELIVERY_WINDOW_MIN")
+    ap.add_argument("--catchup", type=float, default=20, help="DELIVERY_CATCHUP_MIN")
+    ap.add_argument("--cohorts", default="{}", help="DELIVERY_COHORTS (JSON)")
+    ap.add_argument("--subjects", default="математика,информатика,физика")
+    ap.add_argument("--tz", default="0:100", help="распределение tz_offset, например 0:60,2:20,4:20")
+    ap.add_argument("--max-ahead", type=int, default=DELIVERY_MAX_TZ_AHEAD, help="DELIVERY_MAX_TZ_AHEAD")
+    ap.add_argument("--late", type=float, default=0, help="запуск через столько минут после планового (рестарт)")
+    ap.add_argument("--rate", type=float, default=BROADCAST_RATE, help="BROADCAST_RATE, сообщений/сек")
+    ap.add_argument("--bucket", type=int, default=1, help="минут в одной строке кривой")
+    args = ap.parse_args()
+
+    users = load_users(args.data) if args.data else synthetic_users(args.users, args.tz, args.subjects.split(","))
+    tz = args.job == "guide"
+    lead = min(args.max_ahead, args.hour) if tz else 0
+    planner = DeliveryPlanner(window=args.window, catchup=args.catchup, cohorts=json.loads(args.cohorts),
+                              tz=tz, max_ahead=lead)
+
+    day = datetime(2026, 1, 15, tzinfo=MSK)
+    fire = day.replace(hour=args.hour) - timedelta(hours=lead) + timedelta(minutes=args.late)
+    base = nominal(fire, args.hour, lead_hours=lead)
+    at = planner.plan(users, list(users), base, fire, args.job)
+
+    planned = rate_curve(at, fire, args.bucket)
+    limited = with_rate_limit(rate_curve(at, fire, 1), args.rate)
+    print(f"рассылка {args.job}: {len(at)} получателей, запуск {fire:%H:%M} МСК (плановое {base:%H:%M}), "
+          f"окно {args.window:g} мин, догоняние {args.catchup:g} мин")
+    print_curve(planned)
+    peak_planned = max((n for _, n in rate_curve(at, fire, 1)), default=0)
+    last = max(at.values()) if at else fire
+    print(f"пик по плану: {peak_planned}/мин ({peak_planned / 60:.1f}/с); без окна было бы {len(at)} в одну минуту "
+          f"(≈{len(at) / max(args.rate, 1e-9) / 60:.1f} мин очереди при {args.rate:g}/с)")
+    peak_limited = max((n for _, n in limited), default=0)
+    print(f"с лимитом {args.rate:g}/с: пик {peak_limited}/мин, последняя отправка ~{limited[-1][0]:%H:%M} "
+          f"(по плану {last:%H:%M})" if limited else "получателей нет")
+
+
+if __name__ == "__main__":
+    main()
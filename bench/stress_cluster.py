@@ -0,0 +1,167 @@
+"""
+Стресс-проверка нескольких экземпляров на общем каталоге данных.
+N процессов с SqliteBackend на одной users.db, выбором лидера и
+замками пользователей через cluster.db. Каждый процесс параллельно
+увеличивает счётчик taps у случайных пользователей (как апдейты, пришедшие
+на разные экземпляры); лидер раз в --tick секунд пишет «рассылку» в ticks.log.
+Посреди прогона текущий лидер убивается SIGKILL.
+
+Проверяем:
+  * ни одно увеличение не потеряно (сумма taps в базе = числу выполненных);
+  * «рассылку» в каждый момент делает один экземпляр;
+  * после смерти лидера новый начинает рассылку не позже чем через ~1.33×TTL + tick.
+
+    python bench/stress_cluster.py --instances 3 --users 50 --seconds 20
+"""
+import os
+import sys
+import time
+import random
+import signal
+import asyncio
+import argparse
+import tempfile
+import multiprocessing as mp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def worker(i: int, data_dir: str, args, done_path: str):
+    from storage import SqliteBackend, WriteBehindStore
+    from locks import KeyedLocks
+    from cluster import LeaseTable, LeaderElection, StoreSync, ClusterUserLocks
+
+    async def run():
+        name = f"w{i}"
+        backend = SqliteBackend(os.path.join(data_dir, "users.db"))
+        store = WriteBehindStore(backend, backend.load(), window=0.5)
+        leases = LeaseTable(os.path.join(data_dir, "cluster.db"))
+        leader = LeaderElection(leases, instance=name, ttl=args.ttl)
+        local = KeyedLocks()
+        sync = StoreSync(store, busy=lambda uid: int(uid) in local, interval=0.2)
+        locks = ClusterUserLocks(local, leases, sync, instance=name, ttl=args.user_ttl)
+
+        async def job():
+            while True:
+                await asyncio.sleep(args.tick)
+                with open(os.path.join(data_dir, "ticks.log"), "a") as f:
+                    f.write(f"{time.time():.3f} {name}\n")
+
+        leader.while_leader(job)
+        leader.start()
+        sync.start()
+        store.start()
+
+        done = open(done_path, "a", buffering=1)
+        deadline = time.monotonic() + args.seconds
+
+        async def tapper():
+            while time.monotonic() < deadline:
+                uid = random.randint(1, args.users)
+                async with locks.lock(uid):
+                    u = store.data.setdefault(str(uid), {"role": "newbie"})
+                    await asyncio.sleep(random.random() * 0.005)  # «хендлер» ходит в сеть
+                    u["taps"] = u.get("taps", 0) + 1
+                    store.mark_dirty(uid)
+                done.write("1\n")
+
+        await asyncio.gather(*(tapper() for _ in range(args.concurrency)))
+        await sync.close()
+        await leader.close()
+        await store.close()
+        leases.close()
+
+    asyncio.run(run())
+
+
+def leader_of(data_dir: str):
+    from cluster import LeaseTable
+    leases = LeaseTable(os.path.join(data_dir, "cluster.db"))
+    try:
+        holder = leases.holder("leader")
+    finally:
+        leases.close()
+    return holder[0] if holder and holder[1] > 0 else None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--instances", type=int, default=3)
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--concurrency", type=int, default=8, help="параллельных «апдейтов» в процессе")
+    ap.add_argument("--seconds", type=float, default=20)
+    ap.add_argument("--ttl", type=float, default=3, help="LEADER_LEASE_TTL")
+    ap.add_argument("--user-ttl", type=float, default=2, help="USER_LEASE_TTL")
+    ap.add_argument("--tick", type=float, default=0.5, help="интервал «рассылки» лидера")
+    ap.add_argument("--no-kill", action="store_true")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        from storage import SqliteBackend
+        SqliteBackend(os.path.join(d, "users.db")).close()  # схема до старта процессов
+        ctx = mp.get_context("spawn")
+        procs = {}
+        for i in range(args.instances):
+            p = ctx.Process(target=worker, args=(i, d, args, os.path.join(d, f"done.w{i}")))
+            p.start()
+            procs[f"w{i}"] = p
+
+        killed, killed_at = None, None
+        if not args.no_kill:
+            time.sleep(args.seconds / 3)
+            killed = leader_of(d)
+            if killed:
+                os.kill(procs[killed].pid, signal.SIGKILL)
+                killed_at = time.time()
+                print(f"💀 убит лидер {killed}")
+        for p in procs.values():
+            p.join()
+
+        def count(path):
+            try:
+                with open(path) as f:
+                    return sum(1 for _ in f)
+            except FileNotFoundError:
+                return 0
+
+        reported = {name: count(os.path.join(d, f"done.{name}")) for name in procs}
+        backend = SqliteBackend(os.path.join(d, "users.db"))
+        taps = sum(u.get("taps", 0) for u in backend.load().values())
+        backend.close()
+
+        with open(os.path.join(d, "ticks.log")) as f:
+            ticks = sorted((float(ts), who) for ts, who in (line.split() for line in f))
+        # смены «рассыльщика»: без убийства — ни одной, с убийством — одна
+        switches = [(ts, prev, who) for (_, prev), (ts, who) in zip(ticks, ticks[1:]) if prev != who]
+
+        total = sum(reported.values())
+        print(f"экземпляров: {args.instances}, апдейтов выполнено: {total} {reported}, taps в базе: {taps}")
+        print(f"«рассылок»: {len(ticks)}, смен лидера: {[(prev, who) for _, prev, who in switches]}")
+        ok = True
+        # у убитого процесса последнее увеличение могло записаться, но не попасть в done-файл
+        slack = args.concurrency if killed else 0
+        if not total <= taps <= total + slack:
+            print("❌ потеряны или задвоены увеличения")
+            ok = False
+        if len(switches) > (1 if killed else 0):
+            print("❌ рассылку вели несколько экземпляров попеременно")
+            ok = False
+        if killed:
+            after = [ts for ts, who in ticks if ts > killed_at and who != killed]
+            if not after:
+                print("❌ после смерти лидера рассылка не возобновилась")
+                ok = False
+            else:
+                gap = after[0] - killed_at
+                bound = args.ttl * 4 / 3 + args.tick + 0.5
+                print(f"переход лидерства: {gap:.2f}с (граница {bound:.2f}с)")
+                if gap > bound:
+                    ok = False
+        print("✅ один лидер, увеличения не потеряны" if ok else "❌ проверка не пройдена")
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
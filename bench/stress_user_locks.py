@@ -0,0 +1,99 @@
+"""
+Стресс-проверка последовательной обработки апдейтов одного пользователя.
+Каждому новичку одновременно прилетает несколько нажатий «Я прошёл тест»
+по текущему гайду плюс выдача гайда планировщиком; сессия бота отвечает
+со случайной задержкой, чтобы хендлеры перемешивались на await.
+
+Проверяем инварианты:
+  * guide_index после раунда r ровно r (двойные нажатия не сдвигают дважды);
+  * test_done стоит ровно у пройденных гайдов;
+  * карточки гайдов доходят до пользователя в неубывающем порядке номеров.
+
+    python bench/stress_user_locks.py --users 200 --taps 5
+    python bench/stress_user_locks.py --no-locks   # показать, что ломается без замков
+"""
+import re
+import sys
+import random
+import asyncio
+import argparse
+import tempfile
+from contextlib import asynccontextmanager
+
+from fakes import load_main, callback_update
+
+GUIDE_NUM = re.compile(r"Гайд #?(\d+)")
+
+
+@asynccontextmanager
+async def _no_lock(key):
+    yield
+
+
+async def run(args, data_dir: str) -> int:
+    main = load_main(data_dir, latency=args.latency)
+    if args.no_locks:
+        main.USER_LOCKS.lock = _no_lock
+    session = main.bot.session
+
+    uids = [500000 + i for i in range(args.users)]
+    for uid in uids:
+        main.USERS[str(uid)] = {
+            "fio": f"Стресс {uid}", "role": "newbie", "subject": "математика",
+            "guide_index": 0, "last_guide_sent_at": None, "progress": {},
+            "created_at": main._now_msk().isoformat(), "finished_at": "", "status": "",
+            "awaiting_fio": False, "awaiting_subject": False, "awaiting_code": False,
+        }
+        main.save_user(uid)
+
+    guides = main.GUIDES["newbie"]
+    errors = []
+    async def user_round(uid, guide):
+        # пользователи приходят вразнобой в пределах spread секунд
+        await asyncio.sleep(random.uniform(0, args.spread))
+        # планировщик начинает выдачу текущего гайда, пока пользователь жмёт кнопку
+        jobs = [main._send_newbie_guide(uid)]
+        jobs += [main.dp.feed_raw_update(main.bot, callback_update(uid, f"testdone:{guide['id']}"))
+                 for _ in range(args.taps)]
+        await asyncio.gather(*jobs)
+
+    for rnd, guide in enumerate(guides, start=1):
+        await asyncio.gather(*(user_round(uid, guide) for uid in uids))
+
+        for uid in uids:
+            u = main.USERS[str(uid)]
+            if u["guide_index"] != rnd:
+                errors.append(f"{uid}: после раунда {rnd} guide_index={u['guide_index']}")
+            done = {gid for gid, p in u["progress"].items() if p.get("test_done")}
+            if done != {g["id"] for g in guides[:rnd]}:
+                errors.append(f"{uid}: test_done={sorted(done)} после раунда {rnd}")
+            u["last_guide_sent_at"] = None  # раунд — отдельный день: гайд выдаётся раз в день
+
+    for uid in uids:
+        nums = [int(m.group(1)) for t in session.sent[uid] if t and (m := GUIDE_NUM.search(t))]
+        if nums != sorted(nums):
+            errors.append(f"{uid}: карточки гайдов пришли не по порядку {nums}")
+
+    await main.STORE.close()
+    print(f"пользователей: {args.users}, нажатий на гайд: {args.taps}, раундов: {len(guides)}, "
+          f"вызовов API: {sum(session.calls.values())}")
+    for e in errors[:20]:
+        print("❌", e)
+    print("✅ инварианты соблюдены" if not errors else f"❌ нарушений: {len(errors)}")
+    return 1 if errors else 0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--taps", type=int, default=5)
+    ap.add_argument("--latency", type=float, default=0.05)
+    ap.add_argument("--spread", type=float, default=1.0)
+    ap.add_argument("--no-locks", action="store_true")
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as d:
+        sys.exit(asyncio.run(run(args, d)))
+
+
+if __name__ == "__main__":
+    main()
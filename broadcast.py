@@ -0,0 +1,125 @@
+import os
+import time
+import asyncio
+from datetime import datetime
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError
+
+from metrics import REGISTRY
+
+# Telegram: не больше ~30 сообщений в секунду на бота — держим запас
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))            # сообщений/сек
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))  # одновременных запросов
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))   # повторов после RetryAfter
+PROGRESS_EVERY = 500  # печатать прогресс каждые N получателей
+
+
+class TokenBucket:
+    """
+    Общий для всех рассылок лимит запросов в секунду.
+    pause() останавливает выдачу токенов всем (когда Telegram вернул retry_after).
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+BUCKET = TokenBucket(BROADCAST_RATE)
+
+# последние отчёты по имени рассылки — для /health и мониторинга
+LAST_REPORTS = {}
+
+BROADCAST_SECONDS = REGISTRY.histogram(
+    "kurator_broadcast_seconds", "Длительность рассылки целиком", ("name",),
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800))
+BROADCAST_MESSAGES = REGISTRY.counter(
+    "kurator_broadcast_messages_total", "Итог отправки каждому получателю рассылки "
+    "(sent|blocked|failed) и повторы после RetryAfter (retry)", ("name", "result"))
+
+
+async def broadcast(uids, send, name: str = "broadcast",
+                    concurrency: int = BROADCAST_CONCURRENCY, bucket: TokenBucket = BUCKET, at: dict = None):
+    """
+    Отправляет send(uid) каждому получателю из uids.
+    Параллельно не больше concurrency запросов, темп — по общему bucket.
+    RetryAfter ставит на паузу всю рассылку и повторяет отправку,
+    ошибка одного получателя (блокировка бота и т.п.) остальных не задевает.
+    at — {uid: datetime с tz}: получатель обслуживается не раньше своего момента
+    (план окна доставки из delivery.py), очередь идёт по возрастанию моментов.
+    Возвращает отчёт: sent / blocked / failed / retries / duration.
+    """
+    uids = list(uids)
+    if at:
+        uids.sort(key=lambda uid: at[uid])
+    report = {
+        "name": name, "total": len(uids), "sent": 0, "blocked": 0,
+        "failed": 0, "retries": 0, "started_at": time.time(), "duration": 0.0,
+    }
+    LAST_REPORTS[name] = report
+    queue = iter(uids)
+    t0 = time.monotonic()
+
+    async def deliver(uid):
+        for attempt in range(BROADCAST_MAX_RETRIES + 1):
+            await bucket.acquire()
+            try:
+                await send(uid)
+                result = "sent"
+                break
+            except TelegramRetryAfter as e:
+                report["retries"] += 1
+                BROADCAST_MESSAGES.inc(name=name, result="retry")
+                bucket.pause(e.retry_after)
+            except TelegramForbiddenError:
+                result = "blocked"  # пользователь заблокировал бота
+                break
+            except Exception as e:
+                print(f"⚠️ {name}: не отправлено {uid}:", e)
+                result = "failed"
+                break
+        else:
+            result = "failed"
+        report[result] += 1
+        BROADCAST_MESSAGES.inc(name=name, result=result)
+
+    async def worker():
+        for uid in queue:  # общий итератор — каждый uid берёт ровно один воркер
+            if at:
+                moment = at[uid]
+                wait = (moment - datetime.now(moment.tzinfo)).total_seconds()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            await deliver(uid)
+            done = report["sent"] + report["blocked"] + report["failed"]
+            if done % PROGRESS_EVERY == 0:
+                print(f"📨 {name}: {done}/{report['total']} за {time.monotonic() - t0:.1f}с")
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(uids))))))
+    report["duration"] = time.monotonic() - t0
+    BROADCAST_SECONDS.observe(report["duration"], name=name)
+    print(f"📨 {name}: готово за {report['duration']:.1f}с — отправлено {report['sent']}, "
+          f"заблокировали {report['blocked']}, ошибок {report['failed']}, повторов {report['retries']}")
+    return report
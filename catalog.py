@@ -0,0 +1,136 @@
+import os
+import json
+import asyncio
+
+CATALOG_CHECK_INTERVAL = float(os.getenv("GUIDES_CHECK_INTERVAL", "10"))  # сек между проверками mtime guides.json
+
+ROLES = ("newbie", "letnik")
+REQUIRED = {
+    "newbie": ("id", "num", "title", "text", "url"),
+    "letnik": ("id", "title", "url"),
+}
+
+
+class CatalogError(ValueError):
+    pass
+
+
+def validate(data: dict):
+    """Проверяет структуру guides.json; при ошибке — CatalogError с понятным текстом."""
+    if not isinstance(data, dict):
+        raise CatalogError("каталог должен быть объектом")
+    seen = set()
+    for role in ROLES:
+        items = data.get(role)
+        if not isinstance(items, list):
+            raise CatalogError(f"{role}: нужен список гайдов")
+        for i, g in enumerate(items):
+            if not isinstance(g, dict):
+                raise CatalogError(f"{role}[{i}]: гайд должен быть объектом")
+            missing = [k for k in REQUIRED[role] if not g.get(k)]
+            if missing:
+                raise CatalogError(f"{role}[{i}]: нет полей {', '.join(missing)}")
+            if g["id"] in seen:
+                raise CatalogError(f"{role}[{i}]: повторяется id {g['id']}")
+            seen.add(g["id"])
+    subjects = data.get("subjects")
+    if not isinstance(subjects, list) or not all(isinstance(s, str) and s for s in subjects):
+        raise CatalogError("subjects: нужен список названий предметов")
+
+
+class _Snapshot:
+    """Неизменяемый после создания срез каталога со всеми индексами."""
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.by_id = {}
+        self.position = {}
+        for role in ROLES:
+            for i, g in enumerate(data[role]):
+                self.by_id[g["id"]] = g
+                self.position[g["id"]] = (role, i)
+
+
+class GuideCatalog:
+    """
+    Каталог гайдов из guides.json с индексами по id, роли и порядку.
+    Файл перечитывается, когда меняется его mtime (проверка в фоне через watch()).
+    Новая версия проверяется validate() и подменяет старую одним присваиванием —
+    хендлеры всегда видят целый каталог, старый или новый. Если файла нет,
+    в него пишутся defaults.
+    """
+
+    def __init__(self, path: str, defaults: dict):
+        self.path = path
+        self.mtime = None
+        self.listeners = []  # вызываются после успешной перезагрузки
+        validate(defaults)
+        self._snap = _Snapshot(defaults)
+        if not os.path.exists(path):
+            self._write(defaults)
+        try:
+            self._snap, self.mtime = self._read()
+        except Exception as e:
+            print("⚠️ guides.json не загружен, работаем на встроенных гайдах:", e)
+
+    def _write(self, data: dict):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def _read(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        validate(data)
+        return _Snapshot(data), mtime
+
+    # --- доступ ---
+    def __getitem__(self, key):
+        """GUIDES["newbie"] / ["letnik"] / ["subjects"] — как у прежнего словаря."""
+        return self._snap.data[key]
+
+    def get(self, guide_id: str):
+        return self._snap.by_id.get(guide_id)
+
+    def by_role(self, role: str) -> list:
+        return self._snap.data[role]
+
+    def position(self, guide_id: str):
+        """(роль, порядковый номер) гайда или None."""
+        return self._snap.position.get(guide_id)
+
+    # --- перезагрузка ---
+    def _changed(self) -> bool:
+        try:
+            return os.stat(self.path).st_mtime_ns != self.mtime
+        except FileNotFoundError:
+            return False
+
+    async def reload_if_changed(self) -> bool:
+        if not self._changed():
+            return False
+        try:
+            snap, mtime = await asyncio.to_thread(self._read)
+        except Exception as e:
+            # битый файл не ломает бота — остаёмся на текущей версии
+            print("⚠️ guides.json не перезагружен:", e)
+            try:
+                self.mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                pass
+            return False
+        self._snap, self.mtime = snap, mtime
+        for listener in self.listeners:
+            listener()
+        print(f"📚 Каталог гайдов обновлён: {len(snap.by_id)} гайдов")
+        return True
+
+    async def watch(self, interval: float = CATALOG_CHECK_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload_if_changed()
+            except Exception as e:
+                print("⚠️ guides watch err:", e)
@@ -0,0 +1,295 @@
+import os
+import time
+import socket
+import sqlite3
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+from metrics import REGISTRY
+
+# Несколько экземпляров бота на одном каталоге данных (общие users.db и cluster.db)
+CLUSTER_MODE = os.getenv("CLUSTER_MODE", "0") == "1"
+INSTANCE_ID = os.getenv("INSTANCE_ID", "").strip() or f"{socket.gethostname()}-{os.getpid()}"
+LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", "15"))        # сек; лидер умер — замена не позже чем через ~1.33×TTL
+USER_LEASE_TTL = float(os.getenv("USER_LEASE_TTL", "30"))            # сек; столько максимум держится замок пользователя
+CLUSTER_SYNC_INTERVAL = float(os.getenv("CLUSTER_SYNC_INTERVAL", "1"))  # сек между чтениями чужих изменений
+
+LEADER_CHANGES = REGISTRY.counter(
+    "kurator_cluster_leader_changes_total", "Смены роли этого экземпляра (role=leader|follower)", ("role",))
+USER_LEASE_WAIT = REGISTRY.histogram(
+    "kurator_cluster_user_lease_wait_seconds", "Ожидание замка пользователя, который держит другой экземпляр")
+REMOTE_CHANGES = REGISTRY.counter(
+    "kurator_cluster_remote_changes_total", "Пользователи, изменённые другими экземплярами и подтянутые в память")
+
+
+class LeaseTable:
+    """
+    Аренды в общей SQLite: имя → (владелец, срок). Захват и продление —
+    один upsert: получится, только если аренда своя или уже истекла.
+    Время — time.time(), поэтому экземпляры должны жить на одной машине
+    (или с синхронизированными часами) — как и общий файл SQLite.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                acquired_at REAL NOT NULL
+            )
+        """)
+        self._lock = threading.Lock()  # одно соединение на процесс, зовут из разных потоков
+
+    def acquire(self, name: str, holder: str, ttl: float) -> bool:
+        """Берёт или продлевает аренду на ttl секунд. False — она у другого и ещё не истекла."""
+        now = time.time()
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT INTO leases (name, holder, expires_at, acquired_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET holder=excluded.holder, expires_at=excluded.expires_at, "
+                "acquired_at=CASE WHEN leases.holder=excluded.holder THEN leases.acquired_at "
+                "ELSE excluded.acquired_at END "
+                "WHERE leases.holder=excluded.holder OR leases.expires_at < ?",
+                (name, holder, now + ttl, now, now),
+            )
+            return cur.rowcount == 1
+
+    def release(self, name: str, holder: str):
+        with self._lock:
+            self.conn.execute("DELETE FROM leases WHERE name=? AND holder=?", (name, holder))
+
+    def holder(self, name: str):
+        """(владелец, сек до истечения) или None."""
+        with self._lock:
+            row = self.conn.execute("SELECT holder, expires_at FROM leases WHERE name=?", (name,)).fetchone()
+        return (row[0], row[1] - time.time()) if row else None
+
+    def close(self):
+        self.conn.close()
+
+
+class LeaderElection:
+    """
+    Выбор лидера на аренде: экземпляр раз в ttl/3 берёт или продлевает аренду name.
+    У лидера работают задачи, зарегистрированные через while_leader (планировщик,
+    синхронизация сводки, polling); потерял аренду — задачи отменяются.
+    Если продлить не удаётся (база недоступна), лидер сам уступает до истечения
+    аренды, поэтому двух лидеров одновременно не бывает дольше одного шага.
+    """
+
+    def __init__(self, leases: LeaseTable, name: str = "leader", instance: str = INSTANCE_ID,
+                 ttl: float = LEADER_LEASE_TTL):
+        self.leases = leases
+        self.name = name
+        self.instance = instance
+        self.ttl = ttl
+        self.renew_every = ttl / 3
+        self.is_leader = False
+        self.since = None
+        self._renewed = 0.0
+        self._jobs = []      # фабрики корутин: запускаются при избрании
+        self._running = []
+        self._task = None
+        REGISTRY.gauge("kurator_cluster_leader", "1 — этот экземпляр сейчас лидер", ("instance",),
+                       collect=lambda: {(self.instance,): int(self.is_leader)})
+
+    def while_leader(self, factory):
+        """Запускать factory() (корутину), пока экземпляр лидер."""
+        self._jobs.append(factory)
+        if self.is_leader:
+            self._spawn(factory)
+
+    def _spawn(self, factory):
+        self._running.append(asyncio.create_task(factory()))
+
+    def _elect(self):
+        self.is_leader = True
+        self.since = time.time()
+        LEADER_CHANGES.inc(role="leader")
+        print(f"👑 {self.instance}: стал лидером")
+        for factory in self._jobs:
+            self._spawn(factory)
+
+    async def _step_down(self, reason: str):
+        self.is_leader = False
+        self.since = None
+        LEADER_CHANGES.inc(role="follower")
+        print(f"↘️ {self.instance}: больше не лидер ({reason})")
+        running, self._running = self._running, []
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+    async def tick(self):
+        try:
+            ok = await asyncio.to_thread(self.leases.acquire, self.name, self.instance, self.ttl)
+        except Exception as e:
+            print("⚠️ Аренда лидера не продлена:", e)
+            # не знаем, чья аренда; уступаем заранее, пока своя точно не истекла
+            if self.is_leader and time.monotonic() - self._renewed >= self.ttl - self.renew_every:
+                await self._step_down("аренда не продлевается")
+            return
+        if ok:
+            self._renewed = time.monotonic()
+            if not self.is_leader:
+                self._elect()
+        elif self.is_leader:
+            await self._step_down("аренду забрал другой экземпляр")
+
+    async def run(self):
+        while True:
+            await self.tick()
+            await asyncio.sleep(self.renew_every)
+
+    def status(self) -> dict:
+        try:
+            holder = self.leases.holder(self.name)
+        except Exception:
+            holder = None
+        return {
+            "instance": self.instance,
+            "is_leader": self.is_leader,
+            "leader": holder[0] if holder else None,
+            "lease_expires_in": round(holder[1], 1) if holder else None,
+        }
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def close(self):
+        """Отдаёт лидерство сразу, не дожидаясь истечения аренды."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            await self._step_down("остановка")
+            try:
+                await asyncio.to_thread(self.leases.release, self.name, self.instance)
+            except Exception as e:
+                print("⚠️ Аренда лидера не освобождена:", e)
+
+
+class StoreSync:
+    """
+    Держит USERS в памяти в актуальном состоянии при общей users.db:
+    раз в interval секунд подтягивает пользователей, записанных другими
+    экземплярами (по seq), а refresh(uid) — одного пользователя перед апдейтом.
+    Пользователи, чьи апдейты сейчас обрабатываются здесь (busy), откладываются
+    до следующего прохода, чтобы не подменить словарь под работающим хендлером.
+    """
+
+    def __init__(self, store, prepare=lambda u: u, on_change=None, busy=lambda uid: False,
+                 interval: float = CLUSTER_SYNC_INTERVAL):
+        self.store = store
+        self.prepare = prepare      # дозаполнение полей по умолчанию, как при загрузке
+        self.on_change = on_change  # uid -> None, например пометить строку сводки
+        self.busy = busy
+        self.interval = interval
+        self._deferred = set()
+        self._task = None
+
+    def _apply(self, uid: str, u, seq: int):
+        if self.store.apply_remote(uid, None if u is None else self.prepare(u), seq):
+            REMOTE_CHANGES.inc()
+            if self.on_change:
+                self.on_change(uid)
+
+    async def pull(self):
+        changed = await asyncio.to_thread(self.store.changes)
+        for uid, u, seq in changed:
+            if self.busy(uid):
+                self._deferred.add(uid)
+            else:
+                self._apply(uid, u, seq)
+        for uid in list(self._deferred):
+            if not self.busy(uid):
+                self._deferred.discard(uid)
+                await self.refresh(uid)
+
+    async def refresh(self, uid):
+        uid = str(uid)
+        fresh = await asyncio.to_thread(self.store.fetch, uid)
+        if fresh is not None:
+            self._apply(uid, *fresh)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.pull()
+            except Exception as e:
+                print("⚠️ Не удалось подтянуть изменения пользователей:", e)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class ClusterUserLocks:
+    """
+    Замена KeyedLocks для нескольких экземпляров: к локальному замку добавляется
+    аренда user:<id> в общей базе. Под ней пользователь сначала перечитывается
+    из users.db (его мог менять другой экземпляр), а на выходе изменения сразу
+    записываются — следующий апдейт может прийти на другой экземпляр.
+    """
+
+    def __init__(self, local, leases: LeaseTable, sync: StoreSync, instance: str = INSTANCE_ID,
+                 ttl: float = USER_LEASE_TTL):
+        self.local = local
+        self.leases = leases
+        self.sync = sync
+        self.instance = instance
+        self.ttl = ttl
+
+    async def _acquire(self, name: str):
+        t0 = time.monotonic()
+        delay = 0.01
+        warned = False
+        while not await asyncio.to_thread(self.leases.acquire, name, self.instance, self.ttl):
+            if not warned and time.monotonic() - t0 > self.ttl:
+                # владелец завис дольше срока аренды — она уже истекла, следующий захват пройдёт
+                print(f"⚠️ {name}: не дождались аренды за {self.ttl:.0f}с")
+                warned = True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.2)
+        USER_LEASE_WAIT.observe(time.monotonic() - t0)
+
+    @asynccontextmanager
+    async def lock(self, key):
+        name = f"user:{key}"
+        async with self.local.lock(key):
+            await self._acquire(name)
+            try:
+                await self.sync.refresh(key)
+                yield
+            finally:
+                await self.sync.store.flush_async()
+                try:
+                    await asyncio.to_thread(self.leases.release, name, self.instance)
+                except Exception as e:
+                    print(f"⚠️ {name}: аренда не освобождена:", e)
+
+    def __len__(self):
+        return len(self.local)
+
+    def __contains__(self, key):
+        return key in self.local
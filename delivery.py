@@ -0,0 +1,89 @@
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta
+
+# Окна доставки: рассылка по расписанию растягивается на окно, у каждого
+# пользователя своё постоянное смещение внутри него (не все в одну минуту)
+DELIVERY_WINDOW = float(os.getenv("DELIVERY_WINDOW_MIN", "30"))          # минут; 0 — всем сразу
+DELIVERY_CATCHUP = float(os.getenv("DELIVERY_CATCHUP_MIN", "20"))        # минут на тех, чьё время уже прошло
+DELIVERY_COHORT_FIELD = os.getenv("DELIVERY_COHORT_FIELD", "subject")    # поле пользователя = когорта
+# {"математика": {"shift": 30, "window": 45}} — сдвиг начала и своё окно (минуты) для когорты
+DELIVERY_COHORTS = json.loads(os.getenv("DELIVERY_COHORTS", "") or "{}")
+DELIVERY_TZ_FIELD = "tz_offset"                                           # часы относительно МСК (+4 — на 4 ч раньше)
+DELIVERY_MAX_TZ_AHEAD = int(os.getenv("DELIVERY_MAX_TZ_AHEAD", "7"))     # самый восточный учитываемый пояс, ч от МСК
+DELIVERY_MAX_TZ_BEHIND = 3                                                # и самый западный
+
+
+def fraction(uid, name: str) -> float:
+    """Постоянная доля окна [0, 1) для пользователя в рассылке name (одна и та же после рестартов)."""
+    digest = hashlib.blake2b(f"{name}:{uid}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+
+def nominal(now: datetime, hour: int, minute: int = 0, lead_hours: int = 0) -> datetime:
+    """Плановое время рассылки, к которой относится запуск в now: последнее hour:minute не позже now + lead."""
+    ref = now + timedelta(hours=lead_hours)
+    base = ref.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return base if base <= ref else base - timedelta(days=1)
+
+
+class DeliveryPlanner:
+    """
+    План рассылки: uid → момент отправки. Момент = плановое время
+    + сдвиг когорты − часовой пояс пользователя (если tz=True)
+    + fraction(uid) × окно когорты. Кому момент уже прошёл (запуск после
+    рестарта или пояс восточнее запуска), тот раскладывается по окну
+    догоняния от текущего момента — тоже по своей постоянной доле.
+    """
+
+    def __init__(self, window: float = DELIVERY_WINDOW, catchup: float = DELIVERY_CATCHUP,
+                 cohort_field: str = DELIVERY_COHORT_FIELD, cohorts: dict = None, tz: bool = False,
+                 max_ahead: int = DELIVERY_MAX_TZ_AHEAD, max_behind: int = DELIVERY_MAX_TZ_BEHIND):
+        self.window = window
+        self.catchup = catchup
+        self.cohort_field = cohort_field
+        self.cohorts = DELIVERY_COHORTS if cohorts is None else cohorts
+        self.tz = tz
+        self.max_ahead = max_ahead
+        self.max_behind = max_behind
+
+    def tz_offset(self, u: dict) -> int:
+        if not self.tz:
+            return 0
+        try:
+            offset = int(u.get(DELIVERY_TZ_FIELD) or 0)
+        except (TypeError, ValueError):
+            return 0
+        return max(-self.max_behind, min(self.max_ahead, offset))
+
+    def planned(self, uid, u: dict, base: datetime, name: str) -> datetime:
+        cohort = self.cohorts.get(str(u.get(self.cohort_field) or "")) or {}
+        window = float(cohort.get("window", self.window))
+        shift = float(cohort.get("shift", 0))
+        return (base + timedelta(minutes=shift + window * fraction(uid, name))
+                - timedelta(hours=self.tz_offset(u)))
+
+    def plan(self, users: dict, uids, base: datetime, now: datetime, name: str) -> dict:
+        """{uid: момент отправки} для uids (ключи USERS — строки, uids — как их ждёт send)."""
+        at = {}
+        for uid in uids:
+            u = users.get(str(uid)) or {}
+            moment = self.planned(uid, u, base, name)
+            if moment < now:
+                moment = now + timedelta(minutes=self.catchup * fraction(uid, name))
+            at[uid] = moment
+        return at
+
+
+def rate_curve(at: dict, start: datetime, bucket_minutes: int = 1) -> list:
+    """[(начало интервала, отправок)] — ожидаемая кривая рассылки по плану."""
+    counts = {}
+    step = bucket_minutes * 60
+    for moment in at.values():
+        i = int((moment - start).total_seconds() // step)
+        counts[i] = counts.get(i, 0) + 1
+    if not counts:
+        return []
+    return [(start + timedelta(seconds=i * step), counts.get(i, 0))
+            for i in range(min(counts), max(counts) + 1)]
@@ -0,0 +1,83 @@
+import io
+import os
+import csv
+import asyncio
+import tempfile
+
+from metrics import REGISTRY
+
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "500"))  # строк между отдачей управления event loop
+
+USER_FIELDS = ("fio", "role", "subject", "status", "guide_index",
+               "created_at", "last_guide_sent_at", "finished_at")
+FLAGS = (("read", "read"), ("task_done", "task"), ("test_done", "test"))
+
+EXPORT_ROWS = REGISTRY.counter("kurator_export_rows_total", "Строки, выгруженные в CSV (target=telegram|http)",
+                               ("target",))
+
+
+def _cell(v) -> str:
+    """Значение ячейки; ФИО и прочий ввод пользователя не должны стать формулой в Excel."""
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return str(int(v))
+    s = str(v)
+    return "'" + s if s[:1] in ("=", "+", "-", "@") else s
+
+
+def header(guide_ids) -> list:
+    return ["tg_id", *USER_FIELDS, *(f"{gid}_{name}" for gid in guide_ids for _, name in FLAGS)]
+
+
+def row(uid: str, u: dict, guide_ids) -> list:
+    progress = u.get("progress") or {}
+    values = [uid, *(_cell(u.get(f)) for f in USER_FIELDS)]
+    for gid in guide_ids:
+        p = progress.get(gid) or {}
+        values += [int(bool(p.get(key))) for key, _ in FLAGS]
+    return values
+
+
+async def stream_csv(users: dict, guide_ids, write, batch: int = EXPORT_BATCH, target: str = ""):
+    """
+    Пишет пользователей в CSV кусками: write(str) вызывается на каждые batch строк,
+    между кусками управление возвращается event loop. В памяти — только текущий кусок
+    (и список ключей, чтобы не упасть, если USERS пополнится во время выгрузки).
+    Строка снимается без await, поэтому каждая целиком относится к одному состоянию пользователя.
+    Возвращает число выгруженных пользователей.
+    """
+    buf = io.StringIO()
+    out = csv.writer(buf)
+    buf.write("\ufeff")  # BOM: Excel открывает кириллицу без танцев с кодировкой
+    out.writerow(header(guide_ids))
+    n = 0
+    for uid in list(users):
+        u = users.get(uid)
+        if u is None:
+            continue
+        out.writerow(row(uid, u, guide_ids))
+        n += 1
+        if n % batch == 0:
+            await write(buf.getvalue())
+            buf.seek(0)
+            buf.truncate()
+            await asyncio.sleep(0)
+    if buf.tell():
+        await write(buf.getvalue())
+    EXPORT_ROWS.inc(n, target=target)
+    return n
+
+
+async def export_to_file(users: dict, guide_ids, directory: str = None) -> tuple:
+    """Выгружает CSV во временный файл (для отправки документом). Возвращает (путь, строк)."""
+    fd, path = tempfile.mkstemp(prefix="export_", suffix=".csv", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            async def write(chunk: str):
+                await asyncio.to_thread(f.write, chunk)
+            n = await stream_csv(users, guide_ids, write, target="telegram")
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, n
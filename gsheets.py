@@ -1,9 +1,19 @@
+import os
+import re
 import json
+import time
+import random
+import asyncio
+import threading
 import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from gspread.utils import rowcol_to_a1
 from datetime import datetime
 import pytz
 
+from metrics import sheets_call
+from sheets_client import SheetsClient
+from profiling import phase
+
 TIMEZONE = pytz.timezone("Europe/Moscow")
 
 def _now_msk():
@@ -27,34 +37,758 @@ GOOGLE_KEY_JSON = '''{
 # ====== Вставляем ссылку на таблицу ======
 SPREADSHEET_URL = "https://docs.google.com/spreadsheets/d/17zqwZ0MNNJWjzVfmBluLXyRGt-ogC14QxtXhTfEPsNU/edit"
 
+LOG_TITLE = "Лог"
+LOG_HEADER = ["ts", "tg_id", "fio", "role", "subject", "event", "details"]
+
+# Общий клиент (пул соединений, фоновое обновление токена); создаётся при первом подключении
+CLIENT = None
+
+
+def sheets_request(method: str, fn, *args, **kwargs):
+    """Запрос к Sheets через CLIENT (лимит параллельности + метрики); без клиента — только метрики."""
+    if CLIENT is None:
+        return sheets_call(method, fn, *args, **kwargs)
+    return CLIENT.call(method, fn, *args, **kwargs)
+
+
 def connect_sheets():
+    """Открывает таблицу и листы (блокирующе, в потоке). Ошибка пробрасывается наверх."""
+    global CLIENT
+    if CLIENT is None:
+        CLIENT = SheetsClient(json.loads(GOOGLE_KEY_JSON))
+    if CLIENT.seconds_left() is None:
+        CLIENT.refresh()  # первый токен — здесь, в потоке подключения, а не первым запросом
+    sheet = sheets_request("open_by_url", CLIENT.gc.open_by_url, SPREADSHEET_URL)
+    summary = sheet.sheet1
     try:
-        creds_dict = json.loads(GOOGLE_KEY_JSON)
-        scope = ["https://spreadsheets.google.com/feeds",
-                 "https://www.googleapis.com/auth/drive"]
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-        client = gspread.authorize(creds)
-        sheet = client.open_by_url(SPREADSHEET_URL)
-        summary = sheet.sheet1
-        try:
-            log_sheet = sheet.worksheet("Лог")
+        log_sheet = sheets_request("worksheet", sheet.worksheet, LOG_TITLE)
+    except gspread.WorksheetNotFound:
+        log_sheet = sheets_request("add_worksheet", sheet.add_worksheet, title=LOG_TITLE, rows=1000, cols=10)
+        sheets_request("append_row", log_sheet.append_row, LOG_HEADER)
+    return summary, log_sheet
+
+
+# Листы появляются, когда SHEETS подключится; до этого и при сбоях — None,
+# и LOG_SINK / SUMMARY_SYNC копят записи у себя
+WS_SUMMARY, WS_LOG = None, None
+
+SHEETS_RETRY_MIN = float(os.getenv("SHEETS_RETRY_MIN", "1"))            # сек до первой повторной попытки
+SHEETS_RETRY_MAX = float(os.getenv("SHEETS_RETRY_MAX", "300"))          # потолок экспоненциальной паузы
+SHEETS_RECONNECT_EVERY = float(os.getenv("SHEETS_RECONNECT_EVERY", "3600"))  # плановое переподключение, сек
+SHEETS_ERRORS_TO_RECONNECT = int(os.getenv("SHEETS_ERRORS_TO_RECONNECT", "3"))  # ошибок подряд → переподключение
+
+
+class SheetsConnection:
+    """
+    Подключение к Google Sheets в фоне, без задержки старта бота.
+    Состояния: connecting (ещё ни разу не подключились), ready, degraded
+    (последняя попытка или несколько запросов подряд не удались).
+    Неудачные попытки повторяются с экспоненциальной паузой; раз в
+    reconnect_every и после errors_to_reconnect ошибок подряд листы открываются заново.
+    """
+
+    def __init__(self, connect=connect_sheets, retry_min=SHEETS_RETRY_MIN, retry_max=SHEETS_RETRY_MAX,
+                 reconnect_every=SHEETS_RECONNECT_EVERY, errors_to_reconnect=SHEETS_ERRORS_TO_RECONNECT):
+        self.connect = connect
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        self.reconnect_every = reconnect_every
+        self.errors_to_reconnect = errors_to_reconnect
+        self.state = "connecting"
+        self.attempts = 0
+        self.connected_at = None
+        self.last_error = ""
+        self.errors_in_row = 0
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def use(self, summary, log):
+        """Подставляет готовые листы (после подключения; в бенчмарках — листы в памяти)."""
+        global WS_SUMMARY, WS_LOG
+        WS_SUMMARY, WS_LOG = summary, log
+        SUMMARY_INDEX.invalidate()
+        self.state = "ready"
+        self.errors_in_row = 0
+        self.connected_at = _now_msk().isoformat()
+
+    @property
+    def ready(self) -> bool:
+        return WS_SUMMARY is not None and WS_LOG is not None
+
+    def report_ok(self):
+        self.errors_in_row = 0
+        if self.state == "degraded" and self.ready:
+            self.state = "ready"
+
+    def report_error(self, e):
+        """Ошибка запроса к Sheets; несколько подряд — повод переподключиться."""
+        self.errors_in_row += 1
+        self.last_error = str(e)
+        if self.errors_in_row >= self.errors_to_reconnect:
+            self.state = "degraded"
+            self._wake.set()
+
+    def status(self) -> dict:
+        status = {
+            "state": self.state,
+            "attempts": self.attempts,
+            "connected_at": self.connected_at,
+            "errors_in_row": self.errors_in_row,
+            "last_error": self.last_error,
+        }
+        if CLIENT is not None:
+            status["client"] = CLIENT.status()
+        return status
+
+    async def _attempt(self) -> bool:
+        self.attempts += 1
+        try:
+            summary, log = await asyncio.to_thread(self.connect)
+        except Exception as e:
+            self.last_error = str(e)
+            self.state = "degraded"
+            print("⚠️ Ошибка подключения к Google Sheets:", e)
+            return False
+        self.use(summary, log)
+        if CLIENT is not None:
+            CLIENT.start()  # токен дальше обновляется в фоне
+        print("📗 Google Sheets подключены")
+        return True
+
+    async def _sleep(self, seconds: float):
+        """Пауза, которую прерывает report_error (пора переподключаться)."""
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        delay = self.retry_min
+        while True:
+            if await self._attempt():
+                delay = self.retry_min
+                await self._sleep(self.reconnect_every)
+            else:
+                # пауза растёт вдвое, с разбросом — чтобы инстансы не ломились одновременно
+                await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+                delay = min(delay * 2, self.retry_max)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if CLIENT is not None:
+            await CLIENT.close()
+
+
+SHEETS = SheetsConnection()
+
+# ====== Лог событий: очередь + фоновая пачечная запись ======
+LOG_QUEUE_MAX = int(os.getenv("SHEETS_LOG_QUEUE_MAX", "5000"))     # строк в памяти
+LOG_BATCH_SIZE = int(os.getenv("SHEETS_LOG_BATCH_SIZE", "200"))    # строк в одном append_rows
+LOG_BATCH_WAIT = float(os.getenv("SHEETS_LOG_BATCH_WAIT", "2.0"))  # сек ожидания добора пачки
+DATA_DIR = os.getenv("DATA_DIR", "data")                           # тот же каталог, что у main.py
+LOG_SPOOL_FILE = os.getenv("SHEETS_LOG_SPOOL", os.path.join(DATA_DIR, "sheets_log_spool.jsonl"))
+LOG_ROLL_ROWS = int(os.getenv("SHEETS_LOG_ROLL_ROWS", "20000"))         # строк в активном листе до ротации
+LOG_ROLL_MONTHLY = os.getenv("SHEETS_LOG_ROLL_MONTHLY", "1") == "1"     # ротация и по смене месяца
+LOG_STATE_FILE = os.getenv("SHEETS_LOG_STATE", os.path.join(DATA_DIR, "sheets_log_state.json"))
+LOG_INDEX_TITLE = "Лог: архив"
+LOG_INDEX_HEADER = ["sheet", "from", "to", "rows", "archived_at"]
+
+_RANGE_LAST_ROW = re.compile(r"(\d+)$")
+
+
+def _appended_last_row(resp):
+    """Последняя строка из ответа values.append ('Лог'!A5:G9 → 9)."""
+    try:
+        m = _RANGE_LAST_ROW.search(resp["updates"]["updatedRange"])
+        return int(m.group(1)) if m else None
+    except (KeyError, TypeError):
+        return None
+
+
+def _cells(values):
+    return {"values": [
+        {"userEnteredValue": {"numberValue": v} if isinstance(v, (int, float)) else {"stringValue": str(v)}}
+        for v in values
+    ]}
+
+
+class LogArchiver:
+    """
+    Ротация листа «Лог»: когда в нём больше max_rows строк или начался новый
+    месяц, лист переименовывается в «Лог ГГГГ-ММ» (архив), на его месте
+    создаётся пустой «Лог» с заголовком, а в «Лог: архив» добавляется строка
+    об архиве — всё одним spreadsheets.batchUpdate. Дописывание всегда идёт
+    в небольшой лист. Период и номер части хранятся в state_path.
+    """
+
+    def __init__(self, set_ws, state_path=LOG_STATE_FILE, max_rows=LOG_ROLL_ROWS, monthly=LOG_ROLL_MONTHLY):
+        self.set_ws = set_ws          # куда подставить новый активный лист
+        self.state_path = state_path
+        self.max_rows = max_rows
+        self.monthly = monthly
+        self.rows = None              # последняя занятая строка активного листа (по ответам append)
+        self.index_id = None          # sheetId листа «Лог: архив»
+        self.retry_at = 0.0
+        self.rolls = 0
+        self._unsaved = False
+        self.state = self._load()
+
+    @staticmethod
+    def _period():
+        return _now_msk().strftime("%Y-%m")
+
+    def reload(self):
+        """Перечитывает состояние с диска — его мог сдвинуть другой экземпляр, ротировавший лист до нас."""
+        self.state = self._load()
+        self.rows = None
+        self.index_id = None
+
+    def _load(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("⚠️ sheets_log_state.json не прочитан:", e)
+        self._unsaved = True   # запишем при первом дописывании — импорт модуля не трогает диск
+        return {"period": self._period(), "since": _now_msk().isoformat(timespec="seconds"), "parts": {}}
+
+    def _save(self, state):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, self.state_path)
+
+    def observe(self, resp):
+        last = _appended_last_row(resp)
+        if last:
+            self.rows = last
+        if self._unsaved:
+            self._unsaved = False
+            try:
+                self._save(self.state)
+            except OSError as e:
+                print("⚠️ sheets_log_state.json не записан:", e)
+
+    def due(self) -> bool:
+        if time.monotonic() < self.retry_at:
+            return False
+        if self.monthly and self.state["period"] != self._period():
+            return True
+        return self.rows is not None and self.rows - 1 >= self.max_rows
+
+    def _index_requests(self, sh):
+        """Запросы на создание «Лог: архив», если его ещё нет (узнаём один раз)."""
+        if self.index_id is not None:
+            return []
+        try:
+            self.index_id = sheets_request("worksheet", sh.worksheet, LOG_INDEX_TITLE).id
+            return []
         except gspread.WorksheetNotFound:
-            log_sheet = sheet.add_worksheet(title="Лог", rows=1000, cols=10)
-            log_sheet.append_row(["ts", "tg_id", "fio", "role", "subject", "event", "details"])
-        return summary, log_sheet
-    except Exception as e:
-        print("⚠️ Ошибка подключения к Google Sheets:", e)
-        return None, None
+            self.index_id = random.randint(1, 2**31 - 1)
+            return [
+                {"addSheet": {"properties": {"sheetId": self.index_id, "title": LOG_INDEX_TITLE,
+                                             "gridProperties": {"rowCount": 100, "columnCount": 5,
+                                                                "frozenRowCount": 1}}}},
+                {"appendCells": {"sheetId": self.index_id, "rows": [_cells(LOG_INDEX_HEADER)],
+                                 "fields": "userEnteredValue"}},
+            ]
+
+    def roll(self, ws):
+        """Архивирует активный лист ws (в потоке, из воркера LogSink — параллельных append нет)."""
+        sh = ws.spreadsheet
+        period = self.state["period"]
+        part = self.state["parts"].get(period, 0) + 1
+        title = f"{LOG_TITLE} {period}" if part == 1 else f"{LOG_TITLE} {period} #{part}"
+        now = _now_msk().isoformat(timespec="seconds")
+        rows = (self.rows or 1) - 1
+        new_id = random.randint(1, 2**31 - 1)
+        try:
+            index_requests = self._index_requests(sh)
+            resp = sheets_request("batch_update", sh.batch_update, {"requests": [
+                {"updateSheetProperties": {"properties": {"sheetId": ws.id, "title": title}, "fields": "title"}},
+                {"addSheet": {"properties": {"sheetId": new_id, "title": LOG_TITLE, "index": ws.index,
+                                             "gridProperties": {"rowCount": 1000, "columnCount": 10,
+                                                                "frozenRowCount": 1}}}},
+                {"appendCells": {"sheetId": new_id, "rows": [_cells(LOG_HEADER)], "fields": "userEnteredValue"}},
+                *index_requests,
+                {"appendCells": {"sheetId": self.index_id, "rows": [_cells([title, self.state["since"], now, rows])],
+                                 "fields": "userEnteredValue"}},
+            ]})
+        except Exception:
+            self.index_id = None      # перепроверим при следующей попытке
+            self.retry_at = time.monotonic() + 300
+            raise
+        props = resp["replies"][1]["addSheet"]["properties"]
+        self.set_ws(gspread.Worksheet(sh, props, sh.id, sh.client))
+        self.rows = 1
+        self.rolls += 1
+        self.state["parts"][period] = part
+        self.state = {"period": self._period(), "since": now,
+                      "parts": {k: v for k, v in self.state["parts"].items() if k >= period}}
+        self._save(self.state)
+        print(f"🗄️ Лог заархивирован: {title} ({rows} строк)")
+        return title
+
+
+class LogSink:
+    """
+    Неблокирующая запись лога в Google Sheets.
+    put() кладёт строку в ограниченную очередь и сразу возвращает управление,
+    фоновый воркер отправляет строки пачками через append_rows.
+    Если очередь переполнена, Sheets недоступны или бот останавливается —
+    строки уходят в spool-файл на диске и досылаются позже.
+    """
+
+    def __init__(self, get_ws, spool_path=LOG_SPOOL_FILE, maxsize=LOG_QUEUE_MAX,
+                 batch_size=LOG_BATCH_SIZE, batch_wait=LOG_BATCH_WAIT, conn=None, archiver=None):
+        self.get_ws = get_ws
+        self.conn = conn  # SheetsConnection: узнаёт об ошибках, чтобы переподключиться
+        self.archiver = archiver  # LogArchiver: держит активный лист небольшим
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self._spool_lock = threading.Lock()
+        self._inflight = []          # пачка, запись которой ещё не подтверждена
+        self._inflight_lock = threading.Lock()
+        self._sending = False        # поток сейчас отправляет _inflight
+        self._abandoned = False      # close() не дождался отправки — судьбу пачки решает поток
+        self._task = None
+        self._closing = False
+        self._idle = False
+        self.stats = {
+            "enqueued": 0,        # принято от хендлеров
+            "sent": 0,            # записано в Sheets
+            "batches": 0,
+            "failed_batches": 0,
+            "spooled": 0,         # ушло в spool-файл
+            "overflow": 0,        # из них — из-за переполненной очереди
+            "queue_max": maxsize,
+            "last_batch_ms": 0.0,
+            "last_error": "",
+        }
+
+    # --- spool на диске ---
+    def _spool(self, rows):
+        if not rows:
+            return
+        with self._spool_lock:
+            os.makedirs(os.path.dirname(self.spool_path) or ".", exist_ok=True)
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.stats["spooled"] += len(rows)
+
+    def _drain_spool(self, ws):
+        """
+        Досылает строки из spool (в потоке). Замок держится только на чтении
+        и перезаписи файла, не на запросах к Sheets: _spool() зовут из event loop.
+        Неотправленное (и дописанное за время отправки) остаётся в файле.
+        """
+        with self._spool_lock:
+            if not os.path.exists(self.spool_path):
+                return 0
+            with open(self.spool_path, "r", encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+        sent = 0
+        try:
+            while sent < len(rows):
+                chunk = rows[sent:sent + self.batch_size]
+                self._append(ws, chunk)
+                sent += len(chunk)
+        finally:
+            if sent:
+                self._drop_spooled(sent)
+        return sent
+
+    def _drop_spooled(self, n):
+        """Убирает из spool первые n строк; _spool() только дописывает в конец, начало файла прежнее."""
+        with self._spool_lock:
+            with open(self.spool_path, "r", encoding="utf-8") as f:
+                rest = [line for line in f if line.strip()][n:]
+            if rest:
+                tmp = self.spool_path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.writelines(rest)
+                os.replace(tmp, self.spool_path)
+            else:
+                os.remove(self.spool_path)
+
+    def _append_inflight(self, ws, batch):
+        """
+        Отправка пачки воркером (в потоке). Поток нельзя прервать, поэтому исход
+        фиксируется здесь: удалась — пачка снимается с _inflight и close() её не
+        spool-ит (иначе после рестарта она записалась бы второй раз); не удалась
+        после close() — в spool её кладёт сам поток.
+        """
+        with self._inflight_lock:
+            if self._abandoned:
+                return None  # close() уже сохранил пачку в spool
+            self._sending = True
+        try:
+            resp = self._append(ws, batch)
+        except Exception:
+            with self._inflight_lock:
+                self._sending = False
+                abandoned, self._inflight = self._abandoned, ([] if self._abandoned else self._inflight)
+            if abandoned:
+                self._spool(batch)
+            raise
+        with self._inflight_lock:
+            self._sending = False
+            self._inflight = []
+        return resp
+
+    def _append(self, ws, rows):
+        resp = sheets_request("append_rows", ws.append_rows, rows, value_input_option="RAW")
+        if self.archiver:
+            self.archiver.observe(resp)
+        return resp
+
+    # --- приём строк ---
+    def put(self, row):
+        self.stats["enqueued"] += 1
+        try:
+            self.queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.stats["overflow"] += 1
+            self._spool([row])
+
+    def snapshot(self):
+        """Метрики очереди для мониторинга."""
+        return dict(self.stats, queue_size=self.queue.qsize())
+
+    # --- воркер ---
+    async def _collect(self):
+        self._idle = True
+        try:
+            batch = [await self.queue.get()]
+        finally:
+            self._idle = False
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            if self._closing:
+                # при остановке не ждём добора, но забираем всё, что уже лежит в очереди
+                while len(batch) < self.batch_size and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                break
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _send(self, batch):
+        ws = self.get_ws()
+        if not ws:
+            self._spool(batch)
+            return False
+        t0 = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._append_inflight, ws, batch)
+        except Exception as e:
+            self.stats["failed_batches"] += 1
+            self.stats["last_error"] = str(e)
+            print("⚠️ Sheets LOG error:", e)
+            if self.conn:
+                self.conn.report_error(e)
+            self._spool(batch)
+            return False
+        if self.conn:
+            self.conn.report_ok()
+        self.stats["batches"] += 1
+        self.stats["sent"] += len(batch)
+        self.stats["last_batch_ms"] = (time.perf_counter() - t0) * 1000
+        try:
+            self.stats["sent"] += await asyncio.to_thread(self._drain_spool, ws)
+        except Exception as e:
+            self.stats["last_error"] = str(e)
+            print("⚠️ Sheets LOG spool error:", e)
+        if self.archiver and self.archiver.due():
+            try:
+                await asyncio.to_thread(self.archiver.roll, ws)
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                print("⚠️ Sheets LOG rollover error:", e)
+        return True
+
+    async def run(self):
+        backoff = 1.0
+        # после рестарта сначала досылаем то, что осталось в spool
+        ws = self.get_ws()
+        if ws:
+            try:
+                self.stats["sent"] += await asyncio.to_thread(self._drain_spool, ws)
+            except Exception as e:
+                print("⚠️ Sheets LOG spool error:", e)
+        while not (self._closing and self.queue.empty()):
+            self._inflight = await self._collect()
+            ok = await self._send(self._inflight)
+            self._inflight = []
+            if ok:
+                backoff = 1.0
+            elif not self._closing:
+                await asyncio.sleep(backoff)  # Sheets лежат — не долбим API
+                backoff = min(backoff * 2, 60.0)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def close(self, timeout: float = 5.0):
+        """Пытается дописать очередь; что не успело — сохраняется в spool."""
+        if self._task is None:
+            return
+        self._closing = True
+        if self._idle and self.queue.empty():
+            self._task.cancel()  # воркер просто ждёт строк — будить нечем
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        self._task = None
+        with self._inflight_lock:
+            self._abandoned = True
+            # пачку, которую поток ещё отправляет, не трогаем: подтвердится — её не надо
+            # сохранять, не подтвердится — поток сохранит сам
+            rest = [] if self._sending else list(self._inflight)
+            self._inflight = []
+        while not self.queue.empty():
+            rest.append(self.queue.get_nowait())
+        self._spool(rest)
+
+
+def _use_log_ws(ws):
+    global WS_LOG
+    WS_LOG = ws
+
+
+LOG_ARCHIVER = LogArchiver(_use_log_ws)
+LOG_SINK = LogSink(lambda: WS_LOG, conn=SHEETS, archiver=LOG_ARCHIVER)
 
-WS_SUMMARY, WS_LOG = connect_sheets()
 
 def gs_log_event(uid, fio, role, subject, event, details=""):
-    if not WS_LOG:
-        return
-    try:
-        WS_LOG.append_row([
+    """Ставит событие в очередь лога — без сетевых запросов в хендлере."""
+    with phase("sheets"):
+        LOG_SINK.put([
             datetime.now(TIMEZONE).strftime("%Y-%m-%d %H:%M:%S"),
             str(uid), fio or "", role or "", subject or "", event, details
         ])
+
+
+# ====== Сводка: индекс TG_ID → номер строки ======
+SUMMARY_INDEX_TTL = float(os.getenv("SHEETS_INDEX_TTL", "600"))  # сек между сверками индекса с таблицей
+
+_UPDATED_ROW = re.compile(r"![A-Z]+(\d+)")
+
+
+class SummaryIndex:
+    """
+    Номер строки WS_SUMMARY для каждого TG_ID.
+    Строится одним запросом col_values(1), пополняется при append,
+    раз в SUMMARY_INDEX_TTL секунд сверяется с таблицей заново.
+    """
+
+    def __init__(self, get_ws, ttl=SUMMARY_INDEX_TTL):
+        self.get_ws = get_ws
+        self.ttl = ttl
+        self.rows = {}
+        self.built_at = None
+        self.builds = 0
+
+    def build(self):
+        ws = self.get_ws()
+        col = sheets_request("col_values", ws.col_values, 1)
+        self.builds += 1
+        # первая строка — заголовок
+        self.rows = {str(v): i for i, v in enumerate(col, start=1) if i > 1 and v}
+        self.built_at = time.monotonic()
+
+    def _ensure(self):
+        if self.built_at is None or time.monotonic() - self.built_at > self.ttl:
+            self.build()
+
+    def row_of(self, uid):
+        self._ensure()
+        return self.rows.get(str(uid))
+
+    def remember(self, uid, row: int):
+        self.rows[str(uid)] = row
+
+    def invalidate(self):
+        self.built_at = None
+
+
+SUMMARY_INDEX = SummaryIndex(lambda: WS_SUMMARY)
+
+
+def _appended_row(resp):
+    """Номер строки из ответа values.append ('Лист1'!A5:P5 → 5)."""
+    try:
+        m = _UPDATED_ROW.search(resp["updates"]["updatedRange"])
+        return int(m.group(1)) if m else None
+    except (KeyError, TypeError):
+        return None
+
+
+def gs_upsert_row(uid, values):
+    """
+    Записывает строку пользователя в WS_SUMMARY: существующую — одним
+    batch_update по диапазону строки, новую — одним append_row.
+    """
+    if not WS_SUMMARY:
+        return
+    try:
+        row = SUMMARY_INDEX.row_of(uid)
+        if row:
+            rng = f"A{row}:{rowcol_to_a1(row, len(values))}"
+            sheets_request("batch_update", WS_SUMMARY.batch_update, [{"range": rng, "values": [values]}])
+        else:
+            resp = sheets_request("append_row", WS_SUMMARY.append_row, values, table_range="A1")
+            row = _appended_row(resp)
+            if row:
+                SUMMARY_INDEX.remember(uid, row)
+            else:
+                SUMMARY_INDEX.invalidate()
     except Exception as e:
-        print("⚠️ Sheets LOG error:", e)
\ No newline at end of file
+        SUMMARY_INDEX.invalidate()  # вдруг строки сдвинули руками — перестроим
+        print("⚠️ Ошибка записи в WS_SUMMARY:", e)
+
+
+# ====== Сводка: отложенная пачечная синхронизация ======
+SUMMARY_SYNC_INTERVAL = float(os.getenv("SHEETS_SUMMARY_INTERVAL", "10"))  # сек между сбросами
+
+
+class SummarySyncer:
+    """
+    Синхронизация строк WS_SUMMARY без запросов из хендлеров.
+    mark(uid) только помечает пользователя; раз в interval секунд все
+    помеченные пишутся разом: существующие строки — одним batch_update,
+    новые — одним append_rows. Несколько изменений одного пользователя
+    за интервал превращаются в одну запись.
+    """
+
+    def __init__(self, row_for, get_ws=lambda: WS_SUMMARY, index=SUMMARY_INDEX,
+                 interval=SUMMARY_SYNC_INTERVAL, conn=SHEETS):
+        self.conn = conn
+        self.row_for = row_for      # uid -> список значений строки (или None)
+        self.get_ws = get_ws
+        self.index = index
+        self.interval = interval
+        self._dirty = set()
+        self._task = None
+        self.stats = {
+            "marks": 0,
+            "flushes": 0,
+            "rows_written": 0,
+            "api_calls": 0,
+            "errors": 0,
+            "last_batch_size": 0,
+            "last_flush_ms": 0.0,
+            "last_error": "",
+        }
+
+    def mark(self, uid):
+        self._dirty.add(str(uid))
+        self.stats["marks"] += 1
+
+    def snapshot(self):
+        """Метрики синхронизации для мониторинга."""
+        return dict(self.stats, pending=len(self._dirty))
+
+    def _write(self, ws, rows):
+        """Пишет [(uid, values)] в таблицу (в потоке). Возвращает число API-запросов."""
+        builds = self.index.builds
+        updates, appends = [], []
+        for uid, values in rows:
+            row = self.index.row_of(uid)
+            if row:
+                rng = f"A{row}:{rowcol_to_a1(row, len(values))}"
+                updates.append({"range": rng, "values": [values]})
+            else:
+                appends.append((uid, values))
+        calls = self.index.builds - builds
+        if updates:
+            sheets_request("batch_update", ws.batch_update, updates)
+            calls += 1
+        if appends:
+            resp = sheets_request("append_rows", ws.append_rows, [v for _, v in appends], table_range="A1")
+            calls += 1
+            first = _appended_row(resp)
+            if first:
+                for i, (uid, _) in enumerate(appends):
+                    self.index.remember(uid, first + i)
+            else:
+                self.index.invalidate()
+        return calls
+
+    async def flush(self):
+        ws = self.get_ws()
+        if not ws or not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        rows = []
+        for uid in dirty:
+            values = self.row_for(uid)
+            if values is not None:
+                rows.append((uid, values))
+        if not rows:
+            return
+        t0 = time.perf_counter()
+        try:
+            calls = await asyncio.to_thread(self._write, ws, rows)
+        except asyncio.CancelledError:
+            self._dirty |= dirty  # остановили посреди записи (смена лидера) — допишет следующий
+            raise
+        except Exception as e:
+            self._dirty |= dirty  # повторим на следующем интервале
+            self.index.invalidate()
+            self.stats["errors"] += 1
+            self.stats["last_error"] = str(e)
+            print("⚠️ Ошибка записи в WS_SUMMARY:", e)
+            if self.conn:
+                self.conn.report_error(e)
+            return
+        if self.conn:
+            self.conn.report_ok()
+        self.stats["flushes"] += 1
+        self.stats["api_calls"] += calls
+        self.stats["rows_written"] += len(rows)
+        self.stats["last_batch_size"] = len(rows)
+        self.stats["last_flush_ms"] = (time.perf_counter() - t0) * 1000
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
@@ -0,0 +1,34 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class KeyedLocks:
+    """
+    asyncio.Lock на каждый ключ (tg_id): изменения одного пользователя идут
+    строго по очереди, разные пользователи не мешают друг другу.
+    Замок живёт, пока его кто-то держит или ждёт, — память не растёт с числом пользователей.
+    """
+
+    def __init__(self):
+        self._locks = {}  # key -> [Lock, сколько держат/ждут]
+
+    @asynccontextmanager
+    async def lock(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
+
+    def __contains__(self, key):
+        """Ключ сейчас кем-то держится или ожидается."""
+        return key in self._locks
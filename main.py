@@ -1,16 +1,38 @@
 import os
 import asyncio
 import json
+import hmac
+import signal
+import hashlib
+import threading
+from functools import partial
 from aiogram.fsm.context import FSMContext
 from datetime import datetime, timedelta, time, timezone
-from gsheets import WS_SUMMARY, gs_log_event
+from gsheets import SHEETS, gs_log_event, gs_upsert_row, LOG_SINK, LOG_ARCHIVER, SummarySyncer
+from metrics import REGISTRY
+from storage import WriteBehindStore, SqliteBackend, make_backend
+from cluster import CLUSTER_MODE, LeaseTable, LeaderElection, StoreSync, ClusterUserLocks
+from broadcast import broadcast
+from delivery import DeliveryPlanner, DELIVERY_MAX_TZ_AHEAD, DELIVERY_TZ_FIELD, nominal
+from scheduler import Scheduler
+from catalog import GuideCatalog, ROLES
+from export import stream_csv, export_to_file
+from locks import KeyedLocks
+from middlewares import (
+    UserLockMiddleware, HandlerMetricsMiddleware, UpdateTimingMiddleware, TelegramTimingMiddleware
+)
+from profiling import SlowLog, Sampler, PROFILER_ENABLED, phase
 from aiohttp import web
 from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
-from aiogram.filters import CommandStart, Command
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import CommandStart, Command, CommandObject
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
 from aiogram.types import (
-    Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+    Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
 )
 MSK = timezone(timedelta(hours=3))  # Московское время UTC+3
 
@@ -22,7 +44,12 @@ def _now_msk():
 BOT_TOKEN = os.getenv("BOT_TOKEN", "").strip()
 if not BOT_TOKEN:
     raise RuntimeError("Нет BOT_TOKEN. Добавь переменную окружения BOT_TOKEN на Render.")
-bot = Bot(token=BOT_TOKEN)
+# TELEGRAM_API_URL — другой адрес Bot API (локальный bot-api сервер или bench/fake_telegram.py для нагрузочных прогонов)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").strip()
+if TELEGRAM_API_URL:
+    bot = Bot(token=BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)))
+else:
+    bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher(bot=bot)
 
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0") or "0")  # твой телеграм ID
@@ -34,6 +61,17 @@ HR_CHAT_LINK = os.getenv("HR_CHAT_LINK", "https://t.me/obucheniehub_bot")  # с
 LETL_CODE = os.getenv("LETL_CODE", "letl2025")  # код для летников
 NEWBIE_CODE = os.getenv("NEWBIE_CODE", "newbie2025")
 
+# Вебхук (по умолчанию — long polling). WEBHOOK_URL — публичный адрес сервиса, например https://kurator-bot.onrender.com
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip().rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# секрет одинаковый на всех инстансах за балансировщиком; по умолчанию выводится из токена
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").strip() or hashlib.sha256(BOT_TOKEN.encode()).hexdigest()[:32]
+WEBHOOK_CHECK_INTERVAL = int(os.getenv("WEBHOOK_CHECK_INTERVAL", "300"))  # сек между проверками getWebhookInfo
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "100"))        # столько недоставленных апдейтов + свежая ошибка → polling
+
+# токен для служебных HTTP-маршрутов /debug/* (заголовок Authorization: Bearer <токен>); пустой — маршруты закрыты
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "").strip()
+
 
 
 REMIND_HOURS = [14, 22]  # напоминания новичкам
@@ -42,23 +80,33 @@ GUIDE_HOUR = 8           # в 08:00 выдаем следующий гайд н
 
 import os
 
-DATA_DIR = "data"
+DATA_DIR = os.getenv("DATA_DIR", "data")
 USERS_FILE = os.path.join(DATA_DIR, "users.json")
 GUIDES_FILE = os.path.join(DATA_DIR, "guides.json")
 os.makedirs(DATA_DIR, exist_ok=True)
 
-# ======= ЧИСТЫЙ СТАРТ (только выбранные файлы) =======
-for f in [USERS_FILE, GUIDES_FILE]:
-    if os.path.exists(f):
-        os.remove(f)
+# апдейты дольше SLOW_UPDATE_MS — в data/slow.log с разбивкой по фазам
+SLOW_LOG = SlowLog(os.path.join(DATA_DIR, "slow.log"))
+# порядок важен: таймер снаружи, чтобы учесть и ожидание замка пользователя
+dp.update.outer_middleware(UpdateTimingMiddleware(SLOW_LOG))
+# апдейты одного пользователя — строго по очереди, разных пользователей — параллельно
+USER_LOCKS = KeyedLocks()
+USER_LOCK_MIDDLEWARE = UserLockMiddleware(USER_LOCKS)
+dp.update.outer_middleware(USER_LOCK_MIDDLEWARE)
+# время и исход каждого хендлера — для /metrics
+dp.message.middleware(HandlerMetricsMiddleware())
+dp.callback_query.middleware(HandlerMetricsMiddleware())
+bot.session.middleware(TelegramTimingMiddleware())
+
+# бэкенд пользователей (STORAGE_BACKEND=journal|json|sqlite); прогресс переживает рестарты и деплои,
+# journal и sqlite при первом старте забирают старый users.json
+USERS_BACKEND = make_backend(DATA_DIR)
 
 user_data = {}  # словарь для хранения данных пользователей
 
 
 
 # ============== GOOGLE SHEETS ==============
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 from aiogram import types
 from datetime import datetime
 
@@ -67,7 +115,7 @@ def add_user_to_sheets(user: types.User):
     Добавляет нового пользователя в WS_SUMMARY с нужными колонками.
     Если пользователь уже есть, просто обновляет информацию.
     """
-    if not WS_SUMMARY:
+    if not SHEETS.ready:
         print("⚠️ WS_SUMMARY не подключен")
         return
 
@@ -95,14 +143,6 @@ def add_user_to_sheets(user: types.User):
         "last_guide_sent_at": ""
     }
 
-    # Проверяем, есть ли пользователь
-    all_values = WS_SUMMARY.get_all_records()
-    row_index = None
-    for i, row in enumerate(all_values, start=2):
-        if str(row.get("TG_ID")) == str(uid):
-            row_index = i
-            break
-
     # Формируем значения для записи
     values = [
         str(uid),
@@ -123,14 +163,8 @@ def add_user_to_sheets(user: types.User):
         user_dict.get("last_guide_sent_at")
     ]
 
-    try:
-        if row_index:
-            for col, val in enumerate(values, start=1):
-                WS_SUMMARY.update_cell(row_index, col, val)
-        else:
-            WS_SUMMARY.append_row(values)
-    except Exception as e:
-        print("⚠️ Ошибка записи в WS_SUMMARY:", e)
+    # одна запись: batch_update строки по индексу TG_ID или append новой
+    gs_upsert_row(uid, values)
     
     # Формируем словарь пользователя
     user_data = {
@@ -148,101 +182,156 @@ def add_user_to_sheets(user: types.User):
     
     # Добавляем или обновляем в Google Sheets
     gs_upsert_summary(uid, user_data)
-def gs_upsert_summary(user_id, user_data):
+def summary_row(uid):
+    """Строка сводки WS_SUMMARY для пользователя из USERS (те же колонки, что в add_user_to_sheets)."""
+    u = USERS.get(str(uid))
+    if u is None:
+        return None
+    prog = u.get("progress") or {}
+
+    def flag(guide_id, key):
+        return int(bool((prog.get(guide_id) or {}).get(key)))
+
+    finished = bool(u.get("finished_at")) or u.get("guide_index", 0) >= len(GUIDES["newbie"])
+    return [
+        str(uid),
+        u.get("fio") or "",
+        u.get("role") or "",
+        u.get("subject") or "",
+        u.get("status") or "",
+        int(u.get("guide_index", 0) or 0),
+        flag("guide1", "read"), flag("guide2", "read"), flag("guide3", "read"),
+        flag("guide1", "task_done"), flag("guide2", "task_done"), flag("guide3", "task_done"),
+        int(finished),
+        u.get("created_at") or "",
+        u.get("finished_at") or "",
+        u.get("last_guide_sent_at") or "",
+    ]
+
+
+SUMMARY_SYNC = SummarySyncer(summary_row)
+
+
+def gs_upsert_summary(user_id, user_data=None):
     """
-    Заглушка для обновления сводки по пользователю.
-    Пока можно оставить пустой, чтобы бот не падал.
+    Помечает строку пользователя в сводке к обновлению.
+    Саму запись в Google Sheets пачкой делает SUMMARY_SYNC в фоне.
+    При нескольких экземплярах сводку пишет только лидер: он узнаёт об изменении
+    через STORE_SYNC, а остальные не копят пометки, которые некому сбросить.
     """
-    pass
+    if LEADER is not None and not LEADER.is_leader:
+        return
+    with phase("sheets"):
+        SUMMARY_SYNC.mark(user_id)
 
 # ============== JSON "БД" ==============
-def _read_json(path: str, default):
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return default
-    except Exception:
-        return default
-
-def _write_json(path: str, payload):
-    tmp = path + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, path)
+def _user_defaults(u: dict) -> dict:
+    u.setdefault("fio", None)
+    u.setdefault("role", None)                  # newbie / letnik
+    u.setdefault("subject", None)
+    u.setdefault("guide_index", 0)              # индекс текущего гайда для новичка
+    u.setdefault("last_guide_sent_at", None)    # ISO
+    u.setdefault("progress", {})                # {guide_id: {"read": bool, "task_done": bool, "test_done": bool}}
+    u.setdefault("created_at", _now_msk().isoformat())
+    u.setdefault("finished_at", "")
+    u.setdefault("status", "")
+    u.setdefault("awaiting_fio", False)
+    u.setdefault("awaiting_subject", False)
+    u.setdefault("awaiting_code", False)
+    return u
 
 def load_users():
-    data = _read_json(USERS_FILE, {})
-    for uid, u in data.items():
-        u.setdefault("fio", None)
-        u.setdefault("role", None)                  # newbie / letnik
-        u.setdefault("subject", None)
-        u.setdefault("guide_index", 0)              # индекс текущего гайда для новичка
-        u.setdefault("last_guide_sent_at", None)    # ISO
-        u.setdefault("progress", {})                # {guide_id: {"read": bool, "task_done": bool, "test_done": bool}}
-        u.setdefault("created_at", _now_msk().isoformat())
-        u.setdefault("finished_at", "")
-        u.setdefault("status", "")
-        u.setdefault("awaiting_fio", False)
-        u.setdefault("awaiting_subject", False)
-        u.setdefault("awaiting_code", False)
+    data = USERS_BACKEND.load()
+    for u in data.values():
+        _user_defaults(u)
     return data
 
-def save_users(data):
-    _write_json(USERS_FILE, data)
-
-def load_guides():
-    data = _read_json(GUIDES_FILE, {})
-    if not data:
-        data = {
-            "newbie": [
-                {
-                    "id": "guide1",
-                    "num": 1,
-                    "title": "Как построить общение с учеником?",
-                    "text": "Обрати внимание, что в гайде есть видео, с которым тоже нужно ознакомиться!",
-                    "url": "https://docs.google.com/document/d/1tEiUuP8wAuwsnxQj2qaqpYH_VYj5a-2mNNZG--iv2I4/edit?usp=sharing",
-                    "test_url": "https://docs.google.com/forms/d/e/1FAIpQLSf3wh-yOoLOrGYkCaBZ5a0jfOP1dr_8OdbDJ4nHT5ZU9Ws5Wg/viewform?usp=header"
-                },
-                {
-                    "id": "guide2",
-                    "num": 2,
-                    "title": "Технические моменты в работе куратора",
-                    "text": "Обрати внимание, что в гайде есть видео, с которыми тоже нужно ознакомиться!!",
-                    "url": "https://docs.google.com/document/d/1JH0-6m1ygQ4bTjoWTITXMtqFEXGAvUAgieyD8doK21o/edit?usp=sharing",
-                    "test_url": "https://docs.google.com/forms/d/e/1FAIpQLSeOe5IXIKFsclxP0mTSeDdPK_cX1qdtTAtUofjlilu9UGHVyA/viewform?usp=header"
-                },
-                {
-                    "id": "guide3",
-                    "num": 3,
-                    "title": "Как проверять домашние задания + практика",
-                    "text": "Переходи по ссылкам, изучай и делай задание! Задание выполняй в файле и потом скидывай своему старшему куратору",
-                    "url": "https://docs.google.com/document/d/1gkhcvRV6HydDILnm24jY7ltOKsriM71jdHdzBn2b9VY/edit?usp=sharing",
-                    "test_url": "https://docs.google.com/document/d/1NKQRuiJ-almJuSaI3_TLvn-FvIPLv8-EvsGUDL_bMZ8/edit?usp=sharing"
-                },
-                {
-                    "id": "guide4",
-                    "num": 4,
-                    "title": "Оставшиеся моменты",
-                    "text": "После этого гайда сразу идет финальный тест! решай внимательно!)",
-                    "url": "https://docs.google.com/document/d/18ZKfsL12_DpttspiO-0sCR83_-xNBgZ8gsxFf-Fe-q4/edit?usp=sharing",
-                    "test_url": "https://docs.google.com/forms/d/e/1FAIpQLSd3OSHI2tOQINP7jhuQKD3Kbc9A3t2b-nKpoglDGvhIXv9gnw/viewform?usp=header"
-                }
-            ],
-            "letnik": [
-                {"id": "l1", "title": "Летник 1", "url": "https://example.com/l1", "test_url": "https://docs.google.com/forms/d/e/1FAIpQLSf3wh-yOoLOrGYkCaBZ5a0jfOP1dr_8OdbDJ4nHT5ZU9Ws5Wg/viewform?usp=header"},
-                {"id": "l2", "title": "Летник 2", "url": "https://example.com/l2", "test_url": "https://docs.google.com/forms/d/e/1FAIpQLSeOe5IXIKFsclxP0mTSeDdPK_cX1qdtTAtUofjlilu9UGHVyA/viewform?usp=header"},
-                {"id": "l3", "title": "Летник 3", "url": "https://example.com/l3", "test_url": "https://example.com/lt3test"}
-            ],
-            "subjects": ["математика", "информатика", "физика", "русский язык", "обществознание", "биология", "химия"]
+def save_user(uid):
+    """Помечает пользователя изменённым — на диск его запишет STORE в фоне."""
+    with phase("store"):
+        STORE.mark_dirty(uid)
+
+# Встроенные гайды: пишутся в guides.json, если файла ещё нет
+DEFAULT_GUIDES = {
+    "newbie": [
+        {
+            "id": "guide1",
+            "num": 1,
+            "title": "Как построить общение с учеником?",
+            "text": "Обрати внимание, что в гайде есть видео, с которым тоже нужно ознакомиться!",
+            "url": "https://docs.google.com/document/d/1tEiUuP8wAuwsnxQj2qaqpYH_VYj5a-2mNNZG--iv2I4/edit?usp=sharing",
+            "test_url": "https://docs.google.com/forms/d/e/1FAIpQLSf3wh-yOoLOrGYkCaBZ5a0jfOP1dr_8OdbDJ4nHT5ZU9Ws5Wg/viewform?usp=header"
+        },
+        {
+            "id": "guide2",
+            "num": 2,
+            "title": "Технические моменты в работе куратора",
+            "text": "Обрати внимание, что в гайде есть видео, с которыми тоже нужно ознакомиться!!",
+            "url": "https://docs.google.com/document/d/1JH0-6m1ygQ4bTjoWTITXMtqFEXGAvUAgieyD8doK21o/edit?usp=sharing",
+            "test_url": "https://docs.google.com/forms/d/e/1FAIpQLSeOe5IXIKFsclxP0mTSeDdPK_cX1qdtTAtUofjlilu9UGHVyA/viewform?usp=header"
+        },
+        {
+            "id": "guide3",
+            "num": 3,
+            "title": "Как проверять домашние задания + практика",
+            "text": "Переходи по ссылкам, изучай и делай задание! Задание выполняй в файле и потом скидывай своему старшему куратору",
+            "url": "https://docs.google.com/document/d/1gkhcvRV6HydDILnm24jY7ltOKsriM71jdHdzBn2b9VY/edit?usp=sharing",
+            "test_url": "https://docs.google.com/document/d/1NKQRuiJ-almJuSaI3_TLvn-FvIPLv8-EvsGUDL_bMZ8/edit?usp=sharing"
+        },
+        {
+            "id": "guide4",
+            "num": 4,
+            "title": "Оставшиеся моменты",
+            "text": "После этого гайда сразу идет финальный тест! решай внимательно!)",
+            "url": "https://docs.google.com/document/d/18ZKfsL12_DpttspiO-0sCR83_-xNBgZ8gsxFf-Fe-q4/edit?usp=sharing",
+            "test_url": "https://docs.google.com/forms/d/e/1FAIpQLSd3OSHI2tOQINP7jhuQKD3Kbc9A3t2b-nKpoglDGvhIXv9gnw/viewform?usp=header"
         }
-        # сохраняем начальные гайды в файл, чтобы не ругались при следующем запуске
-        _write_json(GUIDES_FILE, data)
-    return data
+    ],
+    "letnik": [
+        {"id": "l1", "title": "Летник 1", "url": "https://example.com/l1", "test_url": "https://docs.google.com/forms/d/e/1FAIpQLSf3wh-yOoLOrGYkCaBZ5a0jfOP1dr_8OdbDJ4nHT5ZU9Ws5Wg/viewform?usp=header"},
+        {"id": "l2", "title": "Летник 2", "url": "https://example.com/l2", "test_url": "https://docs.google.com/forms/d/e/1FAIpQLSeOe5IXIKFsclxP0mTSeDdPK_cX1qdtTAtUofjlilu9UGHVyA/viewform?usp=header"},
+        {"id": "l3", "title": "Летник 3", "url": "https://example.com/l3", "test_url": "https://example.com/lt3test"}
+    ],
+    "subjects": ["математика", "информатика", "физика", "русский язык", "обществознание", "биология", "химия"]
+}
+
+
+STORE = WriteBehindStore(USERS_BACKEND, load_users())
+USERS = STORE.data
+
+# ============== НЕСКОЛЬКО ЭКЗЕМПЛЯРОВ (CLUSTER_MODE=1) ==============
+# Экземпляры делят DATA_DIR: пользователи — в общей users.db, аренды — в cluster.db.
+# Апдейты через вебхук принимает любой экземпляр; рассылки по расписанию и синхронизацию
+# сводки ведёт только лидер.
+LEADER = STORE_SYNC = None
+if CLUSTER_MODE:
+    if not isinstance(USERS_BACKEND, SqliteBackend):
+        raise RuntimeError("CLUSTER_MODE=1 работает только со STORAGE_BACKEND=sqlite")
+    if not WEBHOOK_URL:
+        # getUpdates держит один клиент: в long polling апдейты получал бы только лидер
+        raise RuntimeError("CLUSTER_MODE=1 работает только с WEBHOOK_URL")
+    LEASES = LeaseTable(os.path.join(DATA_DIR, "cluster.db"))
+    LEADER = LeaderElection(LEASES)
+    # чужие изменения: в память и в сводку (её пишет лидер, а апдейт мог обработать другой экземпляр)
+    STORE_SYNC = StoreSync(STORE, prepare=_user_defaults, on_change=gs_upsert_summary,
+                           busy=lambda uid: int(uid) in USER_LOCKS)
+    USER_LOCKS = ClusterUserLocks(USER_LOCKS, LEASES, STORE_SYNC)
+    USER_LOCK_MIDDLEWARE.locks = USER_LOCKS
+    LOG_SINK.archiver = None  # лог пишут все, а «Лог» ротирует только лидер (_roll_log_while_leader)
+
+
+async def _roll_log_while_leader():
+    """Ротация «Лог» у лидера: иначе несколько экземпляров переименуют лист одновременно."""
+    LOG_ARCHIVER.reload()
+    LOG_SINK.archiver = LOG_ARCHIVER
+    try:
+        await asyncio.Event().wait()
+    finally:
+        LOG_SINK.archiver = None
 
 
-USERS = load_users()
-GUIDES = load_guides()
+# Каталог гайдов: индексы по id/роли, перечитывается при изменении guides.json
+GUIDES = GuideCatalog(GUIDES_FILE, DEFAULT_GUIDES)
 
 # Предметные задания для 3-го гайда
 SUBJECT_TASKS = {
@@ -256,62 +345,111 @@ SUBJECT_TASKS = {
 }
 
 # ============== КЛАВИАТУРЫ ==============
+# Клавиатуры и тексты гайдов одинаковы для всех — собираем один раз.
+# Кэш сбрасывается render_cache_clear() при изменении GUIDES.
+_RENDER_CACHE = {}
+
+def _cached(key, build):
+    value = _RENDER_CACHE.get(key)
+    if value is None:
+        value = _RENDER_CACHE[key] = build()
+    return value
+
+def render_cache_clear():
+    _RENDER_CACHE.clear()
+
+GUIDES.listeners.append(render_cache_clear)
+
 def kb_subjects():
-    return InlineKeyboardMarkup(inline_keyboard=[
+    return _cached(("kb", "subjects"), lambda: InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=s.title(), callback_data=f"subject:set:{s}")]
         for s in GUIDES["subjects"]
-    ])
+    ]))
 
 def kb_role():
-    return InlineKeyboardMarkup(inline_keyboard=[
+    return _cached(("kb", "role"), lambda: InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🟢 Я новичок", callback_data="role:newbie")],
         [InlineKeyboardButton(text="🟠 Я летник", callback_data="role:letnik")]
-    ])
+    ]))
 
 def kb_main(role: str):
-    rows = [
-        [InlineKeyboardButton(text="📊 Мой прогресс", callback_data="progress:me")],
-        [InlineKeyboardButton(text="📚 Каталог", callback_data="guides:menu")]
-    ]
-    if role == "letnik":
-        rows.append([InlineKeyboardButton(text="⚡ Все материалы и тесты", callback_data="letnik:all")])
-    return InlineKeyboardMarkup(inline_keyboard=rows)
+    def build():
+        rows = [
+            [InlineKeyboardButton(text="📊 Мой прогресс", callback_data="progress:me")],
+            [InlineKeyboardButton(text="📚 Каталог", callback_data="guides:menu")]
+        ]
+        if role == "letnik":
+            rows.append([InlineKeyboardButton(text="⚡ Все материалы и тесты", callback_data="letnik:all")])
+        return InlineKeyboardMarkup(inline_keyboard=rows)
+    return _cached(("kb", "main", role == "letnik"), build)
 
 def kb_mark_read(guide_id: str):
-    return InlineKeyboardMarkup(inline_keyboard=[
+    return _cached(("kb", "read", guide_id), lambda: InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📖 Отметить прочитанным", callback_data=f"newbie:read:{guide_id}")]
-    ])
+    ]))
 
 def kb_task_button(guide_id: str):
-    return InlineKeyboardMarkup(inline_keyboard=[
+    return _cached(("kb", "task", guide_id), lambda: InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="✅ Я выполнил задание", callback_data=f"newbie:task:{guide_id}")]
-    ])
+    ]))
 
 def kb_final_test():
-    return InlineKeyboardMarkup(inline_keyboard=[
+    return _cached(("kb", "final"), lambda: InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📝 Пройти финальный тест", callback_data="newbie:final")]
-    ])
+    ]))
+
+def kb_letnik_final():
+    return _cached(("kb", "letnik_final"), lambda: InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📝 Пройти финальный тест", callback_data="letnik:final")]
+    ]))
+
+def kb_letnik_final_done():
+    return _cached(("kb", "letnik_final_done"), lambda: InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Я прошёл финальный тест", callback_data="letnik:final:done")]
+    ]))
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 def kb_guide_buttons(guide: dict, user_progress: dict):
     """
     Формирует InlineKeyboard для гайда новичка.
     Теперь только две кнопки: пройти тест и я прошёл тест.
+    Прогресс пользователя только читается — одна клавиатура на (гайд, тест пройден).
     """
     guide_id = guide["id"]
-    prog = user_progress.setdefault(guide_id, {"test_done": False})
+    test_done = bool((user_progress.get(guide_id) or {}).get("test_done"))
 
-    buttons = []
+    def build():
+        buttons = []
 
-    # Кнопка "Пройти тест"
-    if guide.get("test_url"):
-        buttons.append([InlineKeyboardButton(text="📝 Пройти тест", url=guide["test_url"])])
+        # Кнопка "Пройти тест"
+        if guide.get("test_url"):
+            buttons.append([InlineKeyboardButton(text="📝 Пройти тест", url=guide["test_url"])])
 
-    # Кнопка "Я прошёл тест"
-    if not prog["test_done"]:
-        buttons.append([InlineKeyboardButton(text="✅ Я прошёл тест", callback_data=f"testdone:{guide_id}")])
+        # Кнопка "Я прошёл тест"
+        if not test_done:
+            buttons.append([InlineKeyboardButton(text="✅ Я прошёл тест", callback_data=f"testdone:{guide_id}")])
 
-    return InlineKeyboardMarkup(inline_keyboard=buttons)
+        return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+    return _cached(("kb", "guide", guide_id, test_done), build)
+
+def guide_text(guide: dict, current: bool = False):
+    """Текст карточки гайда: «Гайд N» при выдаче, «Текущий гайд #N» в каталоге."""
+    def build():
+        head = f"📘 Текущий гайд #{guide['num']}" if current else f"📘 Гайд {guide['num']}"
+        return f"{head}: {guide['title']}\n\n{guide['text']}\n🔗 {guide.get('url', '')}"
+    return _cached(("text", "guide", guide["id"], current), build)
+
+def letnik_materials_text(with_tests: bool):
+    """Список материалов летника: с тестами — для каталога, без — для «Все материалы»."""
+    def build():
+        if with_tests:
+            lines = [f"• {g['title']} — {g['url']} (тест: {g.get('test_url','—')})" for g in GUIDES["letnik"]]
+            return "⚡ Материалы для летников:\n\n" + "\n".join(lines)
+        lines = ["⚡ Все материалы для летников:"]
+        lines += [f"• <b>{g['title']}</b> — {g['url']}" for g in GUIDES["letnik"]]
+        return "\n".join(lines)
+    return _cached(("text", "letnik", with_tests), build)
 
 
 
@@ -335,7 +473,7 @@ def user(obj):
             "awaiting_subject": False,
             "awaiting_code": False
         }
-        save_users(USERS)
+        save_user(uid)
     return USERS[uid]
 
 
@@ -346,7 +484,7 @@ async def newbie_mark_read(cb: CallbackQuery):
     guide_id = cb.data.split(":")[1]
     prog = u.setdefault("progress", {}).setdefault(guide_id, {"read": False, "task_done": False, "test_done": False})
     prog["read"] = True
-    save_users(USERS)
+    save_user(cb.from_user.id)
     await cb.answer("Прочитано ✅")
     await send_guide(cb.from_user.id)
 
@@ -356,7 +494,7 @@ async def newbie_mark_task(cb: CallbackQuery):
     guide_id = cb.data.split(":")[1]
     prog = u.setdefault("progress", {}).setdefault(guide_id, {"read": True, "task_done": False, "test_done": False})
     prog["task_done"] = True
-    save_users(USERS)
+    save_user(cb.from_user.id)
     await cb.answer("Задание отмечено ✅")
     await send_guide(cb.from_user.id)
 
@@ -365,16 +503,23 @@ async def newbie_mark_task(cb: CallbackQuery):
 async def newbie_test_done(cb: CallbackQuery):
     u = user(cb)
     guide_id = cb.data.split(":")[1]
+    if GUIDES.get(guide_id) is None:
+        # кнопка от гайда, которого уже нет в каталоге
+        await cb.answer("Этот гайд больше недоступен")
+        return
+
+    # Повторное нажатие или кнопка от старого гайда не должны сдвигать индекс ещё раз
+    if GUIDES.position(guide_id) != ("newbie", u.get("guide_index", 0)):
+        await cb.answer("Этот тест уже отмечен ✅")
+        return
 
     # Отмечаем тест как пройденный
     u["progress"].setdefault(guide_id, {})["test_done"] = True
-    save_users(USERS)
-
-    await cb.answer("🎉 Тест отмечен как пройденный!")
-
     # Переходим к следующему гайду
     u["guide_index"] = u.get("guide_index", 0) + 1
-    save_users(USERS)
+    save_user(cb.from_user.id)
+
+    await cb.answer("🎉 Тест отмечен как пройденный!")
 
     items = GUIDES["newbie"]
     if u["guide_index"] >= len(items):
@@ -382,18 +527,14 @@ async def newbie_test_done(cb: CallbackQuery):
     else:
         guide = items[u["guide_index"]]
         kb = kb_guide_buttons(guide, u["progress"])
-        await bot.send_message(
-            cb.from_user.id,
-            f"📘 Гайд {guide['num']}: {guide['title']}\n\n{guide['text']}\n🔗 {guide.get('url', '')}",
-            reply_markup=kb
-        )
+        await bot.send_message(cb.from_user.id, guide_text(guide), reply_markup=kb)
 
 
 @dp.callback_query(F.data == "newbie:final")
 async def newbie_final_test(cb: CallbackQuery):
     u = user(cb)
     u["guide_index"] = len(GUIDES["newbie"])
-    save_users(USERS)
+    save_user(cb.from_user.id)
     await cb.answer("🎉 Поздравляем! Вы прошли все гайды и финальный тест!")
     await bot.send_message(cb.from_user.id, "🏆 Курс завершён! Теперь вы полностью прошли обучение.")
 
@@ -403,7 +544,7 @@ async def newbie_final_test(cb: CallbackQuery):
 async def start(message: Message):
     u = user(message)
     u["awaiting_fio"] = True
-    save_users(USERS)
+    save_user(message.from_user.id)
     await message.answer(
         "👋 Привет! Я бот-куратор.\nНапиши, пожалуйста, свою 🎉фамилию и имя (ФИО)."
     )
@@ -415,7 +556,7 @@ async def subject_set(cb: CallbackQuery):
     subj = cb.data.split(":")[2]
     u["subject"] = subj
     u["awaiting_subject"] = False
-    save_users(USERS)
+    save_user(cb.from_user.id)
     gs_log_event(cb.from_user.id, u.get("fio",""), u.get("role",""), subj, "Предмет выбран")
     gs_upsert_summary(cb.from_user.id, u)
 
@@ -436,7 +577,7 @@ async def role_set(cb: CallbackQuery):
     if role == "letnik":
         u["awaiting_code"] = True
         u["role"] = None  # роль до ввода кода
-        save_users(USERS)
+        save_user(cb.from_user.id)
         await cb.message.answer("🔑 Введи код доступа для летников:")
         await cb.answer()
         return
@@ -445,11 +586,11 @@ async def role_set(cb: CallbackQuery):
     elif role == "newbie":
         u["awaiting_code"] = True
         u["role"] = None  # роль до ввода кода
-        save_users(USERS)
+        save_user(cb.from_user.id)
         await cb.message.answer("🔑 Введи код доступа для новичков:")
         await cb.answer()
         return
-@dp.message(F.text)
+@dp.message(F.text, ~F.text.startswith("/"))  # команды — своим хендлерам (/admin, /tests, /export)
 async def handle_text(message: Message):
     u = user(message)
     uid = message.from_user.id
@@ -461,7 +602,7 @@ async def handle_text(message: Message):
         u["awaiting_fio"] = False
         u["awaiting_subject"] = True
         u.setdefault("status", "Старт обучения")
-        save_users(USERS)
+        save_user(uid)
         gs_log_event(uid, u["fio"], u.get("role",""), u.get("subject",""), "ФИО введено")
         gs_upsert_summary(uid, u)
 
@@ -477,7 +618,7 @@ async def handle_text(message: Message):
             u["awaiting_code"] = False
             u["role"] = "newbie"
             u["status"] = "Новичок (код подтвержден)"
-            save_users(USERS)
+            save_user(uid)
             gs_log_event(uid, u.get("fio",""), "newbie", u.get("subject",""), "Код подтвержден")
             gs_upsert_summary(uid, u)
             await message.answer(
@@ -489,7 +630,7 @@ async def handle_text(message: Message):
             u["awaiting_code"] = False
             u["role"] = "letnik"
             u["status"] = "Летник (код подтвержден)"
-            save_users(USERS)
+            save_user(uid)
             gs_log_event(uid, u.get("fio",""), "letnik", u.get("subject",""), "Код подтвержден")
             gs_upsert_summary(uid, u)
             await message.answer(
@@ -502,7 +643,7 @@ async def handle_text(message: Message):
             return
 
 
-@dp.message(F.text)
+@dp.message(F.text, ~F.text.startswith("/"))  # команды — своим хендлерам (/admin, /tests, /export)
 async def handle_text(message: Message):
     u = user(message)
     uid = message.from_user.id
@@ -514,7 +655,7 @@ async def handle_text(message: Message):
             u["awaiting_code"] = False
             u["role"] = "newbie"
             u["status"] = "Новичок (код подтвержден)"
-            save_users(USERS)
+            save_user(uid)
             gs_log_event(uid, u.get("fio",""), "newbie", u.get("subject",""), "Код подтвержден")
             gs_upsert_summary(uid, u)
             await message.answer("🔓 Код верный. Добро пожаловать, новичок!", reply_markup=kb_main("newbie"))
@@ -523,7 +664,7 @@ async def handle_text(message: Message):
             u["awaiting_code"] = False
             u["role"] = "letnik"
             u["status"] = "Летник (код подтвержден)"
-            save_users(USERS)
+            save_user(uid)
             gs_log_event(uid, u.get("fio",""), "letnik", u.get("subject",""), "Код подтвержден")
             gs_upsert_summary(uid, u)
             await message.answer("🔓 Код верный. Доступ открыт.", reply_markup=kb_main("letnik"))
@@ -567,10 +708,7 @@ async def guides_menu(cb: CallbackQuery):
     u = user(cb)
     if u.get("role") == "letnik":
         # Для летников оставляем старый вариант
-        lines = []
-        for g in GUIDES["letnik"]:
-            lines.append(f"• {g['title']} — {g['url']} (тест: {g.get('test_url','—')})")
-        await cb.message.answer("⚡ Материалы для летников:\n\n" + "\n".join(lines))
+        await cb.message.answer(letnik_materials_text(with_tests=True))
         await cb.answer()
         return
 
@@ -587,46 +725,12 @@ async def guides_menu(cb: CallbackQuery):
     # Показываем текущий гайд с кнопками через kb_guide_buttons
     g = items[idx]
     kb = kb_guide_buttons(g, u["progress"])
-    await cb.message.answer(
-        f"📘 Текущий гайд #{g['num']}: {g['title']}\n\n{g['text']}\n🔗 {g['url']}",
-        reply_markup=kb
-    )
+    await cb.message.answer(guide_text(g, current=True), reply_markup=kb)
     await cb.answer()
 
 
 
 
-async def scheduler_loop():
-    """
-    Планировщик:
-    1) В 14:00 и 22:00 напоминаем новичкам про дедлайн.
-    """
-    await asyncio.sleep(3)  # пауза после запуска
-
-    while True:
-        try:
-            now = _now_msk()
-
-            # 14:00 — напоминание новичкам о дедлайне
-            if now.time().hour == 14 and now.time().minute == 0:
-                for uid, u in USERS.items():
-                    if u.get("role") == "newbie":
-                        await bot.send_message(int(uid), "⏰ Напоминание: сдать задание сегодня до 22:00 МСК!")
-
-            # 22:00 — финальное напоминание (после дедлайна кнопка всё равно блокируется в _is_before_deadline)
-            if now.time().hour == 22 and now.time().minute == 0:
-                for uid, u in USERS.items():
-                    if u.get("role") == "newbie":
-                        await bot.send_message(int(uid), "⏰ Дедлайн наступил. Постарайся сдавать вовремя)!")
-
-            await asyncio.sleep(60)  # проверяем раз в минуту
-        except asyncio.CancelledError:
-            break
-        except Exception as e:
-            print("scheduler loop err:", e)
-            await asyncio.sleep(5)
-
-
 # ============== ХЕНДЛЕРЫ: НОВИЧКИ (прочитал / задание / финал) ==============
 
 
@@ -639,16 +743,10 @@ async def letnik_all(cb: CallbackQuery):
         return
 
     # один список материалов без кнопок
-    lines = ["⚡ Все материалы для летников:"]
-    for g in GUIDES["letnik"]:
-        lines.append(f"• <b>{g['title']}</b> — {g['url']}")
-    await cb.message.answer("\n".join(lines))
+    await cb.message.answer(letnik_materials_text(with_tests=False))
 
     # добавляем только финальный тест
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📝 Пройти финальный тест", callback_data="letnik:final")]
-    ])
-    await cb.message.answer("Когда изучишь материалы — пройди финальный тест:", reply_markup=kb)
+    await cb.message.answer("Когда изучишь материалы — пройди финальный тест:", reply_markup=kb_letnik_final())
 
     gs_log_event(cb.from_user.id, u.get("fio",""), "letnik", u.get("subject",""), "Выданы материалы летнику")
     await cb.answer()
@@ -665,10 +763,7 @@ async def letnik_final(cb: CallbackQuery):
     await cb.message.answer("📝 Финальный тест для летников: https://docs.google.com/forms/d/e/1FAIpQLSd3OSHI2tOQINP7jhuQKD3Kbc9A3t2b-nKpoglDGvhIXv9gnw/viewform?usp=header")
 
     # кнопка «Я прошёл финальный тест»
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✅ Я прошёл финальный тест", callback_data="letnik:final:done")]
-    ])
-    await cb.message.answer("Когда пройдёшь — нажми кнопку ниже.", reply_markup=kb)
+    await cb.message.answer("Когда пройдёшь — нажми кнопку ниже.", reply_markup=kb_letnik_final_done())
     await cb.answer()
 
 
@@ -677,7 +772,7 @@ async def letnik_final_done(cb: CallbackQuery):
     u = user(cb)
     u["status"] = "Обучение завершено (летник)"
     u["finished_at"] = _now_msk().isoformat()
-    save_users(USERS)
+    save_user(cb.from_user.id)
     gs_log_event(cb.from_user.id, u.get("fio",""), "letnik", u.get("subject",""), "Финальный тест пройден (летник)")
     gs_upsert_summary(cb.from_user.id, u)
 
@@ -685,141 +780,464 @@ async def letnik_final_done(cb: CallbackQuery):
     await cb.answer()
 
 
-# ============== КОМАНДЫ АДМИНА ==============
-@dp.message(Command("admin"))
-async def admin_panel(message: Message):
-    if ADMIN_ID and message.from_user.id != ADMIN_ID:
+@dp.message(Command("tz"))
+async def set_timezone(message: Message, command: CommandObject):
+    """/tz +4 — разница с Москвой в часах: гайд приходит около GUIDE_HOUR по своему времени."""
+    u = user(message)
+    arg = (command.args or "").strip().replace("−", "-")
+    try:
+        offset = int(arg)
+    except ValueError:
+        current = int(u.get(DELIVERY_TZ_FIELD) or 0)
+        await message.answer(f"🕗 Сейчас: МСК{current:+d}. Укажи разницу с Москвой в часах, например: /tz +4")
         return
+    if not -12 <= offset <= 14:
+        await message.answer("❌ Разница с Москвой — от -12 до +14 часов.")
+        return
+    u[DELIVERY_TZ_FIELD] = offset
+    save_user(message.from_user.id)
+    # восточнее GUIDE_LEAD и западнее max_behind бот не сдвигает рассылку — гайд придёт позже/раньше
+    hour = GUIDE_HOUR + offset - GUIDE_PLANNER.tz_offset(u)
+    note = ""
+    if hour != GUIDE_HOUR:
+        note = (f" Бот учитывает пояса от МСК{-GUIDE_PLANNER.max_behind:+d} до МСК{GUIDE_LEAD:+d},"
+                f" поэтому у тебя это будет около {hour % 24:02d}:00.")
+    await message.answer(f"✅ Часовой пояс: МСК{offset:+d}. Гайд приходит около {GUIDE_HOUR}:00 по местному времени.{note}")
 
-    total = len(USERS)
-    newbies = [u for u in USERS.values() if u.get("role") == "newbie"]
-    letniki = [u for u in USERS.values() if u.get("role") == "letnik"]
 
-    lines = [
+# ============== КОМАНДЫ АДМИНА ==============
+def _is_admin(user_id: int, personal_data: bool = False) -> bool:
+    """
+    Без ADMIN_ID сводные команды открыты всем, как раньше; команды, отдающие ФИО
+    и прогресс конкретных людей (personal_data=True), без него не работают ни у кого —
+    как /export.csv без ADMIN_TOKEN.
+    """
+    if not ADMIN_ID:
+        return not personal_data
+    return user_id == ADMIN_ID
+
+def _registration_line(uid: str) -> str:
+    u = USERS[uid]
+    return f"{uid}: {u.get('fio','—')} | {u.get('role','—')} | {u.get('subject','—')} | idx={u.get('guide_index',0)}"
+
+def _activity_line(uid: str) -> str:
+    u = USERS[uid]
+    rc, tc, xc = STORE.stats.progress.get(uid, (0, 0, 0))
+    return (f"{uid}: {u.get('fio','—')} | {u.get('role','—')} | {u.get('subject','—')} | "
+            f"прочитано={rc}, заданий={tc}, тестов={xc}, idx={u.get('guide_index',0)}")
+
+def _admin_header():
+    return [
         "🔧 <b>Админ-панель</b>",
-        f"👥 Всего пользователей: <b>{total}</b>",
-        f"🟢 Новичков: <b>{len(newbies)}</b>",
-        f"🟠 Летников: <b>{len(letniki)}</b>",
-        ""
+        f"👥 Всего пользователей: <b>{len(USERS)}</b>",
+        f"🟢 Новичков: <b>{STORE.index.count('role', 'newbie')}</b>",
+        f"🟠 Летников: <b>{STORE.index.count('role', 'letnik')}</b>",
+        "",
+        "🕒 Регистрации (новые сверху):",
     ]
 
-    # Топ последних 10 регистраций
-    last = sorted(USERS.items(), key=lambda kv: kv[1].get("created_at",""), reverse=True)[:10]
-    lines.append("🕒 Последние регистрации:")
-    for uid, u in last:
-        lines.append(f"{uid}: {u.get('fio','—')} | {u.get('role','—')} | {u.get('subject','—')} | idx={u.get('guide_index',0)}")
+def _tests_header():
+    # сводка по выполнению заданий/тестов — счётчики ведёт STORE.stats
+    rt, tt, xt = STORE.stats.totals
+    return ["📑 <b>Сводка по заданиям/тестам</b>",
+            f"Всего: прочитано={rt}, заданий={tt}, тестов={xt}", "",
+            "🕒 Активность (свежие сверху):"]
+
+# вид -> (шапка, упорядоченный индекс из STORE.stats, строка пользователя, размер страницы)
+ADMIN_VIEWS = {
+    "reg": (_admin_header, lambda: STORE.stats.registrations, _registration_line, 10),
+    "act": (_tests_header, lambda: STORE.stats.active, _activity_line, 20),
+}
+
 
-    await message.answer("\n".join(lines))
+def admin_page(view: str, direction: str = "", cursor: str = None):
+    """
+    Текст и клавиатура страницы админского списка. Курсор — uid крайнего
+    пользователя прошлой страницы: «n» — дальше вниз, «p» — назад вверх.
+    """
+    header, index, line, size = ADMIN_VIEWS[view]
+    uids, newer, older = index().page(
+        after=cursor if direction == "n" else None,
+        before=cursor if direction == "p" else None,
+        limit=size,
+    )
+    lines = header() + [line(uid) for uid in uids if uid in USERS]
+    if not uids:
+        lines.append("—")
+    buttons = []
+    if not ADMIN_ID:
+        # без ADMIN_ID видна только первая страница, как раньше: листать всю базу — только админу
+        newer = older = False
+    if uids and newer:
+        buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"adm:{view}:p:{uids[0]}"))
+    if uids and older:
+        buttons.append(InlineKeyboardButton(text="Дальше ▶️", callback_data=f"adm:{view}:n:{uids[-1]}"))
+    kb = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return "\n".join(lines), kb
+
+
+@dp.message(Command("admin"))
+async def admin_panel(message: Message):
+    if not _is_admin(message.from_user.id):
+        return
+    text, kb = admin_page("reg")
+    await message.answer(text, reply_markup=kb)
 
 
 @dp.message(Command("tests"))
 async def admin_tests(message: Message):
-    if ADMIN_ID and message.from_user.id != ADMIN_ID:
+    if not _is_admin(message.from_user.id):
         return
+    text, kb = admin_page("act")
+    await message.answer(text, reply_markup=kb)
+
 
-    # сводка по выполнению заданий/тестов
-    def stats_for(u: dict):
-        prog = u.get("progress", {})
-        done_tasks = sum(1 for v in prog.values() if v.get("task_done"))
-        done_tests = sum(1 for v in prog.values() if v.get("test_done"))
-        read_cnt   = sum(1 for v in prog.values() if v.get("read"))
-        return read_cnt, done_tasks, done_tests
+@dp.callback_query(F.data.startswith("adm:"))
+async def admin_paging(cb: CallbackQuery):
+    if not _is_admin(cb.from_user.id, personal_data=True):
+        await cb.answer()
+        return
+    _, view, direction, cursor = cb.data.split(":", 3)
+    if view not in ADMIN_VIEWS:
+        await cb.answer()
+        return
+    text, kb = admin_page(view, direction, cursor)
+    try:
+        await cb.message.edit_text(text, reply_markup=kb)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):  # повторное нажатие той же кнопки — не ошибка
+            raise
+    finally:
+        await cb.answer()
 
-    lines = ["📑 <b>Сводка по заданиям/тестам</b>", ""]
-    # последние 20 активных
-    active = sorted(USERS.items(), key=lambda kv: kv[1].get("last_guide_sent_at","") or kv[1].get("created_at",""), reverse=True)[:20]
-    for uid, u in active:
-        rc, tc, xc = stats_for(u)
-        lines.append(f"{uid}: {u.get('fio','—')} | {u.get('role','—')} | {u.get('subject','—')} | "
-                     f"прочитано={rc}, заданий={tc}, тестов={xc}, idx={u.get('guide_index',0)}")
 
-    await message.answer("\n".join(lines))
+FIND_LIMIT = 20
+
+@dp.message(Command("find"))
+async def admin_find(message: Message, command: CommandObject):
+    """/find <tg_id | начало или часть ФИО> — поиск по индексам STORE.stats.names."""
+    if not _is_admin(message.from_user.id, personal_data=True):
+        return
+    query = (command.args or "").strip()
+    if not query:
+        await message.answer("🔎 /find <tg_id или ФИО>, например: /find Иван или /find 123456789")
+        return
+    if query.isdigit():
+        uids = [query] if query in USERS else []
+        total = len(uids)
+    else:
+        await STORE.stats.names.ready()
+        uids, total = STORE.stats.names.search(query, FIND_LIMIT)
+    head = f"🔎 «{query}»: найдено {total}"
+    if total > len(uids):
+        head += f", показаны первые {len(uids)}"
+    await message.answer("\n".join([head] + [_activity_line(uid) for uid in uids if uid in USERS]))
+
+
+def _export_guide_ids():
+    return [g["id"] for role in ROLES for g in GUIDES[role]]
+
+def _export_filename():
+    return f"kurator_export_{_now_msk():%Y%m%d_%H%M}.csv"
+
+
+@dp.message(Command("export"))
+async def admin_export(message: Message):
+    """Все пользователи и прогресс по каждому гайду — CSV-документом."""
+    if not _is_admin(message.from_user.id, personal_data=True):
+        return
+    path, n = await export_to_file(USERS, _export_guide_ids(), directory=DATA_DIR)
+    try:
+        await message.answer_document(FSInputFile(path, filename=_export_filename()),
+                                      caption=f"📤 Выгрузка: {n} пользователей")
+    finally:
+        os.remove(path)
 
 # ============== РАСПИСАНИЕ / ЗАДАЧИ ==============
-async def scheduler_loop():
-    """
-    1) Утром (08:00 МСК) выдаём новичкам следующий гайд (по одному в день).
-    2) Если бот рестартовал после 08:00 — «догоняем» и выдаем пропущенное.
-    3) В 14:00 и 22:00 — напоминаем новичкам про дедлайн.
-    """
-    await asyncio.sleep(3)  # пауза после запуска
+async def _send_newbie_guide(uid: int):
+    """Выдаёт новичку текущий гайд и запоминает время выдачи."""
+    # под тем же замком, что и хендлеры: гайд не разъедется с нажатием «Я прошёл тест»
+    async with USER_LOCKS.lock(uid):
+        u = USERS.get(str(uid))
+        if not u:
+            return
+        items = GUIDES["newbie"]
+        idx = u.get("guide_index", 0)
+        if idx >= len(items):
+            return
+        if (u.get("last_guide_sent_at") or "")[:10] == _now_msk().date().isoformat():
+            return  # рассылка растянута на окно: за это время гайд мог уйти из продолженного запуска
+        g = items[idx]
+        await bot.send_message(uid, guide_text(g), reply_markup=kb_guide_buttons(g, u.get("progress") or {}))
+        u["last_guide_sent_at"] = _now_msk().isoformat()
+        save_user(uid)
+
+
+def _newbies_without_guide_today(day=None):
+    """Новички, у которых ещё есть гайды и которым в day (по умолчанию сегодня) гайд не выдан (по индексам STORE)."""
+    uids = STORE.index.query(
+        role="newbie",
+        guide_index=range(len(GUIDES["newbie"])),
+        not_sent_on=(day or _now_msk().date()).isoformat(),
+    )
+    return [int(uid) for uid in uids]
+
 
-    # Догоним утро, если рестартнули после 08:00 и ещё не слали сегодня
+def _newbies():
+    return [int(uid) for uid in STORE.index.query(role="newbie")]
+
+
+def _text_sender(text: str):
+    async def send(uid: int):
+        await bot.send_message(uid, text)
+    return send
+
+
+# Рассылки растягиваются на окно (DELIVERY_WINDOW_MIN) с постоянным смещением у каждого пользователя.
+# Гайд учитывает tz_offset пользователя: в GUIDE_HOUR по его времени; поэтому задача гайда стартует
+# на GUIDE_LEAD часов раньше. Напоминания и дедлайн привязаны к МСК.
+GUIDE_LEAD = min(DELIVERY_MAX_TZ_AHEAD, GUIDE_HOUR)  # не раньше полуночи — «сегодня» у гайда одно
+GUIDE_PLANNER = DeliveryPlanner(tz=True, max_ahead=GUIDE_LEAD)
+NOTICE_PLANNER = DeliveryPlanner()
+
+
+async def job_guide():
+    """GUIDE_HOUR — выдача гайда новичкам (по одному в день)."""
     now = _now_msk()
-    if now.time() >= time(GUIDE_HOUR, 0):
-        for uid, u in USERS.items():
-            if u.get("role") != "newbie":
-                continue
-            if _was_sent_today(u):
-                continue
-            try:
-                await _send_newbie_guide(int(uid))
-            except Exception as e:
-                print("scheduler catch-up err:", e)
+    base = nominal(now, GUIDE_HOUR, lead_hours=GUIDE_LEAD)
+    uids = _newbies_without_guide_today(base.date())
+    await broadcast(uids, _send_newbie_guide, name="guide",
+                    at=GUIDE_PLANNER.plan(USERS, uids, base, now, "guide"))
 
-    # Основной цикл
-    while True:
-        try:
-            now = _now_msk()
-
-            # 08:00 — выдача гайда новичкам
-            if now.time().hour == GUIDE_HOUR and now.time().minute == 0:
-                for uid, u in USERS.items():
-                    if u.get("role") != "newbie":
-                        continue
-                    if _was_sent_today(u):
-                        continue
-                    await _send_newbie_guide(int(uid))
-
-            # 14:00 — напоминание новичкам о дедлайне
-            if now.time().hour == 14 and now.time().minute == 0:
-                for uid, u in USERS.items():
-                    if u.get("role") == "newbie":
-                        await bot.send_message(int(uid), "⏰ Напоминание: сдать задание сегодня до 22:00 МСК!")
-
-            # 22:00 — финальное напоминание (и закрытие кнопок мы контролируем проверкой времени)
-            if now.time().hour == 22 and now.time().minute == 0:
-                for uid, u in USERS.items():
-                    if u.get("role") == "newbie":
-                        await bot.send_message(int(uid), "⏰ Дедлайн наступил! Постарайся сдавать до 22:00, чтобы быть в ритме обучения 😉.")
-
-            await asyncio.sleep(60)  # проверяем раз в минуту
-        except asyncio.CancelledError:
-            break
-        except Exception as e:
-            print("scheduler loop err:", e)
-            await asyncio.sleep(5)
+
+async def job_remind(hour: int):
+    """REMIND_HOURS — напоминание новичкам о дедлайне."""
+    now = _now_msk()
+    uids = _newbies()
+    await broadcast(uids, _text_sender(f"⏰ Напоминание: сдать задание сегодня до {DEADLINE_HOUR}:00 МСК!"),
+                    name="remind", at=NOTICE_PLANNER.plan(USERS, uids, nominal(now, hour), now, "remind"))
+
+
+async def job_deadline():
+    """DEADLINE_HOUR — финальное напоминание (закрытие кнопок контролируем проверкой времени)."""
+    now = _now_msk()
+    uids = _newbies()
+    await broadcast(uids, _text_sender(f"⏰ Дедлайн наступил! Постарайся сдавать до {DEADLINE_HOUR}:00, чтобы быть в ритме обучения 😉."),
+                    name="deadline", at=NOTICE_PLANNER.plan(USERS, uids, nominal(now, DEADLINE_HOUR), now, "deadline"))
+
+
+SCHEDULER = Scheduler(MSK, os.path.join(DATA_DIR, "scheduler.json"))
+# гайд, пропущенный из-за рестарта, догоняем до дедлайна; напоминания — до дедлайна; сам дедлайн не догоняем.
+# Гайд ещё и продолжается, если рестарт пришёлся на окно доставки: кому уже выдан — пропускаются
+SCHEDULER.add_daily("guide", GUIDE_HOUR, job_guide, catch_up=timedelta(hours=DEADLINE_HOUR - GUIDE_HOUR + GUIDE_LEAD),
+                    lead=timedelta(hours=GUIDE_LEAD), resumable=True)
+for h in REMIND_HOURS:
+    if h != DEADLINE_HOUR:
+        SCHEDULER.add_daily(f"remind_{h}", h, partial(job_remind, h), catch_up=timedelta(hours=max(DEADLINE_HOUR - h, 0)))
+SCHEDULER.add_daily("deadline", DEADLINE_HOUR, job_deadline)
 
 # ============== ВЕБ-СЕРВЕР ДЛЯ RENDER ==============
 async def handle_root(request):
     return web.Response(text="kurator-bot ok")
 
 async def handle_health(request):
-    return web.json_response({"status": "ok", "ts": _now_msk().isoformat()})
+    # Google Sheets не обязательны для работы бота: без них статус degraded, но 200
+    sheets = SHEETS.status()
+    body = {
+        "status": "ok" if sheets["state"] == "ready" else "degraded",
+        "ts": _now_msk().isoformat(),
+        "sheets": sheets,
+    }
+    if LEADER is not None:
+        body["cluster"] = LEADER.status()
+    return web.json_response(body)
+
+async def handle_metrics(request):
+    return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+# ---- метрики «сейчас»: считаются в момент запроса /metrics ----
+REGISTRY.gauge("kurator_users", "Пользователи по роли", ("role",),
+               collect=lambda: {(r or "",): n for r, n in STORE.index.values("role").items()})
+REGISTRY.gauge("kurator_users_by_status", "Пользователи по статусу", ("status",),
+               collect=lambda: {(st or "",): n for st, n in STORE.index.values("status").items()})
+REGISTRY.gauge("kurator_store_pending_users", "Изменённые пользователи, ещё не записанные на диск",
+               collect=lambda: {(): STORE.pending})
+REGISTRY.gauge("kurator_sheets_log_queue", "Строки лога в очереди на запись в Google Sheets",
+               collect=lambda: {(): LOG_SINK.queue.qsize()})
+REGISTRY.gauge("kurator_sheets_log_spooled_rows", "Строки лога, ушедшие в spool-файл с момента старта",
+               collect=lambda: {(): LOG_SINK.stats["spooled"]})
+REGISTRY.gauge("kurator_sheets_up", "1 — Google Sheets подключены и отвечают",
+               collect=lambda: {(): int(SHEETS.state == "ready")})
+REGISTRY.gauge("kurator_sheets_summary_pending", "Строки сводки, ждущие синхронизации",
+               collect=lambda: {(): SUMMARY_SYNC.snapshot()["pending"]})
+REGISTRY.gauge("kurator_user_locks", "Пользователи, чьи апдейты сейчас обрабатываются или ждут",
+               collect=lambda: {(): len(USER_LOCKS)})
+
+# ---- служебные маршруты: медленные апдейты и профилировщик ----
+PROFILER = Sampler()
+
+def _admin_ok(request) -> bool:
+    if not ADMIN_TOKEN:
+        return False
+    auth = request.headers.get("Authorization", "")
+    return hmac.compare_digest(auth.encode(), f"Bearer {ADMIN_TOKEN}".encode())
+
+async def handle_debug_slow(request):
+    if not _admin_ok(request):
+        raise web.HTTPForbidden()
+    return web.json_response({"threshold_ms": SLOW_LOG.threshold_ms, "updates": list(SLOW_LOG.recent)})
+
+async def handle_debug_profile(request):
+    """GET /debug/profile?seconds=10 — стеки event loop в свёрнутом формате (для flamegraph)."""
+    if not PROFILER_ENABLED:
+        raise web.HTTPNotFound()
+    if not _admin_ok(request):
+        raise web.HTTPForbidden()
+    try:
+        seconds = float(request.query.get("seconds", "10"))
+    except ValueError:
+        raise web.HTTPBadRequest(text="seconds: нужно число")
+    try:
+        stacks = await asyncio.to_thread(PROFILER.sample, threading.get_ident(), seconds)
+    except RuntimeError as e:
+        raise web.HTTPConflict(text=str(e))
+    return web.Response(text=Sampler.folded(stacks))
+
+async def handle_export(request):
+    """GET /export.csv — то же, что /export, потоком в HTTP-ответ."""
+    if not _admin_ok(request):
+        raise web.HTTPForbidden()
+    resp = web.StreamResponse(headers={
+        "Content-Type": "text/csv; charset=utf-8",
+        "Content-Disposition": f'attachment; filename="{_export_filename()}"',
+    })
+    await resp.prepare(request)
+
+    async def write(chunk: str):
+        await resp.write(chunk.encode("utf-8"))  # ждёт, пока клиент заберёт предыдущее
+
+    await stream_csv(USERS, _export_guide_ids(), write, target="http")
+    await resp.write_eof()
+    return resp
 
 async def start_web_app():
     app = web.Application()
     app.add_routes([
         web.get("/", handle_root),
         web.get("/health", handle_health),
+        web.get("/metrics", handle_metrics),
+        web.get("/debug/slow", handle_debug_slow),
+        web.get("/debug/profile", handle_debug_profile),
+        web.get("/export.csv", handle_export),
     ])
+    if WEBHOOK_URL:
+        # апдейты от Telegram; проверяем X-Telegram-Bot-Api-Secret-Token,
+        # каждый апдейт обрабатывается своей задачей — ответ Telegram сразу
+        SimpleRequestHandler(
+            dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET, handle_in_background=True
+        ).register(app, path=WEBHOOK_PATH)
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, "0.0.0.0", PORT)
     await site.start()
+    return runner
+
+
+async def run_webhook():
+    """
+    Ставит вебхук и следит за ним. Возвращает управление, если вебхук
+    пропал или Telegram не может до нас достучаться — тогда main переходит на polling.
+    """
+    url = WEBHOOK_URL + WEBHOOK_PATH
+    await bot.set_webhook(
+        url,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    print("🌐 Режим вебхука:", url)
+    while True:
+        await asyncio.sleep(WEBHOOK_CHECK_INTERVAL)
+        try:
+            info = await bot.get_webhook_info()
+        except Exception as e:
+            print("⚠️ getWebhookInfo err:", e)
+            continue
+        if info.url != url:
+            print("⚠️ Вебхук снят:", info.url or "—")
+            return
+        if info.last_error_date and info.pending_update_count > WEBHOOK_MAX_PENDING:
+            last_error = info.last_error_date
+            if last_error.tzinfo is None:
+                last_error = last_error.replace(tzinfo=timezone.utc)
+            age = (datetime.now(timezone.utc) - last_error).total_seconds()
+            if age < WEBHOOK_CHECK_INTERVAL:
+                print("⚠️ Telegram не может доставить вебхук:", info.last_error_message)
+                return
+
+async def wait_for_stop():
+    """Ждёт SIGTERM/SIGINT — когда polling у этого экземпляра может и не идти."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
 
 # ============== MAIN ==============
 async def main():
     print("Бот запускается...")
 
-    # поднимаем лёгкий веб-сервис (чтобы Render видел открытый порт)
-    asyncio.create_task(start_web_app())
+    # поднимаем лёгкий веб-сервис (чтобы Render видел открытый порт; в режиме вебхука сюда же идут апдейты)
+    await start_web_app()
+
+    # запускаем планировщик и слежение за guides.json;
+    # при нескольких экземплярах планировщик и сводка — только у лидера, иначе рассылки уйдут N раз
+    asyncio.create_task(GUIDES.watch())
+    if CLUSTER_MODE:
+        LEADER.while_leader(SCHEDULER.run)
+        LEADER.while_leader(SUMMARY_SYNC.run)
+        LEADER.while_leader(_roll_log_while_leader)
+        LEADER.start()
+        STORE_SYNC.start()
+    else:
+        asyncio.create_task(SCHEDULER.run())
 
-    # запускаем планировщик
-    asyncio.create_task(scheduler_loop())
+    # фоновая запись пользователей на диск и лога в Google Sheets;
+    # к Sheets подключаемся в фоне — polling стартует, не дожидаясь Google
+    SHEETS.start()
+    STORE.start()
+    LOG_SINK.start()
+    if not CLUSTER_MODE:
+        SUMMARY_SYNC.start()
 
-    # запускаем бота (главный цикл)
-    await dp.start_polling(bot)
+    # запускаем бота (главный цикл): вебхук, если задан WEBHOOK_URL, иначе / при сбое — polling
+    try:
+        if WEBHOOK_URL:
+            try:
+                await run_webhook()
+            except Exception as e:
+                print("⚠️ Вебхук не работает:", e)
+            print("↩️ Переходим на long polling")
+        await bot.delete_webhook()
+        if CLUSTER_MODE:
+            # вебхук не поднялся: getUpdates держит только один клиент — polling идёт у лидера,
+            # остальные в резерве
+            LEADER.while_leader(lambda: dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+            await wait_for_stop()
+        else:
+            await dp.start_polling(bot)
+    finally:
+        # дописываем всё, что накопилось за последнее окно
+        if CLUSTER_MODE:
+            was_leader = LEADER.is_leader
+            await STORE_SYNC.close()
+            await LEADER.close()  # лидерство переходит к другому экземпляру сразу
+        await STORE.close()
+        await LOG_SINK.close()
+        if not CLUSTER_MODE or was_leader:
+            await SUMMARY_SYNC.close()
+        await SHEETS.close()
 
 
 if __name__ == "__main__":
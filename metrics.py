@@ -0,0 +1,187 @@
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+# границы бакетов гистограмм по умолчанию, сек
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _num(v) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels=()):
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self._values = {}  # кортеж значений меток -> значение
+        self._lock = threading.Lock()  # пишут и из потоков asyncio.to_thread
+
+    def _key(self, labels: dict):
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.label_names, k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    """
+    Значение «сейчас». Либо set() из кода, либо collect — функция,
+    которая при каждом чтении /metrics возвращает {значения меток (кортеж): число}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labels=(), collect=None):
+        super().__init__(name, doc, labels)
+        self.collect = collect
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self):
+        if self.collect is not None:
+            values = {tuple(str(x) for x in k): v for k, v in self.collect().items()}
+            with self._lock:
+                self._values = values
+        return super().render()
+
+
+class Histogram(_Metric):
+    """Распределение величины (длительность, размер) по накопительным бакетам."""
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, (list(e[0]), e[1], e[2])) for k, e in self._values.items())
+        lines = self.header()
+        for key, (counts, total, n) in items:
+            acc = 0
+            for bound, c in zip(self.buckets, counts):
+                acc += c
+                le = _labels(self.label_names, key, [f'le="{_num(bound)}"'])
+                lines.append(f"{self.name}_bucket{le} {acc}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_num(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {n}")
+        return lines
+
+
+class Registry:
+    """Набор метрик процесса; render() отдаёт текстовый формат Prometheus для /metrics."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, doc, labels=()):
+        return self._add(Counter(name, doc, labels))
+
+    def gauge(self, name, doc, labels=(), collect=None):
+        return self._add(Gauge(name, doc, labels, collect))
+
+    def histogram(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, doc, labels, buckets))
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines += metric.render()
+            except Exception as e:
+                # одна сломанная collect-функция не должна ронять весь /metrics
+                lines.append(f"# {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ---- метрики, которые пишут несколько модулей ----
+SHEETS_REQUESTS = REGISTRY.counter(
+    "kurator_sheets_requests_total", "Запросы к Google Sheets по методу и результату", ("method", "outcome"))
+SHEETS_LATENCY = REGISTRY.histogram(
+    "kurator_sheets_request_seconds", "Длительность запросов к Google Sheets", ("method",))
+
+
+def sheets_call(method: str, fn, *args, **kwargs):
+    """Вызывает метод gspread, считая запрос и его длительность (outcome=ok|error)."""
+    t0 = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    except Exception:
+        SHEETS_REQUESTS.inc(method=method, outcome="error")
+        SHEETS_LATENCY.observe(time.perf_counter() - t0, method=method)
+        raise
+    SHEETS_REQUESTS.inc(method=method, outcome="ok")
+    SHEETS_LATENCY.observe(time.perf_counter() - t0, method=method)
+    return result
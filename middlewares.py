@@ -0,0 +1,110 @@
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from metrics import REGISTRY
+from profiling import CURRENT, UpdateTiming, add_phase
+
+HANDLER_CALLS = REGISTRY.counter(
+    "kurator_handler_calls_total", "Вызовы хендлеров aiogram по результату (ok|error)", ("handler", "outcome"))
+HANDLER_SECONDS = REGISTRY.histogram(
+    "kurator_handler_seconds", "Длительность хендлеров aiogram", ("handler",))
+UPDATE_SECONDS = REGISTRY.histogram(
+    "kurator_update_seconds", "Время апдейта целиком (phase=total) и по фазам", ("phase",))
+TELEGRAM_SECONDS = REGISTRY.histogram(
+    "kurator_telegram_request_seconds", "Длительность запросов к Bot API", ("method",))
+
+
+def _describe(update) -> str:
+    """Команда или callback_data апдейта; текст пользователя в лог не пишем."""
+    if update.callback_query is not None:
+        return update.callback_query.data or ""
+    message = update.message
+    if message is not None and message.text:
+        return message.text.split()[0] if message.text.startswith("/") else "<text>"
+    return ""
+
+
+class UpdateTimingMiddleware(BaseMiddleware):
+    """
+    Самая внешняя middleware на dp.update: время апдейта целиком с разбивкой
+    по фазам (ожидание замка пользователя, Bot API, запись, Sheets; остальное —
+    логика хендлера). Апдейты дольше порога уходят в slow_log.
+    """
+
+    def __init__(self, slow_log):
+        self.slow_log = slow_log
+
+    async def __call__(self, handler, event, data):
+        rec = UpdateTiming()
+        rec.update_id = event.update_id
+        rec.kind = event.event_type
+        from_user = data.get("event_from_user")
+        rec.user_id = from_user.id if from_user else None
+        rec.payload = _describe(event)
+        token = CURRENT.set(rec)
+        try:
+            return await handler(event, data)
+        finally:
+            CURRENT.reset(token)
+            total = time.perf_counter() - rec.started
+            UPDATE_SECONDS.observe(total, phase="total")
+            for name, seconds in rec.phases.items():
+                UPDATE_SECONDS.observe(seconds, phase=name)
+            self.slow_log.record(rec, total)
+
+
+class TelegramTimingMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время каждого запроса к Bot API (в метрики и в фазу telegram)."""
+
+    async def __call__(self, make_request, bot, method):
+        t0 = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            elapsed = time.perf_counter() - t0
+            TELEGRAM_SECONDS.observe(elapsed, method=type(method).__name__)
+            add_phase("telegram", elapsed)
+
+
+class UserLockMiddleware(BaseMiddleware):
+    """
+    Outer-middleware на dp.update: апдейты одного пользователя обрабатываются
+    по очереди (через KeyedLocks), апдейты разных пользователей — параллельно.
+    """
+
+    def __init__(self, locks):
+        self.locks = locks
+
+    async def __call__(self, handler, event, data):
+        from_user = data.get("event_from_user")
+        if from_user is None:
+            return await handler(event, data)
+        t0 = time.perf_counter()
+        async with self.locks.lock(from_user.id):
+            add_phase("lock_wait", time.perf_counter() - t0)
+            return await handler(event, data)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Inner-middleware на dp.message / dp.callback_query: число вызовов и
+    длительность каждого хендлера (по имени функции) для /metrics.
+    """
+
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__name__
+        rec = CURRENT.get()
+        if rec is not None:
+            rec.handler = name
+        t0 = time.perf_counter()
+        try:
+            result = await handler(event, data)
+        except Exception:
+            HANDLER_CALLS.inc(handler=name, outcome="error")
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - t0, handler=name)
+        HANDLER_CALLS.inc(handler=name, outcome="ok")
+        return result
@@ -0,0 +1,137 @@
+import os
+import sys
+import json
+import time
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+SLOW_UPDATE_MS = float(os.getenv("SLOW_UPDATE_MS", "500"))     # апдейты дольше — в slow-лог
+SLOW_LOG_KEEP = int(os.getenv("SLOW_LOG_KEEP", "200"))          # последних медленных апдейтов в памяти
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"    # разрешить сэмплирующий профилировщик
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.005"))  # сек между снимками стека
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+
+# ====== Фазы обработки апдейта ======
+# Запись текущего апдейта: outer-middleware кладёт сюда словарь, phase() добавляет в него время.
+# Задачи, созданные внутри хендлера, получают копию контекста — и тот же словарь.
+CURRENT = ContextVar("kurator_update_timing", default=None)
+
+
+class UpdateTiming:
+    """Время одного апдейта по фазам (сек) и то, чем он был: хендлер, команда, callback_data."""
+
+    __slots__ = ("started", "phases", "handler", "kind", "user_id", "update_id", "payload")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = Counter()
+        self.handler = ""
+        self.kind = ""
+        self.user_id = None
+        self.update_id = None
+        self.payload = ""
+
+
+def add_phase(name: str, seconds: float):
+    rec = CURRENT.get()
+    if rec is not None:
+        rec.phases[name] += seconds
+
+
+@contextmanager
+def phase(name: str):
+    """Засчитывает время блока в фазу name текущего апдейта (вне апдейта — ничего не делает)."""
+    rec = CURRENT.get()
+    if rec is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        rec.phases[name] += time.perf_counter() - t0
+
+
+# ====== Лог медленных апдейтов ======
+class SlowLog:
+    """
+    Медленные апдейты: JSON-строка на апдейт в файл (data/slow.log)
+    и последние keep записей в памяти для админского HTTP-маршрута.
+    """
+
+    def __init__(self, path: str, threshold_ms: float = SLOW_UPDATE_MS, keep: int = SLOW_LOG_KEEP):
+        self.path = path
+        self.threshold_ms = threshold_ms
+        self.recent = deque(maxlen=keep)
+        self.written = 0
+
+    def record(self, rec: UpdateTiming, total: float):
+        total_ms = total * 1000
+        if total_ms < self.threshold_ms:
+            return None
+        phases = {k: round(v * 1000, 1) for k, v in rec.phases.items()}
+        phases["handler"] = round(max(total_ms - sum(phases.values()), 0.0), 1)
+        entry = {
+            "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "update_id": rec.update_id,
+            "user_id": rec.user_id,
+            "kind": rec.kind,
+            "handler": rec.handler,
+            "payload": rec.payload,
+            "total_ms": round(total_ms, 1),
+            "phases_ms": phases,
+        }
+        self.recent.append(entry)
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.written += 1
+        except OSError as e:
+            print("⚠️ slow log err:", e)
+        return entry
+
+
+# ====== Сэмплирующий профилировщик ======
+class Sampler:
+    """
+    Раз в interval секунд снимает стек потока event loop и копит стеки
+    в «свёрнутом» формате (func;func;func N) — его понимают flamegraph.pl и speedscope.
+    Работает только по запросу и не дольше max_seconds; в обычном режиме ничего не стоит.
+    """
+
+    def __init__(self, interval: float = PROFILER_INTERVAL, max_seconds: float = PROFILER_MAX_SECONDS):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self._busy = threading.Lock()
+
+    @staticmethod
+    def _stack(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def sample(self, thread_id: int, seconds: float) -> Counter:
+        """Блокирующий сбор (вызывать из отдельного потока); один сбор за раз."""
+        if not self._busy.acquire(blocking=False):
+            raise RuntimeError("профилировщик уже запущен")
+        stacks = Counter()
+        try:
+            deadline = time.monotonic() + min(seconds, self.max_seconds)
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    stacks[self._stack(frame)] += 1
+                time.sleep(self.interval)
+        finally:
+            self._busy.release()
+        return stacks
+
+    @staticmethod
+    def folded(stacks: Counter) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in stacks.most_common())
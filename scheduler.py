@@ -0,0 +1,150 @@
+import os
+import json
+import heapq
+import asyncio
+import itertools
+from datetime import datetime, timedelta, time
+
+
+class DailyJob:
+    """
+    Задача, которая запускается каждый день в hour:minute (минус lead — если
+    рассылке нужно начать раньше планового времени, например ради часовых поясов).
+    """
+
+    def __init__(self, name: str, hour: int, minute: int, func, catch_up: timedelta = None,
+                 lead: timedelta = None, resumable: bool = False):
+        self.name = name
+        start = (hour * 60 + minute - int((lead or timedelta()).total_seconds() // 60)) % (24 * 60)
+        self.at = time(start // 60, start % 60)
+        self.func = func            # async def func()
+        self.catch_up = catch_up    # сколько после пропущенного запуска ещё можно догнать (None — не догоняем)
+        self.resumable = resumable  # прерванный запуск можно повторить (задача сама пропускает сделанное)
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Ближайший запуск строго после moment."""
+        fire = datetime.combine(moment.date(), self.at, tzinfo=moment.tzinfo)
+        if fire <= moment:
+            fire += timedelta(days=1)
+        return fire
+
+    def last_due(self, moment: datetime) -> datetime:
+        """Последний плановый запуск не позже moment."""
+        fire = datetime.combine(moment.date(), self.at, tzinfo=moment.tzinfo)
+        if fire > moment:
+            fire -= timedelta(days=1)
+        return fire
+
+
+class Scheduler:
+    """
+    Планировщик на min-heap: спит ровно до ближайшей задачи, а не опрашивает часы раз в минуту.
+    Время последнего запуска каждой задачи хранится в state_path,
+    поэтому пропущенный (пока бот лежал) запуск догоняется один раз после рестарта.
+    Там же — последний завершённый запуск: у resumable-задач запуск, прерванный
+    рестартом (рассылка растянута на окно), после рестарта продолжается.
+    """
+
+    def __init__(self, tz, state_path: str):
+        self.tz = tz
+        self.state_path = state_path
+        self.jobs = {}
+        self._heap = []
+        self._seq = itertools.count()  # чтобы heap не сравнивал DailyJob при равном времени
+        self._running = set()
+        self.last_fired, self.completed = self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return {}, {}
+        except Exception as e:
+            print("⚠️ scheduler state err:", e)
+            return {}, {}
+        done = {k: datetime.fromisoformat(v) for k, v in raw.pop("_done", {}).items()}
+        return {k: datetime.fromisoformat(v) for k, v in raw.items()}, done
+
+    def _save_state(self):
+        tmp = self.state_path + ".tmp"
+        state = {k: v.isoformat() for k, v in self.last_fired.items()}
+        state["_done"] = {k: v.isoformat() for k, v in self.completed.items()}
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    def now(self) -> datetime:
+        return datetime.now(self.tz)
+
+    def add_daily(self, name: str, hour: int, func, minute: int = 0, catch_up: timedelta = None,
+                  lead: timedelta = None, resumable: bool = False):
+        self.jobs[name] = DailyJob(name, hour, minute, func, catch_up, lead, resumable)
+
+    def _push(self, job: DailyJob, fire: datetime):
+        heapq.heappush(self._heap, (fire, next(self._seq), job))
+
+    def _fire(self, job: DailyJob, due: datetime):
+        self.last_fired[job.name] = due
+        try:
+            self._save_state()
+        except Exception as e:
+            print("⚠️ scheduler state err:", e)
+        # задача идёт своим таском — долгая рассылка не задерживает следующие
+        task = asyncio.create_task(self._run_job(job, due))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run_job(self, job: DailyJob, due: datetime):
+        late = (self.now() - due).total_seconds()
+        print(f"⏰ {job.name}: запуск за {due:%Y-%m-%d %H:%M} (опоздание {late:.0f}с)")
+        try:
+            await job.func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"scheduler job {job.name} err:", e)
+            return
+        self.completed[job.name] = due
+        try:
+            self._save_state()
+        except Exception as e:
+            print("⚠️ scheduler state err:", e)
+
+    def _catch_up(self, now: datetime):
+        for job in self.jobs.values():
+            if job.catch_up is None:
+                continue
+            due = job.last_due(now)
+            last = self.last_fired.get(job.name)
+            missed = last is None or last < due
+            done = self.completed.get(job.name)
+            interrupted = job.resumable and last == due and (done is None or done < due)
+            if (missed or interrupted) and now - due <= job.catch_up:
+                self._fire(job, due)
+
+    async def run(self, start_delay: float = 3):
+        await asyncio.sleep(start_delay)  # пауза после запуска
+        # состояние перечитываем: при нескольких экземплярах запуски мог делать прошлый лидер
+        self.last_fired, self.completed = self._load_state()
+        self._heap = []
+        now = self.now()
+        self._catch_up(now)
+        for job in self.jobs.values():
+            self._push(job, job.next_after(now))
+
+        try:
+            while self._heap:
+                fire, _, job = self._heap[0]
+                delay = (fire - self.now()).total_seconds()
+                if delay > 0:
+                    # спим до ближайшей задачи (не больше часа — на случай перевода системных часов)
+                    await asyncio.sleep(min(delay, 3600))
+                    continue
+                heapq.heappop(self._heap)
+                self._fire(job, fire)
+                self._push(job, job.next_after(fire))
+        except asyncio.CancelledError:
+            for task in list(self._running):
+                task.cancel()
+            raise
@@ -0,0 +1,129 @@
+import os
+import time
+import asyncio
+import threading
+from datetime import datetime, timezone
+
+import gspread
+import requests
+from google.oauth2.service_account import Credentials
+from google.auth.transport.requests import AuthorizedSession, Request
+
+from metrics import REGISTRY, sheets_call
+
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets",
+          "https://www.googleapis.com/auth/drive"]
+
+SHEETS_POOL_SIZE = int(os.getenv("SHEETS_POOL_SIZE", "8"))               # keep-alive соединений к googleapis
+SHEETS_MAX_CONCURRENCY = int(os.getenv("SHEETS_MAX_CONCURRENCY", "4"))   # одновременных запросов к Sheets
+SHEETS_TIMEOUT = float(os.getenv("SHEETS_TIMEOUT", "30"))                # сек на один запрос
+SHEETS_REFRESH_MARGIN = float(os.getenv("SHEETS_REFRESH_MARGIN", "600"))  # обновлять токен за столько сек до истечения
+
+SLOT_WAIT = REGISTRY.histogram(
+    "kurator_sheets_slot_wait_seconds", "Ожидание свободного слота перед запросом к Sheets", ("method",))
+IN_FLIGHT = REGISTRY.gauge("kurator_sheets_in_flight", "Запросы к Sheets, выполняющиеся сейчас")
+TOKEN_REFRESHES = REGISTRY.counter(
+    "kurator_sheets_token_refreshes_total", "Обновления OAuth-токена Sheets (outcome=ok|error)", ("outcome",))
+
+
+class SheetsClient:
+    """
+    Общий клиент Google Sheets: одна AuthorizedSession с пулом keep-alive
+    соединений, токен обновляется в фоне заранее (за refresh_margin секунд
+    до истечения), а не первым запросом после истечения. call() ограничивает
+    число одновременных запросов и считает ожидание и длительность по методу.
+    """
+
+    def __init__(self, info: dict, scopes=SCOPES, pool_size=SHEETS_POOL_SIZE,
+                 max_concurrency=SHEETS_MAX_CONCURRENCY, timeout=SHEETS_TIMEOUT,
+                 refresh_margin=SHEETS_REFRESH_MARGIN):
+        self.credentials = Credentials.from_service_account_info(info, scopes=scopes)
+        self.refresh_margin = refresh_margin
+        # отдельная сессия для запросов токена, чтобы обновление не занимало пул API
+        token_session = requests.Session()
+        token_session.mount("https://", requests.adapters.HTTPAdapter(max_retries=3))
+        self._token_request = Request(token_session)
+        self.session = AuthorizedSession(self.credentials, auth_request=self._token_request)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.gc = gspread.Client(auth=None, session=self.session)
+        self.gc.http_client.set_timeout(timeout)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._refresh_lock = threading.Lock()
+        self._count_lock = threading.Lock()
+        self._in_flight = 0
+        self._task = None
+        self.refreshed_at = None
+        self.last_refresh_error = ""
+        IN_FLIGHT.collect = lambda: {(): self._in_flight}
+
+    # ---- токен ----
+    def refresh(self):
+        """Синхронно получает новый токен (в потоке)."""
+        with self._refresh_lock:
+            try:
+                self.credentials.refresh(self._token_request)
+            except Exception as e:
+                self.last_refresh_error = str(e)
+                TOKEN_REFRESHES.inc(outcome="error")
+                raise
+            self.refreshed_at = time.time()
+            TOKEN_REFRESHES.inc(outcome="ok")
+
+    def seconds_left(self):
+        """Сколько секунд до истечения токена (None — токена ещё нет)."""
+        expiry = self.credentials.expiry
+        if not self.credentials.token or expiry is None:
+            return None
+        return (expiry.replace(tzinfo=timezone.utc) - datetime.now(timezone.utc)).total_seconds()
+
+    async def keep_fresh(self):
+        """Фоновая задача: обновляет токен до истечения; при ошибке повторяет через минуту."""
+        while True:
+            left = self.seconds_left()
+            if left is None or left <= self.refresh_margin:
+                try:
+                    await asyncio.to_thread(self.refresh)
+                except Exception as e:
+                    print("⚠️ Sheets: токен не обновлён:", e)
+                    await asyncio.sleep(60)
+                continue
+            await asyncio.sleep(left - self.refresh_margin)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.keep_fresh())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.session.close()
+
+    # ---- запросы ----
+    def call(self, method: str, fn, *args, **kwargs):
+        """Вызов метода gspread (в потоке) не больше чем в max_concurrency параллельно."""
+        t0 = time.perf_counter()
+        with self._slots:
+            SLOT_WAIT.observe(time.perf_counter() - t0, method=method)
+            with self._count_lock:
+                self._in_flight += 1
+            try:
+                return sheets_call(method, fn, *args, **kwargs)
+            finally:
+                with self._count_lock:
+                    self._in_flight -= 1
+
+    def status(self) -> dict:
+        left = self.seconds_left()
+        return {
+            "token_expires_in": round(left) if left is not None else None,
+            "token_refreshed_at": (datetime.fromtimestamp(self.refreshed_at, timezone.utc).isoformat()
+                                   if self.refreshed_at else None),
+            "in_flight": self._in_flight,
+            "last_refresh_error": self.last_refresh_error,
+        }
@@ -0,0 +1,296 @@
+import heapq
+import bisect
+import asyncio
+
+from sortedcontainers import SortedList
+
+
+class SortedIndex:
+    """
+    Все пользователи, упорядоченные по ключу (например, created_at), для
+    постраничного просмотра курсором: страница — срез отсортированного списка
+    от позиции пользователя-курсора, поэтому листание не зависит от того,
+    сколько пользователей добавилось впереди. SortedList: offer() и поиск курсора —
+    O(log n), страница — O(log n + limit).
+    """
+
+    def __init__(self, key):
+        self.key = key          # u -> ключ сортировки
+        self._items = SortedList()  # [(ключ, uid)] по возрастанию
+        self._keys = {}         # uid -> ключ
+
+    def _drop(self, uid):
+        self._items.remove((self._keys.pop(uid), uid))
+
+    def offer(self, uid: str, u: dict):
+        old = self._keys.get(uid)
+        if u is None:
+            if old is not None:
+                self._drop(uid)
+            return
+        key = self.key(u)
+        if old is not None:
+            if key == old:
+                return
+            self._drop(uid)
+        self._items.add((key, uid))
+        self._keys[uid] = key
+
+    def rebuild(self, data: dict):
+        self._keys = {uid: self.key(u) for uid, u in data.items()}
+        self._items = SortedList((key, uid) for uid, key in self._keys.items())
+
+    def __len__(self):
+        return len(self._items)
+
+    def _pos(self, uid):
+        key = self._keys.get(uid)
+        return None if key is None else self._items.bisect_left((key, uid))
+
+    def page(self, after: str = None, before: str = None, limit: int = 10):
+        """
+        Страница по убыванию ключа: ([uid], есть ли страница выше, есть ли ниже).
+        after=uid — следующие за ним (меньше ключ), before=uid — предыдущие (больше ключ),
+        без курсора (или если курсора уже нет) — с самого верха.
+        """
+        n = len(self._items)
+        pos = self._pos(before if before is not None else after)
+        if before is not None and pos is not None:
+            start = pos + 1
+            end = min(n, start + limit)
+        else:
+            end = pos if after is not None and pos is not None else n
+            start = max(0, end - limit)
+        uids = [uid for _, uid in self._items.islice(start, end, reverse=True)]
+        return uids, end < n, start > 0
+
+
+def _norm(text) -> str:
+    return str(text or "").lower().replace("ё", "е")
+
+
+def _trigrams(token: str):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class NameIndex:
+    """
+    Поиск пользователей по ФИО: отсортированный список слов ФИО (для
+    поиска по началу слова через bisect) и триграммы слов (для поиска
+    подстроки). Обновляется при каждой записи пользователя — только если
+    поменялось ФИО, поэтому /find не перебирает всю базу.
+    Строится при первом /find (на 50k пользователей — около секунды и
+    десятков МБ), а не при старте: без /find бот за него не платит. Сборка
+    идёт в потоке (ready()), поиск отвечает только по готовому индексу.
+    """
+
+    def __init__(self):
+        self._tokens = []       # [(слово, uid)] по возрастанию
+        self._trigrams = {}     # триграмма -> {uid}
+        self._names = {}        # uid -> нормализованное ФИО
+        self._data = None       # откуда строить при первом поиске
+        self._building = None   # задача сборки, пока она идёт
+        self._pending = None    # uid -> ФИО, изменённые во время сборки
+        self.built = False
+
+    def _remove(self, uid):
+        name = self._names.pop(uid, None)
+        if name is None:
+            return
+        for token in set(name.split()):
+            i = bisect.bisect_left(self._tokens, (token, uid))
+            if i < len(self._tokens) and self._tokens[i] == (token, uid):
+                del self._tokens[i]
+            for tri in _trigrams(token):
+                ids = self._trigrams.get(tri)
+                if ids is not None:
+                    ids.discard(uid)
+                    if not ids:
+                        del self._trigrams[tri]
+
+    def _add(self, uid, name):
+        self._names[uid] = name
+        for token in set(name.split()):
+            bisect.insort(self._tokens, (token, uid))
+            for tri in _trigrams(token):
+                self._trigrams.setdefault(tri, set()).add(uid)
+
+    def update(self, uid: str, u: dict):
+        if not self.built and self._pending is None:
+            return
+        name = _norm(u.get("fio")) if u is not None else ""
+        if not self.built:
+            self._pending[uid] = name
+            return
+        self._apply(uid, name)
+
+    def _apply(self, uid, name):
+        if self._names.get(uid, "") == name:
+            return
+        self._remove(uid)
+        if name:
+            self._add(uid, name)
+
+    def rebuild(self, data: dict):
+        self._data = data
+        self._tokens, self._trigrams, self._names = [], {}, {}
+        self._building = self._pending = None
+        self.built = False
+
+    @staticmethod
+    def _index(items):
+        """Индекс по снимку [(uid, пользователь)] — выполняется в потоке."""
+        tokens, trigrams, names = [], {}, {}
+        for uid, u in items:
+            name = _norm(u.get("fio"))
+            if name:
+                names[uid] = name
+                for token in set(name.split()):
+                    tokens.append((token, uid))
+                    for tri in _trigrams(token):
+                        trigrams.setdefault(tri, set()).add(uid)
+        tokens.sort()
+        return tokens, trigrams, names
+
+    async def _build(self):
+        data = self._data
+        try:
+            # снимок берётся на event loop, дальше словарь может меняться:
+            # такие изменения копятся в _pending и доливаются после сборки
+            built = await asyncio.to_thread(self._index, list(data.items()))
+        except BaseException:
+            self._building = self._pending = None
+            raise
+        if self._data is not data:      # пока строили, был rebuild()
+            return
+        self._tokens, self._trigrams, self._names = built
+        pending, self._pending = self._pending, None
+        self.built = True
+        for uid, name in pending.items():
+            self._apply(uid, name)
+
+    async def ready(self):
+        """Дождаться индекса; первый вызов запускает сборку, остальные ждут её же."""
+        if self.built or self._data is None:
+            return
+        if self._building is None:
+            self._pending = {}
+            self._building = asyncio.ensure_future(self._build())
+        await asyncio.shield(self._building)
+
+    def _prefix_range(self, prefix: str):
+        lo = bisect.bisect_left(self._tokens, (prefix, ""))
+        hi = bisect.bisect_left(self._tokens, (prefix + "\U0010ffff", ""))
+        return lo, hi
+
+    def _by_prefix(self, prefix: str) -> set:
+        lo, hi = self._prefix_range(prefix)
+        return {uid for _, uid in self._tokens[lo:hi]}
+
+    def _by_substring(self, word: str) -> set:
+        sets = sorted((self._trigrams.get(t, set()) for t in _trigrams(word)), key=len)
+        if not sets[0]:
+            return set()
+        return {uid for uid in sets[0] if all(uid in s for s in sets[1:]) and word in self._names[uid]}
+
+    def _estimate(self, word: str) -> int:
+        """Верхняя оценка числа совпадений слова — за O(log n), без сборки множеств."""
+        lo, hi = self._prefix_range(word)
+        n = hi - lo
+        if len(word) >= 3:
+            n += min(len(self._trigrams.get(t, ())) for t in _trigrams(word))
+        return n
+
+    @staticmethod
+    def _matches(name: str, word: str, prefix_only: bool = False) -> bool:
+        if any(token.startswith(word) for token in name.split()):
+            return True
+        return not prefix_only and len(word) >= 3 and word in name
+
+    def search(self, query: str, limit: int = 20):
+        """
+        uid, у которых каждое слово запроса — начало слова ФИО или (от 3 букв)
+        подстрока ФИО. Сначала совпадения по началу слов (в порядке слов ФИО),
+        дальше остальные по алфавиту. Возвращает ([uid] не больше limit, сколько найдено всего).
+        До ready() индекс пуст — ничего не находит.
+        """
+        words = sorted(set(_norm(query).split()), key=self._estimate)
+        if not words:
+            return [], 0
+        # самое редкое слово даёт кандидатов, остальные слова проверяются по ним
+        first = words[0]
+        found = self._by_prefix(first)
+        if len(first) >= 3:
+            found |= self._by_substring(first)
+        for w in words[1:]:
+            if not found:
+                break
+            found = {uid for uid in found if self._matches(self._names[uid], w)}
+        if not found:
+            return [], 0
+
+        ranked, seen = [], set()
+        lo, hi = self._prefix_range(first)
+        for _, uid in self._tokens[lo:hi]:
+            if len(ranked) >= limit:
+                break
+            if uid in found and uid not in seen and all(
+                    self._matches(self._names[uid], w, prefix_only=True) for w in words[1:]):
+                ranked.append(uid)
+                seen.add(uid)
+        if len(ranked) < limit:
+            rest = (uid for uid in found if uid not in seen)
+            ranked += heapq.nsmallest(limit - len(ranked), rest, key=lambda uid: (self._names[uid], uid))
+        return ranked, len(found)
+
+
+def _progress_counts(u: dict):
+    prog = (u.get("progress") or {}).values()
+    return (
+        sum(1 for v in prog if v.get("read")),
+        sum(1 for v in prog if v.get("task_done")),
+        sum(1 for v in prog if v.get("test_done")),
+    )
+
+
+def _activity_key(u: dict):
+    return u.get("last_guide_sent_at") or u.get("created_at") or ""
+
+
+class UserStats:
+    """
+    Агрегаты для /admin, /tests, /find и отчётов, которые обновляются при каждом
+    изменении пользователя, а не пересчитываются по всей базе:
+    счётчики прочитано/заданий/тестов (по пользователю и суммарно),
+    порядок по регистрации и по активности (для листания) и поиск по ФИО.
+    """
+
+    def __init__(self):
+        self.progress = {}              # uid -> (прочитано, заданий, тестов)
+        self.totals = [0, 0, 0]
+        self.registrations = SortedIndex(lambda u: u.get("created_at") or "")
+        self.active = SortedIndex(_activity_key)
+        self.names = NameIndex()
+
+    def update(self, uid: str, u: dict):
+        old = self.progress.pop(uid, (0, 0, 0))
+        new = _progress_counts(u) if u is not None else (0, 0, 0)
+        if u is not None:
+            self.progress[uid] = new
+        for i in range(3):
+            self.totals[i] += new[i] - old[i]
+        self.registrations.offer(uid, u)
+        self.active.offer(uid, u)
+        self.names.update(uid, u)
+
+    def rebuild(self, data: dict):
+        self.progress = {}
+        self.totals = [0, 0, 0]
+        for uid, u in data.items():
+            c = _progress_counts(u)
+            self.progress[uid] = c
+            for i in range(3):
+                self.totals[i] += c[i]
+        self.registrations.rebuild(data)
+        self.active.rebuild(data)
+        self.names.rebuild(data)
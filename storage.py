@@ -0,0 +1,639 @@
+import os
+import re
+import json
+import sqlite3
+import asyncio
+import time
+import threading
+
+from stats import UserStats
+from metrics import REGISTRY
+
+# Окно, за которое копятся изменения пользователей перед записью на диск (сек)
+FLUSH_WINDOW = float(os.getenv("USERS_FLUSH_WINDOW", "2.0"))
+# journal — снапшот + журнал изменений, json — один файл users.json, sqlite — строка на пользователя (WAL)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "journal").strip().lower()
+# после стольких байт журнала он замораживается и сворачивается в новый снапшот
+JOURNAL_COMPACT_BYTES = int(os.getenv("JOURNAL_COMPACT_BYTES", str(8 * 1024 * 1024)))
+JOURNAL_FSYNC = os.getenv("JOURNAL_FSYNC", "1") == "1"
+
+# Колонки таблицы users (кроме tg_id); всё остальное из словаря пользователя — в extra
+USER_COLUMNS = (
+    "fio", "role", "subject", "guide_index", "last_guide_sent_at",
+    "created_at", "finished_at", "status",
+    "awaiting_fio", "awaiting_subject", "awaiting_code",
+)
+BOOL_COLUMNS = ("awaiting_fio", "awaiting_subject", "awaiting_code")
+PROGRESS_FLAGS = ("read", "task_done", "test_done")
+
+
+def _write_text(path: str, text: str, fsync: bool = False):
+    """Атомарная замена файла; fsync=True — ещё и переживает сбой питания (файл и запись в каталоге)."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+    if fsync:
+        _fsync_dir(os.path.dirname(path) or ".")
+
+
+def _fsync_dir(path: str):
+    if not hasattr(os, "O_DIRECTORY"):
+        return  # Windows: каталоги так не синхронизируются
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# ============== БЭКЕНДЫ ==============
+class JsonBackend:
+    """Все пользователи в одном users.json, каждая запись — полная перезапись файла."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            return {}
+
+    def snapshot(self, data: dict, dirty: set):
+        return json.dumps(data, ensure_ascii=False)
+
+    def write(self, payload) -> int:
+        _write_text(self.path, payload)
+        return len(payload.encode("utf-8"))
+
+    def close(self):
+        pass
+
+
+class SqliteBackend:
+    """
+    SQLite (WAL): строка на пользователя в users, прогресс по гайдам — в progress.
+    Запись затрагивает только изменённых пользователей.
+    При первом старте переносит данные из старого users.json.
+    Каждая запись получает общий возрастающий seq — по нему другие экземпляры
+    бота с тем же users.db подтягивают изменения (changes / fetch).
+    """
+
+    def __init__(self, path: str, legacy_json: str = None):
+        self.path = path
+        self.seq = 0      # последний seq, который видел этот процесс
+        self.seen = {}    # uid -> seq версии, которая сейчас в памяти
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                tg_id TEXT PRIMARY KEY,
+                fio TEXT, role TEXT, subject TEXT,
+                guide_index INTEGER,
+                last_guide_sent_at TEXT, created_at TEXT, finished_at TEXT, status TEXT,
+                awaiting_fio INTEGER, awaiting_subject INTEGER, awaiting_code INTEGER,
+                extra TEXT
+            );
+            CREATE TABLE IF NOT EXISTS progress (
+                tg_id TEXT NOT NULL,
+                guide_id TEXT NOT NULL,
+                read INTEGER, task_done INTEGER, test_done INTEGER,
+                PRIMARY KEY (tg_id, guide_id)
+            );
+        """)
+        cols = {row[1] for row in self.conn.execute("PRAGMA table_info(users)")}
+        if "seq" not in cols:
+            self.conn.execute("ALTER TABLE users ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS users_seq ON users(seq)")
+        if legacy_json:
+            self._migrate(legacy_json)
+
+    def _migrate(self, legacy_json: str):
+        if not os.path.exists(legacy_json):
+            return
+        if self.conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+            return
+        data = JsonBackend(legacy_json).load()
+        if data:
+            self.write(self.snapshot(data, set(data)))
+            print(f"📦 users.json перенесён в SQLite: {len(data)} пользователей")
+        os.replace(legacy_json, legacy_json + ".migrated")
+
+    # --- чтение ---
+    def _select(self, where: str = "", params=()):
+        """Пользователи по условию на users: ({uid: dict}, {uid: seq})."""
+        data, seqs = {}, {}
+        cur = self.conn.execute(f"SELECT tg_id, seq, {', '.join(USER_COLUMNS)}, extra FROM users {where}", params)
+        for row in cur:
+            uid, seq, values, extra = row[0], row[1], row[2:-1], row[-1]
+            u = json.loads(extra) if extra else {}
+            for name, v in zip(USER_COLUMNS, values):
+                u[name] = bool(v) if name in BOOL_COLUMNS and v is not None else v
+            u["progress"] = {}
+            data[uid] = u
+            seqs[uid] = seq
+        if not data:
+            return data, seqs
+        progress_where = f"WHERE tg_id IN (SELECT tg_id FROM users {where})" if where else ""
+        for uid, guide_id, *flags in self.conn.execute(
+            f"SELECT tg_id, guide_id, {', '.join(PROGRESS_FLAGS)} FROM progress {progress_where}", params
+        ):
+            if uid in data:
+                data[uid]["progress"][guide_id] = {
+                    k: bool(v) for k, v in zip(PROGRESS_FLAGS, flags) if v is not None
+                }
+        return data, seqs
+
+    def load(self) -> dict:
+        data, self.seen = self._select()
+        self.seq = max(self.seen.values(), default=0)
+        return data
+
+    def changes(self):
+        """Записи других процессов после self.seq: [(uid, dict, seq)], свои пропускаются."""
+        data, seqs = self._select("WHERE seq > ?", (self.seq,))
+        self.seq = max(seqs.values(), default=self.seq)
+        return [(uid, u, seqs[uid]) for uid, u in data.items() if seqs[uid] > self.seen.get(uid, 0)]
+
+    def fetch(self, uid: str):
+        """(dict, seq), если в базе версия пользователя новее той, что в памяти, иначе None."""
+        data, seqs = self._select("WHERE tg_id = ? AND seq > ?", (uid, self.seen.get(uid, 0)))
+        return (data[uid], seqs[uid]) if uid in data else None
+
+    # --- запись ---
+    def snapshot(self, data: dict, dirty: set):
+        """Снимает значения изменённых пользователей (вызывается в event loop)."""
+        rows = []
+        for uid in dirty:
+            u = data.get(uid)
+            if u is None:
+                rows.append((uid, None, None, None))
+                continue
+            values = tuple(
+                int(u[name]) if name in BOOL_COLUMNS and u.get(name) is not None else u.get(name)
+                for name in USER_COLUMNS
+            )
+            extra = {k: v for k, v in u.items() if k not in USER_COLUMNS and k != "progress"}
+            progress = [
+                (uid, gid, *(int(p[k]) if k in p else None for k in PROGRESS_FLAGS))
+                for gid, p in (u.get("progress") or {}).items()
+            ]
+            rows.append((uid, values, json.dumps(extra, ensure_ascii=False) if extra else None, progress))
+        return rows
+
+    def write(self, payload) -> int:
+        cols = ", ".join(USER_COLUMNS)
+        marks = ", ".join("?" for _ in USER_COLUMNS)
+        updates = ", ".join(f"{c}=excluded.{c}" for c in USER_COLUMNS)
+        cur = self.conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")  # seq раздаётся под замком записи — без гонок между процессами
+        try:
+            seq = cur.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM users").fetchone()[0]
+            for uid, values, extra, progress in payload:
+                cur.execute("DELETE FROM progress WHERE tg_id=?", (uid,))
+                if values is None:
+                    cur.execute("DELETE FROM users WHERE tg_id=?", (uid,))
+                    continue
+                cur.execute(
+                    f"INSERT INTO users (tg_id, {cols}, extra, seq) VALUES (?, {marks}, ?, ?) "
+                    f"ON CONFLICT(tg_id) DO UPDATE SET {updates}, extra=excluded.extra, seq=excluded.seq",
+                    (uid, *values, extra, seq),
+                )
+                cur.executemany("INSERT INTO progress VALUES (?, ?, ?, ?, ?)", progress)
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        for uid, *_ in payload:
+            self.seen[uid] = seq
+        return 0
+
+    def close(self):
+        self.conn.close()
+
+
+class JournalBackend:
+    """
+    Снапшот + журнал: users.snapshot.<gen>.json хранит всех пользователей на момент
+    поколения gen, users.journal.<gen>.jsonl — полные записи изменённых
+    пользователей после него ({"u": uid, "d": {...} | null}).
+    Запись — дозапись строк только по изменённым пользователям.
+    Когда журнал вырастает до JOURNAL_COMPACT_BYTES, он замораживается, запись
+    идёт в журнал следующего поколения, а в отдельном потоке старый снапшот и
+    замороженные журналы сворачиваются в новый снапшот. Старт = снапшот + хвост журнала,
+    поэтому время запуска зависит от числа пользователей, а не от длины истории.
+    Предыдущий снапшот и журналы после него удаляются только при следующем
+    сворачивании: если новый снапшот окажется битым, старт идёт от предыдущего.
+    Если всех пользователей восстановить нельзя, load() падает, а не стартует с неполной базой.
+    """
+
+    SNAPSHOT_RE = re.compile(r"^users\.snapshot\.(\d+)\.json$")
+    JOURNAL_RE = re.compile(r"^users\.journal\.(\d+)\.jsonl$")
+
+    def __init__(self, data_dir: str, legacy_json: str = None, compact_bytes: int = JOURNAL_COMPACT_BYTES,
+                 fsync: bool = JOURNAL_FSYNC):
+        self.dir = data_dir
+        self.compact_bytes = compact_bytes
+        self.fsync = fsync
+        self.gen = 0
+        self._file = None
+        self._size = 0
+        self._compacting = threading.Lock()
+        self._compactor = None
+        self.compactions = 0
+        if legacy_json and os.path.exists(legacy_json) and not self._snapshots() and not self._journals():
+            data = JsonBackend(legacy_json).load()
+            self._write_snapshot(0, data)
+            os.replace(legacy_json, legacy_json + ".migrated")
+            print(f"📦 users.json перенесён в снапшот: {len(data)} пользователей")
+
+    def _snapshot_path(self, gen: int) -> str:
+        return os.path.join(self.dir, f"users.snapshot.{gen}.json")
+
+    def _journal_path(self, gen: int) -> str:
+        return os.path.join(self.dir, f"users.journal.{gen}.jsonl")
+
+    def _list(self, pattern):
+        """[(gen, путь)] по возрастанию поколения."""
+        found = []
+        for name in os.listdir(self.dir):
+            m = pattern.match(name)
+            if m:
+                found.append((int(m.group(1)), os.path.join(self.dir, name)))
+        return sorted(found)
+
+    def _snapshots(self):
+        return self._list(self.SNAPSHOT_RE)
+
+    def _journals(self):
+        return self._list(self.JOURNAL_RE)
+
+    def _read_snapshot(self):
+        """(gen, users) из самого нового читаемого снапшота; (0, {}), если снапшотов нет."""
+        snapshots = self._snapshots()
+        for gen, path in reversed(snapshots):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    snap = json.load(f)
+                return snap["gen"], snap["users"]
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"⚠️ Снапшот {os.path.basename(path)} повреждён ({e}), берём предыдущий")
+        if snapshots:
+            raise RuntimeError(f"все снапшоты пользователей в {self.dir} повреждены, восстановить базу нельзя")
+        return 0, {}
+
+    def _write_snapshot(self, gen: int, users: dict):
+        payload = json.dumps({"gen": gen, "users": users}, ensure_ascii=False)
+        # журналы удаляются после записи, поэтому снапшот должен лечь на диск до этого
+        _write_text(self._snapshot_path(gen), payload, fsync=True)
+
+    @staticmethod
+    def _replay(path: str, users: dict) -> int:
+        """Применяет журнал к users. Оборванную при сбое последнюю строку пропускает."""
+        size = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                size += len(line.encode("utf-8"))
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if rec.get("d") is None:
+                    users.pop(rec["u"], None)
+                else:
+                    users[rec["u"]] = rec["d"]
+        return size
+
+    def load(self) -> dict:
+        gen, users = self._read_snapshot()
+        journals = [(g, p) for g, p in self._journals() if g >= gen]
+        # журналы должны идти без пропусков от поколения снапшота, иначе часть изменений потеряна
+        for i, (g, _) in enumerate(journals):
+            if g != gen + i:
+                raise RuntimeError(f"нет журнала поколения {gen + i} (снапшот поколения {gen}), "
+                                   f"восстановить базу нельзя")
+        self.gen = gen
+        tail = 0
+        for jgen, path in journals:
+            tail = self._replay(path, users)
+            self.gen = jgen
+        self._open(self.gen)
+        self._size = tail
+        if self._size >= self.compact_bytes:
+            self._rotate()
+        return users
+
+    def _open(self, gen: int):
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self._journal_path(gen), "a", encoding="utf-8")
+        self._size = 0
+
+    # --- запись ---
+    def snapshot(self, data: dict, dirty: set):
+        lines = []
+        for uid in dirty:
+            lines.append(json.dumps({"u": uid, "d": data.get(uid)}, ensure_ascii=False) + "\n")
+        return "".join(lines)
+
+    def write(self, payload) -> int:
+        if self._file is None:
+            self._open(self.gen)
+        self._file.write(payload)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        written = len(payload.encode("utf-8"))
+        self._size += written
+        if self._size >= self.compact_bytes:
+            self._rotate()
+        return written
+
+    def _rotate(self):
+        """Замораживает текущий журнал и запускает сворачивание в фоне."""
+        if not self._compacting.acquire(blocking=False):
+            return  # предыдущее сворачивание ещё идёт — журнал подрастёт, свернём следующим
+        self.gen += 1
+        self._open(self.gen)
+        self._compactor = threading.Thread(target=self._compact, args=(self.gen,), daemon=True)
+        self._compactor.start()
+
+    def _compact(self, upto_gen: int):
+        try:
+            gen, users = self._read_snapshot()
+            frozen = [(g, p) for g, p in self._journals() if gen <= g < upto_gen]
+            for _, path in frozen:
+                self._replay(path, users)
+            self._write_snapshot(upto_gen, users)
+            # снапшот gen и журналы после него остаются — запасной путь, если новый окажется битым
+            for g, path in self._snapshots():
+                if g not in (gen, upto_gen):
+                    os.remove(path)
+            for g, path in self._journals():
+                if g < gen:
+                    os.remove(path)
+            self.compactions += 1
+        except Exception as e:
+            print("⚠️ Ошибка сворачивания журнала:", e)
+        finally:
+            self._compacting.release()
+
+    def close(self):
+        if self._compactor is not None:
+            self._compactor.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def make_backend(data_dir: str):
+    if STORAGE_BACKEND == "journal":
+        return JournalBackend(data_dir, legacy_json=os.path.join(data_dir, "users.json"))
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteBackend(
+            os.path.join(data_dir, "users.db"),
+            legacy_json=os.path.join(data_dir, "users.json"),
+        )
+    return JsonBackend(os.path.join(data_dir, "users.json"))
+
+
+# ============== ИНДЕКСЫ ==============
+INDEXED_FIELDS = ("role", "status", "subject", "guide_index")
+
+
+def _sent_date(u: dict) -> str:
+    """Дата последней выдачи гайда (YYYY-MM-DD по МСК из ISO-строки) или ''."""
+    return (u.get("last_guide_sent_at") or "")[:10]
+
+
+class UserIndex:
+    """
+    Вторичные индексы по пользователям: поле → значение → множество uid.
+    Обновляются при каждом mark_dirty, поэтому выборки вроде «новички,
+    которым сегодня ещё не выдан гайд» не перебирают всех пользователей.
+    """
+
+    def __init__(self, fields=INDEXED_FIELDS):
+        self.fields = fields
+        self.by = {f: {} for f in fields}
+        self.by_sent_date = {}
+        self._keys = {}  # uid -> значения полей, под которыми он сейчас лежит в индексах
+
+    def _add(self, bucket: dict, value, uid):
+        bucket.setdefault(value, set()).add(uid)
+
+    def _remove(self, bucket: dict, value, uid):
+        ids = bucket.get(value)
+        if ids is not None:
+            ids.discard(uid)
+            if not ids:
+                del bucket[value]
+
+    def update(self, uid: str, u: dict):
+        old = self._keys.pop(uid, None)
+        new = None if u is None else tuple(u.get(f) for f in self.fields) + (_sent_date(u),)
+        if old == new:
+            if new is not None:
+                self._keys[uid] = new
+            return
+        if old is not None:
+            for f, v in zip(self.fields, old):
+                self._remove(self.by[f], v, uid)
+            self._remove(self.by_sent_date, old[-1], uid)
+        if new is not None:
+            for f, v in zip(self.fields, new):
+                self._add(self.by[f], v, uid)
+            self._add(self.by_sent_date, new[-1], uid)
+            self._keys[uid] = new
+
+    def rebuild(self, data: dict):
+        self.by = {f: {} for f in self.fields}
+        self.by_sent_date = {}
+        self._keys = {}
+        for uid, u in data.items():
+            self.update(uid, u)
+
+    def count(self, field: str, value) -> int:
+        return len(self.by[field].get(value, ()))
+
+    def values(self, field: str) -> dict:
+        """Значение поля → число пользователей."""
+        return {v: len(ids) for v, ids in self.by[field].items()}
+
+    def query(self, not_sent_on: str = None, **criteria) -> set:
+        """
+        uid, у которых каждое поле из criteria равно значению (или входит в набор значений).
+        not_sent_on="YYYY-MM-DD" — исключить тех, кому в этот день уже выдан гайд.
+        """
+        sets = []
+        for field, value in criteria.items():
+            bucket = self.by[field]
+            if isinstance(value, (list, tuple, set, frozenset, range)):
+                sets.append(set().union(*(bucket.get(v, ()) for v in value)))
+            else:
+                sets.append(bucket.get(value, set()))
+        if not sets:
+            result = set(self._keys)
+        else:
+            sets.sort(key=len)
+            result = {uid for uid in sets[0] if all(uid in other for other in sets[1:])}
+        if not_sent_on is not None:
+            sent = self.by_sent_date.get(not_sent_on, ())
+            result = {uid for uid in result if uid not in sent}
+        return result
+
+
+# ============== ОТЛОЖЕННАЯ ЗАПИСЬ ==============
+FLUSH_SECONDS = REGISTRY.histogram(
+    "kurator_store_flush_seconds", "Длительность записи пользователей на диск", ("backend",))
+FLUSH_BYTES = REGISTRY.histogram(
+    "kurator_store_flush_bytes", "Байт, записанных за один сброс", ("backend",),
+    buckets=(1e3, 1e4, 1e5, 1e6, 1e7, 1e8))
+FLUSH_USERS = REGISTRY.histogram(
+    "kurator_store_flush_users", "Изменённых пользователей в одном сбросе", ("backend",),
+    buckets=(1, 5, 10, 50, 100, 500, 1000, 5000))
+FLUSH_ERRORS = REGISTRY.counter(
+    "kurator_store_flush_errors_total", "Неудачные записи пользователей", ("backend",))
+
+class WriteBehindStore:
+    """
+    Хранилище пользователей с отложенной записью.
+    Хендлеры только помечают пользователя изменённым (mark_dirty),
+    фоновая задача раз в window секунд сбрасывает все изменения одной записью.
+    """
+
+    def __init__(self, backend, data: dict, window: float = FLUSH_WINDOW):
+        self.backend = backend
+        self.data = data
+        self.window = window
+        self.index = UserIndex()
+        self.index.rebuild(data)
+        self.stats = UserStats()
+        self.stats.rebuild(data)
+        self._dirty = set()
+        self._wake = asyncio.Event()
+        self._task = None
+        self._io_lock = threading.Lock()  # фоновая и финальная запись не пересекаются
+        # счётчики для отладки / бенчмарков
+        self.marks = 0
+        self.flushes = 0
+        self.bytes_written = 0
+
+    def mark_dirty(self, uid):
+        uid = str(uid)
+        u = self.data.get(uid)
+        self.index.update(uid, u)
+        self.stats.update(uid, u)
+        self._dirty.add(uid)
+        self.marks += 1
+        self._wake.set()
+
+    def _write(self, payload):
+        backend = type(self.backend).__name__
+        with self._io_lock:
+            t0 = time.perf_counter()
+            try:
+                written = self.backend.write(payload)
+            except Exception:
+                FLUSH_ERRORS.inc(backend=backend)
+                raise
+            FLUSH_SECONDS.observe(time.perf_counter() - t0, backend=backend)
+            FLUSH_BYTES.observe(written, backend=backend)
+            return written
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def _take_payload(self):
+        """Забирает грязный набор и снимает данные (в потоке event loop, без await)."""
+        if not self._dirty:
+            return None, None
+        dirty, self._dirty = self._dirty, set()
+        FLUSH_USERS.observe(len(dirty), backend=type(self.backend).__name__)
+        return dirty, self.backend.snapshot(self.data, dirty)
+
+    def flush(self):
+        """Синхронный сброс — для завершения работы и скриптов."""
+        dirty, payload = self._take_payload()
+        if payload is None:
+            return
+        try:
+            written = self._write(payload)
+        except Exception:
+            self._dirty |= dirty
+            raise
+        self.flushes += 1
+        self.bytes_written += written
+
+    async def flush_async(self):
+        dirty, payload = self._take_payload()
+        if payload is None:
+            return
+        try:
+            written = await asyncio.to_thread(self._write, payload)
+        except Exception as e:
+            # не теряем изменения — попробуем в следующем окне
+            self._dirty |= dirty
+            print("⚠️ Ошибка записи пользователей:", e)
+            return
+        self.flushes += 1
+        self.bytes_written += written
+
+    # --- общие данные нескольких экземпляров (только SqliteBackend) ---
+    def apply_remote(self, uid: str, u: dict, seq: int) -> bool:
+        """
+        Подставляет версию пользователя, записанную другим экземпляром.
+        Несохранённые локальные изменения важнее — тогда ничего не делает.
+        """
+        if uid in self._dirty:
+            return False
+        if u is None:
+            self.data.pop(uid, None)
+        else:
+            self.data[uid] = u
+        self.index.update(uid, u)
+        self.stats.update(uid, u)
+        self.backend.seen[uid] = seq
+        return True
+
+    def changes(self):
+        """Новые записи других экземпляров (блокирующий, вызывать в потоке)."""
+        with self._io_lock:
+            return self.backend.changes()
+
+    def fetch(self, uid: str):
+        """Свежая версия одного пользователя из общей базы или None (в потоке)."""
+        with self._io_lock:
+            return self.backend.fetch(uid)
+
+    async def run(self):
+        while True:
+            await self._wake.wait()
+            await asyncio.sleep(self.window)  # копим изменения за окно
+            self._wake.clear()
+            await self.flush_async()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def close(self):
+        """Останавливает фоновую задачу и гарантированно дописывает всё на диск."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.flush()
+        self.backend.close()
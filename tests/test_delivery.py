@@ -0,0 +1,44 @@
+"""Окна доставки рассылок."""
+from datetime import datetime, timedelta, timezone
+
+from delivery import DeliveryPlanner, nominal
+
+MSK = timezone(timedelta(hours=3))
+BASE = datetime(2026, 1, 15, 8, tzinfo=MSK)
+
+
+def test_tz_offset_is_clamped():
+    planner = DeliveryPlanner(tz=True, max_ahead=7, max_behind=3)
+    assert planner.tz_offset({"tz_offset": 4}) == 4
+    assert planner.tz_offset({"tz_offset": 9}) == 7
+    assert planner.tz_offset({"tz_offset": -5}) == -3
+    assert planner.tz_offset({"tz_offset": "abc"}) == 0
+    assert DeliveryPlanner(tz=False).tz_offset({"tz_offset": 4}) == 0
+
+
+def test_plan_stays_within_window_and_catchup():
+    planner = DeliveryPlanner(window=30, catchup=20, cohorts={}, tz=True, max_ahead=7, max_behind=3)
+    users = {str(i): {"tz_offset": i % 12 - 4} for i in range(500)}
+    fire = BASE - timedelta(hours=7)
+    at = planner.plan(users, list(users), BASE, fire, "guide")
+    for uid, moment in at.items():
+        start = BASE - timedelta(hours=planner.tz_offset(users[uid]))
+        assert start <= moment < start + timedelta(minutes=30)
+    assert at == planner.plan(users, list(users), BASE, fire, "guide")   # слоты постоянные
+
+    late = BASE + timedelta(minutes=10)          # рестарт посреди окна
+    at = planner.plan({uid: {} for uid in users}, list(users), BASE, late, "guide")
+    assert all(late <= moment < BASE + timedelta(minutes=30) for moment in at.values())
+    assert any(moment < late + timedelta(minutes=20) for moment in at.values())
+
+
+def test_cohort_shift_and_window():
+    planner = DeliveryPlanner(window=30, cohorts={"физика": {"shift": 60, "window": 10}})
+    users = {str(i): {"subject": "физика"} for i in range(100)}
+    at = planner.plan(users, list(users), BASE, BASE, "reminder")
+    assert all(BASE + timedelta(minutes=60) <= m < BASE + timedelta(minutes=70) for m in at.values())
+
+
+def test_nominal_with_lead():
+    assert nominal(BASE - timedelta(hours=7), 8, lead_hours=7) == BASE
+    assert nominal(BASE - timedelta(hours=7, minutes=1), 8, lead_hours=7) == BASE - timedelta(days=1)
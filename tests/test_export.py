@@ -0,0 +1,18 @@
+"""Выгрузка CSV: пользовательский ввод не становится формулой."""
+from export import _cell, row
+
+
+def test_cell_escapes_formulas():
+    for value in ("=HYPERLINK(\"x\")", "+79991234567", "-1+1", "@SUM(A1)"):
+        assert _cell(value) == "'" + value
+    assert _cell("Иванов Пётр") == "Иванов Пётр"
+    assert _cell(None) == ""
+    assert _cell(True) == "1"
+    assert _cell(3) == "3"
+
+
+def test_row_escapes_user_fields():
+    values = row("42", {"fio": "=1+1", "progress": {"g1": {"read": True}}}, ["g1"])
+    assert values[0] == "42"
+    assert "'=1+1" in values
+    assert values[-3:] == [1, 0, 0]
@@ -0,0 +1,76 @@
+"""Замки пользователей: локальные (KeyedLocks) и общие для кластера (LeaseTable)."""
+import time
+import asyncio
+
+from locks import KeyedLocks
+from cluster import LeaseTable
+
+
+def test_keyed_locks_serialize_one_key_and_free_memory():
+    locks = KeyedLocks()
+    inside = {"a": 0, "b": 0}
+    peak = {"a": 0, "b": 0}
+    counter = {"a": 0}
+
+    async def worker(key):
+        async with locks.lock(key):
+            inside[key] += 1
+            peak[key] = max(peak[key], inside[key])
+            if key == "a":
+                value = counter["a"]            # read-modify-write через await
+                await asyncio.sleep(0)
+                counter["a"] = value + 1
+            else:
+                await asyncio.sleep(0.01)
+            inside[key] -= 1
+
+    async def run():
+        await asyncio.gather(*(worker("a") for _ in range(50)), *(worker("b") for _ in range(5)))
+
+    asyncio.run(run())
+    assert peak == {"a": 1, "b": 1}
+    assert counter["a"] == 50
+    assert len(locks) == 0 and "a" not in locks
+
+
+def test_keyed_locks_different_keys_run_in_parallel():
+    locks = KeyedLocks()
+
+    async def hold(key):
+        async with locks.lock(key):
+            await asyncio.sleep(0.05)
+
+    async def run():
+        start = time.perf_counter()
+        await asyncio.gather(*(hold(k) for k in range(20)))
+        return time.perf_counter() - start
+
+    assert asyncio.run(run()) < 0.5
+
+
+def test_lease_acquire_until_expiry(tmp_path):
+    leases = LeaseTable(str(tmp_path / "leases.db"))
+    try:
+        assert leases.acquire("user:1", "a", ttl=0.2)
+        assert leases.acquire("user:1", "a", ttl=0.2)     # своя — продлевается
+        assert not leases.acquire("user:1", "b", ttl=0.2)
+        assert leases.holder("user:1")[0] == "a"
+        time.sleep(0.3)
+        assert leases.acquire("user:1", "b", ttl=0.2)     # истекла — забирает другой
+        assert leases.holder("user:1")[0] == "b"
+        assert not leases.acquire("user:1", "a", ttl=0.2)
+    finally:
+        leases.close()
+
+
+def test_lease_release_only_by_holder(tmp_path):
+    leases = LeaseTable(str(tmp_path / "leases.db"))
+    try:
+        assert leases.acquire("user:2", "a", ttl=30)
+        leases.release("user:2", "b")
+        assert leases.holder("user:2")[0] == "a"
+        leases.release("user:2", "a")
+        assert leases.holder("user:2") is None
+        assert leases.acquire("user:2", "b", ttl=30)
+    finally:
+        leases.close()
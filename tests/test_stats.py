@@ -0,0 +1,73 @@
+"""Индексы для списков админа и /find."""
+import asyncio
+
+from stats import SortedIndex, NameIndex
+
+
+def _index(n=25):
+    users = {f"u{i:02d}": {"created_at": f"2026-01-{i + 1:02d}"} for i in range(n)}
+    index = SortedIndex(lambda u: u["created_at"])
+    index.rebuild(users)
+    return users, index
+
+
+def test_sorted_index_pages_by_cursor():
+    _, index = _index()
+    top, newer, older = index.page(limit=10)
+    assert top == [f"u{i:02d}" for i in range(24, 14, -1)]
+    assert (newer, older) == (False, True)
+
+    second, newer, older = index.page(after=top[-1], limit=10)
+    assert second == [f"u{i:02d}" for i in range(14, 4, -1)]
+    assert (newer, older) == (True, True)
+
+    last, newer, older = index.page(after=second[-1], limit=10)
+    assert last == [f"u{i:02d}" for i in range(4, -1, -1)]
+    assert (newer, older) == (True, False)
+
+    back, _, _ = index.page(before=last[0], limit=10)
+    assert back == second
+
+
+def test_sorted_index_cursor_survives_inserts_and_moves():
+    users, index = _index()
+    top, _, _ = index.page(limit=10)
+    for uid in ("n1", "n2"):                     # новые регистрации выше курсора
+        users[uid] = {"created_at": "2026-02-01"}
+        index.offer(uid, users[uid])
+    second, _, _ = index.page(after=top[-1], limit=10)
+    assert second == [f"u{i:02d}" for i in range(14, 4, -1)]
+
+    index.offer("u10", None)                     # удалён
+    users["u12"]["created_at"] = "2026-03-01"    # ключ поменялся
+    index.offer("u12", users["u12"])
+    assert len(index) == 26
+    assert index.page(limit=1)[0] == ["u12"]
+    assert index.page(after=top[-1], limit=10)[0] == ["u14", "u13", "u11", "u09", "u08",
+                                                      "u07", "u06", "u05", "u04", "u03"]
+    assert index.page(after="u10", limit=3)[0] == index.page(limit=3)[0]   # курсора нет — сверху
+
+
+def test_name_index_search():
+    users = {
+        "1": {"fio": "Иванов Пётр Сергеевич"},
+        "2": {"fio": "Петрова Анна"},
+        "3": {"fio": "Сидоров Иван"},
+        "4": {"fio": None},
+    }
+    index = NameIndex()
+    index.rebuild(users)
+    assert index.search("иван") == ([], 0)        # до ready() индекса нет
+    asyncio.run(index.ready())
+
+    assert index.search("Иван") == (["3", "1"], 2)   # начало слова ФИО раньше подстроки
+    assert index.search("петр") == (["1", "2"], 2)   # ё = е
+    assert index.search("иван петр") == (["1"], 1)
+    assert index.search("ова") == (["2"], 1)         # подстрока от 3 букв
+    assert index.search("ов") == ([], 0)
+    assert index.search("и", limit=1)[1] == 2
+
+    users["2"] = {"fio": "Иванова Анна"}
+    index.update("2", users["2"])
+    index.update("3", None)
+    assert index.search("иван") == (["1", "2"], 2)
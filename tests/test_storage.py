@@ -0,0 +1,71 @@
+"""Журнал пользователей: восстановление после сбоя."""
+import os
+
+import pytest
+
+from storage import JournalBackend
+
+
+def _write(backend, data, *uids):
+    backend.write(backend.snapshot(data, set(uids)))
+
+
+def test_replay_skips_torn_last_line(tmp_path):
+    backend = JournalBackend(str(tmp_path), compact_bytes=10 ** 9, fsync=False)
+    data = backend.load()
+    data.update({"1": {"fio": "Иванов"}, "2": {"fio": "Петров"}})
+    _write(backend, data, "1", "2")
+    data["1"]["role"] = "newbie"
+    del data["2"]
+    _write(backend, data, "1", "2")
+    backend.close()
+    with open(tmp_path / "users.journal.0.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"u": "3", "d": {"fio": "Сид')      # оборвалось при сбое
+
+    backend = JournalBackend(str(tmp_path), compact_bytes=10 ** 9, fsync=False)
+    assert backend.load() == {"1": {"fio": "Иванов", "role": "newbie"}}
+    backend.close()
+
+
+def _two_compactions(tmp_path):
+    """Данные, после которых на диске снапшоты поколений 1 и 2 и журналы 1 и 2."""
+    backend = JournalBackend(str(tmp_path), compact_bytes=1, fsync=False)
+    data = backend.load()
+    for uid in ("1", "2"):
+        data[uid] = {"fio": f"Пользователь {uid}"}
+        _write(backend, data, uid)
+        backend._compactor.join()
+    backend.close()
+    assert [g for g, _ in backend._snapshots()] == [1, 2]
+    assert [g for g, _ in backend._journals()] == [1, 2]
+    return data
+
+
+def _corrupt(path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"gen": 2, "us')
+
+
+def test_corrupt_snapshot_falls_back_to_previous(tmp_path):
+    data = _two_compactions(tmp_path)
+    _corrupt(tmp_path / "users.snapshot.2.json")
+    backend = JournalBackend(str(tmp_path), compact_bytes=10 ** 9, fsync=False)
+    assert backend.load() == data
+    assert backend.gen == 2
+    backend.close()
+
+
+def test_all_snapshots_corrupt_refuses_to_start(tmp_path):
+    _two_compactions(tmp_path)
+    _corrupt(tmp_path / "users.snapshot.1.json")
+    _corrupt(tmp_path / "users.snapshot.2.json")
+    with pytest.raises(RuntimeError):
+        JournalBackend(str(tmp_path), fsync=False).load()
+
+
+def test_missing_journal_generation_refuses_to_start(tmp_path):
+    _two_compactions(tmp_path)
+    _corrupt(tmp_path / "users.snapshot.2.json")
+    os.remove(tmp_path / "users.journal.1.jsonl")
+    with pytest.raises(RuntimeError):
+        JournalBackend(str(tmp_path), fsync=False).load()